@@ -1,12 +1,14 @@
 import os
-from flask import Flask
+import uuid
+from flask import Flask, g, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from dotenv import load_dotenv
 from .logger import setup_logger
+from .utils.replicas import RoutingSession, init_replicas
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 logger = setup_logger(__name__)
@@ -25,6 +27,7 @@ def create_app(config_object=None):
     print(f"Loaded config: {app.config['SQLALCHEMY_DATABASE_URI']}")
 
     db.init_app(app)
+    init_replicas(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
 
@@ -36,9 +39,75 @@ def create_app(config_object=None):
     def load_user(user_id):
         return User.query.get(int(user_id))
 
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def expose_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
     # Register blueprints
     from .routes.main import main_bp
+    from .routes.admin import admin_bp
     app.register_blueprint(main_bp)
+    app.register_blueprint(admin_bp)
+
+    # Static asset fingerprinting and response compression
+    from .utils.assets import init_assets
+    from .utils.compression import init_compression
+    init_assets(app)
+    init_compression(app)
+
+    from .utils.memory import init_memory
+    from .utils.profiling import init_profiling
+    init_memory(app)
+    init_profiling(app)
+
+    from .services.usage import init_usage
+    init_usage(app)
+
+    # Registered after the request ID hook so shed responses carry it too
+    from .utils.admission import init_admission
+    init_admission(app)
+
+    # Opened before gunicorn forks so workers share the mapped pages
+    from .services.gazetteer import load_gazetteer
+    try:
+        load_gazetteer(app.config.get('GAZETTEER_PATH'))
+    except (OSError, ValueError):
+        logger.exception("Could not open gazetteer, geocoding will use Google only")
+        load_gazetteer(None)
+
+    from .services.roads import load_road_graph
+    try:
+        load_road_graph(app.config.get('ROAD_GRAPH_PATH'))
+    except (OSError, ValueError):
+        logger.exception("Could not open road graph, travel times will use Google only")
+        load_road_graph(None)
+    from .services.transit import load_transit_network
+    try:
+        load_transit_network(app.config.get('TRANSIT_NETWORK_PATH'))
+    except (OSError, ValueError):
+        logger.exception("Could not open transit network, transit times will use Google only")
+        load_transit_network(None)
+
+    from .services.travel import TRAVEL_PROVIDERS
+    for setting in ('TRAVEL_PROVIDER', 'TRANSIT_PROVIDER'):
+        if app.config.get(setting) not in TRAVEL_PROVIDERS:
+            raise ValueError(f"Unknown {setting} '{app.config.get(setting)}'")
+
+    from .utils.password import load_breached_passwords
+    try:
+        load_breached_passwords(app.config.get('PASSWORD_BLOOM_PATH'))
+    except (OSError, ValueError):
+        logger.exception("Could not open breached password filter, the check is disabled")
+        load_breached_passwords(None)
+
+    from .cli import register_commands
+    register_commands(app)
 
     # Error handling
     @app.errorhandler(404)
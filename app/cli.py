@@ -0,0 +1,227 @@
+import click
+
+from .utils.assets import build_assets
+
+
+def register_commands(app):
+    """
+    Registers the application's ``flask`` CLI commands.
+    """
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """Fingerprint and precompress the static files."""
+        manifest = build_assets(app.static_folder)
+        click.echo(f"Built {len(manifest)} assets into {app.static_folder}/dist")
+
+    @app.cli.command("backfill-coordinates")
+    @click.option("--batch-size", default=50, show_default=True, help="Locations per batch.")
+    @click.option("--sleep", "sleep_seconds", default=1.0, show_default=True,
+                  help="Seconds to pause between batches.")
+    @click.option("--restart", is_flag=True, help="Ignore the saved checkpoint.")
+    def backfill_coordinates_command(batch_size, sleep_seconds, restart):
+        """Re-geocode locations stuck at the (0, 0) placeholder."""
+        from .services.address import regeocode_placeholder_coordinates
+
+        counts = regeocode_placeholder_coordinates(
+            batch_size=batch_size,
+            sleep_seconds=sleep_seconds,
+            progress=lambda done, total: click.echo(f"{done}/{total} locations"),
+            restart=restart,
+        )
+        click.echo(f"Processed {counts['processed']}, updated {counts['updated']}, "
+                   f"failed {counts['failed']}")
+
+    @app.cli.command("build-gazetteer")
+    @click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+    @click.argument("output_path", type=click.Path(dir_okay=False))
+    def build_gazetteer_command(csv_path, output_path):
+        """Compile a key,lat,lng[,label] CSV into a gazetteer index."""
+        from .services.gazetteer import build_gazetteer
+
+        count = build_gazetteer(csv_path, output_path)
+        click.echo(f"Wrote {count} entries to {output_path}; set GAZETTEER_PATH to use it")
+
+    @app.cli.command("build-password-filter")
+    @click.argument("source_path", type=click.Path(exists=True, dir_okay=False))
+    @click.argument("output_path", type=click.Path(dir_okay=False))
+    @click.option("--fp-rate", type=float, help="False-positive rate [default: PASSWORD_BLOOM_FP_RATE].")
+    def build_password_filter_command(source_path, output_path, fp_rate):
+        """Compile a password list (plaintext or SHA-1[:count] lines) into a Bloom filter."""
+        from .utils.bloom import build_bloom_filter
+
+        stats = build_bloom_filter(source_path, output_path, fp_rate or app.config["PASSWORD_BLOOM_FP_RATE"])
+        click.echo(f"Wrote {stats['count']} passwords to {output_path} ({stats['size_bytes'] / 2 ** 20:.1f} MB, "
+                   f"{stats['hashes']} hashes, expected false positives {stats['fp_rate']:.2e}); "
+                   f"set PASSWORD_BLOOM_PATH to use it")
+
+    @app.cli.command("bench-password-filter")
+    @click.argument("filter_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--lookups", default=100000, show_default=True, help="Random lookups to time.")
+    @click.option("--members", type=click.Path(exists=True, dir_okay=False),
+                  help="Plaintext list whose entries must all be found.")
+    def bench_password_filter_command(filter_path, lookups, members):
+        """Measure lookup cost, false positives and resident memory of a filter."""
+        from .utils.bloom import benchmark
+
+        known = []
+        if members:
+            with open(members, encoding="utf-8", errors="replace") as f:
+                known = [line.rstrip("\r\n") for line in f if line.strip()]
+        result = benchmark(filter_path, lookups, known)
+        click.echo(f"File: {result['size_bytes'] / 2 ** 20:.1f} MB, {result['hashes']} hashes")
+        click.echo(f"Lookup: {result['lookup_us']:.2f} us, measured false positives {result['measured_fp_rate']:.2e}")
+        click.echo(f"Resident memory added: {result['rss_added_bytes'] / 2 ** 20:.1f} MB")
+        if members:
+            click.echo(f"Known passwords missed: {result['members_missed']} of {len(known)}")
+
+    @app.cli.command("build-road-graph")
+    @click.argument("osm_path", type=click.Path(exists=True, dir_okay=False))
+    @click.argument("output_path", type=click.Path(dir_okay=False))
+    def build_road_graph_command(osm_path, output_path):
+        """Compile an OpenStreetMap extract (.osm[.gz|.bz2], or .pbf with pyosmium) into a road graph."""
+        from .services.roads import build_road_graph
+
+        try:
+            stats = build_road_graph(osm_path, output_path)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        edges = ", ".join(f"{count} {mode}" for mode, count in stats["edges"].items())
+        click.echo(f"Wrote {stats['nodes']} junctions and {edges} edges to {output_path}; "
+                   f"set ROAD_GRAPH_PATH to use it")
+
+    @app.cli.command("bench-road-graph")
+    @click.argument("graph_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--mode", type=click.Choice(["driving", "walking", "bicycling"]), default="driving",
+                  show_default=True)
+    @click.option("--points", default=20, show_default=True, help="Random junctions routed between.")
+    @click.option("--seed", default=0, show_default=True)
+    def bench_road_graph_command(graph_path, mode, points, seed):
+        """Time a many-to-many matrix and single routes on a road graph."""
+        from .services.roads import benchmark
+
+        try:
+            result = benchmark(graph_path, mode, points, seed)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{points}x{points} {mode} matrix: {result['matrix_ms']:.1f} ms "
+                   f"({result['routed']} routed, {result['unreachable']} unreachable)")
+        click.echo(f"Single route: {result['route_ms']:.2f} ms")
+
+    @app.cli.command("build-transit")
+    @click.argument("feed_path", type=click.Path(exists=True, dir_okay=False))
+    @click.argument("output_path", type=click.Path(dir_okay=False))
+    def build_transit_command(feed_path, output_path):
+        """Compile a GTFS feed zip into a transit network."""
+        from .services.transit import build_transit_network
+
+        try:
+            stats = build_transit_network(feed_path, output_path)
+        except (ValueError, KeyError) as e:
+            raise click.ClickException(f"Invalid GTFS feed: {e}")
+        click.echo(f"Wrote {stats['stops']} stops, {stats['patterns']} patterns, {stats['trips']} trips and "
+                   f"{stats['transfers']} transfers to {output_path}; set TRANSIT_NETWORK_PATH to use it")
+
+    @app.cli.command("bench-transit")
+    @click.argument("network_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--queries", default=50, show_default=True, help="One-to-many queries to time.")
+    @click.option("--destinations", default=20, show_default=True, help="Destinations per query.")
+    @click.option("--departure", type=click.DateTime(), help="Departure time [default: next Monday 08:00].")
+    @click.option("--seed", default=0, show_default=True)
+    def bench_transit_command(network_path, queries, destinations, departure, seed):
+        """Time one-to-many RAPTOR queries between random stops of a transit network."""
+        from .services.transit import benchmark
+
+        result = benchmark(network_path, queries, destinations, departure, seed)
+        click.echo(f"Departing {result['departure']:%a %Y-%m-%d %H:%M}: {result['query_ms']:.1f} ms per query "
+                   f"to {destinations} destinations ({result['reached']} reached, "
+                   f"{result['unreachable']} unreachable)")
+
+    @app.cli.command("export-locations")
+    @click.argument("email")
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson", "geojson"]), default="csv",
+                  show_default=True)
+    @click.option("--output", type=click.File("wb"), default="-", help="File to write, '-' for stdout.")
+    @click.option("--after-id", default=0, help="Resume after this location id.")
+    @click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+    def export_locations_command(email, fmt, output, after_id, compress):
+        """Stream a user's locations as CSV, NDJSON or GeoJSON."""
+        from .models import User
+        from .services.export import LOCATION_FIELDS, gzip_chunks, iter_locations, serialize
+
+        user = User.find_by_email(email)
+        if not user:
+            raise click.ClickException(f"No user with email {email}")
+
+        chunks = serialize(iter_locations(user.id, after_id=after_id), fmt, LOCATION_FIELDS)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        for chunk in chunks:
+            output.write(chunk)
+
+    @app.cli.command("replica-status")
+    def replica_status_command():
+        """Measure the lag of each configured read replica."""
+        from .utils.replicas import check_replicas
+
+        replicas = app.extensions.get("db_replicas", {})
+        status = check_replicas(replicas, app.config["REPLICA_MAX_LAG"])
+        if not status:
+            click.echo("No read replicas configured")
+        for key, health in status.items():
+            lag = "unknown" if health["lag"] is None else f"{health['lag']:.1f}s"
+            click.echo(f"{key}: lag {lag}, {'healthy' if health['healthy'] else 'EXCLUDED'}")
+
+    @app.cli.command("warm-cache")
+    @click.option("--source", type=click.Choice(["history", "locations"]), default="history",
+                  show_default=True, help="Recently compared pairs, or all saved locations.")
+    @click.option("--days", default=7, show_default=True, help="History window to read.")
+    @click.option("--limit", default=500, show_default=True, help="Maximum pairs to consider.")
+    @click.option("--budget", type=int, help="Maximum Google requests [default: WARM_CACHE_BUDGET].")
+    @click.option("--workers", type=int, help="Concurrent requests [default: WARM_CACHE_WORKERS].")
+    @click.option("--report-only", is_flag=True, help="Only report the cache coverage.")
+    @click.option("--restart", is_flag=True, help="Start from the first candidate, ignoring saved progress.")
+    def warm_cache_command(source, days, limit, budget, workers, report_only, restart):
+        """Precompute geocodes and travel times for the most common addresses and pairs."""
+        from .services.warmup import warm_cache
+
+        report = warm_cache(
+            source=source,
+            days=days,
+            limit=limit,
+            budget=app.config["WARM_CACHE_BUDGET"] if budget is None else budget,
+            workers=workers or app.config["WARM_CACHE_WORKERS"],
+            report_only=report_only,
+            progress=lambda done, total: click.echo(f"{done}/{total} items"),
+            restart=restart,
+        )
+        click.echo(f"{report['candidates']} candidates, {report['resumed']} done by the last run, "
+                   f"{report['planned']} planned, "
+                   f"{report['warmed']} warmed, {report['failed']} failed, "
+                   f"{report['over_budget']} over budget ({report['requests']}/{report['budget']} requests)")
+        for kind in ("geocode", "travel"):
+            before, after = report["before"][kind], report["after"][kind]
+            total = after["total"] or 1
+            click.echo(f"{kind} coverage: {before['cached']}/{before['total']} -> "
+                       f"{after['cached']}/{after['total']} ({after['cached'] / total:.0%})")
+
+    @app.cli.command("maps-standin")
+    @click.option("--host", default="127.0.0.1", show_default=True)
+    @click.option("--port", default=8765, show_default=True)
+    @click.option("--latency", default=0.0, show_default=True, help="Seconds added to every response.")
+    def maps_standin_command(host, port, latency):
+        """Serve a deterministic local stand-in for the Google Maps APIs."""
+        from werkzeug.serving import run_simple
+
+        from .utils.maps_standin import create_standin_app
+
+        click.echo(f"Set GOOGLE_MAPS_BASE_URL=http://{host}:{port}/maps/api to use it")
+        run_simple(host, port, create_standin_app(latency), threaded=True)
+
+    @app.cli.command("profile-token")
+    @click.option("--mode", type=click.Choice(["sample", "trace"]), default="sample", show_default=True)
+    def profile_token_command(mode):
+        """Print a token that profiles requests sent with an X-Profile header."""
+        from .utils.profiling import make_profile_token
+
+        click.echo(make_profile_token(app.secret_key, mode))
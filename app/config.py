@@ -4,6 +4,81 @@ class DefaultConfig:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key')
     SQLALCHEMY_DATABASE_URI = os.getenv('PROD_DATABASE_URL', 'sqlite:///myapp.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional comma-separated read replica URLs
+    REPLICA_DATABASE_URLS = [url for url in os.getenv('REPLICA_DATABASE_URLS', '').split(',') if url]
+    # Replicas further behind than this (seconds) are skipped until the next check
+    REPLICA_MAX_LAG = 10
+    REPLICA_CHECK_INTERVAL = 30
+    # After writing, a user's reads stay on the primary for this many seconds
+    REPLICA_STICKY_SECONDS = 5
+    # Fingerprinted static files are served with a one year, immutable lifetime
+    STATIC_CACHE_MAX_AGE = 31536000
+    # HTML/JSON responses smaller than this are sent uncompressed
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    # Compiled gazetteer index (see `flask build-gazetteer`) consulted before Google
+    GAZETTEER_PATH = os.getenv('GAZETTEER_PATH')
+    # Bloom filter of breached passwords (see `flask build-password-filter`) rejected at registration
+    PASSWORD_BLOOM_PATH = os.getenv('PASSWORD_BLOOM_PATH')
+    PASSWORD_BLOOM_FP_RATE = float(os.getenv('PASSWORD_BLOOM_FP_RATE', '0.001'))
+    # Offline road graph (see `flask build-road-graph`) and when to route on it instead
+    # of Google: "google" never, "local" always, "auto" when Google fails
+    ROAD_GRAPH_PATH = os.getenv('ROAD_GRAPH_PATH')
+    TRAVEL_PROVIDER = os.getenv('TRAVEL_PROVIDER', 'google')
+    # Offline transit network (see `flask build-transit`) and the same choice for transit
+    TRANSIT_NETWORK_PATH = os.getenv('TRANSIT_NETWORK_PATH')
+    TRANSIT_PROVIDER = os.getenv('TRANSIT_PROVIDER', 'google')
+    # Timezone commute profile departure windows are expressed in
+    COMMUTE_TIMEZONE = os.getenv('COMMUTE_TIMEZONE', 'Europe/London')
+    # Comparisons of the same pair younger than this (seconds) are reused from history
+    COMPARISON_REUSE_SECONDS = 6 * 60 * 60
+    # Lifetime (seconds) of the shared geocode and travel time caches
+    GEOCODE_CACHE_SECONDS = 30 * 24 * 60 * 60
+    TRAVEL_CACHE_SECONDS = 24 * 60 * 60
+    # Reverse geocoding answers with a saved location or previous result this close (meters)
+    REVERSE_GEOCODE_RADIUS_M = int(os.getenv('REVERSE_GEOCODE_RADIUS_M', '25'))
+    # Google requests and concurrency allowed to one `flask warm-cache` run
+    WARM_CACHE_BUDGET = int(os.getenv('WARM_CACHE_BUDGET', '1000'))
+    WARM_CACHE_WORKERS = 4
+    # Time (seconds) the trip planner spends improving the order of a trip too
+    # long to solve exactly
+    TRIP_SOLVER_SECONDS = 0.5
+    # Comma-separated emails of users allowed into /admin
+    ADMIN_EMAILS = [email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()]
+    # Requests carrying a profile token (see /admin/profiles) are profiled into PROFILE_DIR
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_INTERVAL = 0.005
+    PROFILE_MAX_FILES = 100
+    PROFILE_TOKEN_MAX_AGE = 60 * 60
+    # Worker RSS is sampled after requests at most this often, keeping a day of samples
+    MEMORY_SAMPLE_SECONDS = 60
+    MEMORY_HISTORY_SIZE = 1440
+    TRACEMALLOC_FRAMES = 1
+    # gunicorn recycles a worker once its RSS exceeds this many MB (0 disables)
+    MAX_WORKER_RSS_MB = int(os.getenv('MAX_WORKER_RSS_MB', '0'))
+    # Google API usage is counted in memory and written every USAGE_FLUSH_SECONDS
+    # (0 leaves flushing to explicit flush_usage calls)
+    USAGE_FLUSH_SECONDS = 5
+    # Google requests a user may make per day unless set per user (0 is unlimited)
+    USAGE_DAILY_BUDGET = int(os.getenv('USAGE_DAILY_BUDGET', '0'))
+    # Endpoints (optionally "METHOD endpoint") that make blocking Google requests; a worker
+    # runs at most ADMISSION_MAX_IN_FLIGHT of them and ADMISSION_PER_USER per user at once
+    # (0 disables admission control). Keep in-flight plus queued slots below the gunicorn
+    # threads so cheap routes always find a free thread
+    ADMISSION_ENDPOINTS = [
+        endpoint.strip() for endpoint in os.getenv(
+            'ADMISSION_ENDPOINTS',
+            'POST main.compare_travel,POST main.locations,main.commute_profile,main.transit_ranking,'
+            'main.export_locations,main.export_comparisons,POST main.trip'
+        ).split(',') if endpoint.strip()
+    ]
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '4'))
+    ADMISSION_PER_USER = int(os.getenv('ADMISSION_PER_USER', '2'))
+    # A request arriving at a full worker waits this long (seconds) behind at most
+    # ADMISSION_MAX_QUEUE others for a slot before it is shed with a 503
+    ADMISSION_QUEUE_SECONDS = float(os.getenv('ADMISSION_QUEUE_SECONDS', '2'))
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '2'))
 
 class ProdConfig(DefaultConfig):
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key')
@@ -28,4 +103,6 @@ class TestConfig(DefaultConfig):
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key')
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Tests flush usage explicitly
+    USAGE_FLUSH_SECONDS = 0
     pass
\ No newline at end of file
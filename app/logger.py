@@ -1,6 +1,169 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+# Shared by every logger created through setup_logger so that all records go
+# through a single background thread
+_listener = None
+_queue = None
+_lock = threading.Lock()
+
+_stats = {"enqueued": 0, "dropped": 0, "sampled_out": 0}
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Attaches the current request id (or "-" outside a request) to each record.
+    """
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            try:
+                from flask import g, has_request_context
+                record.request_id = g.get("request_id", "-") if has_request_context() else "-"
+            except ImportError:
+                record.request_id = "-"
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of DEBUG records; higher levels always pass.
+    """
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if random.random() < self.rate:
+            return True
+        with _lock:
+            _stats["sampled_out"] += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON objects.
+    """
+    def format(self, record):
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Enqueues records without blocking, counting the ones dropped when the queue is full.
+    """
+    def prepare(self, record):
+        # Resolve the message (and request id) in the calling thread, where the
+        # request context is still available
+        RequestIdFilter().filter(record)
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            counter = "enqueued"
+        except queue.Full:
+            counter = "dropped"
+        # Records are logged from every gthread thread at once
+        with _lock:
+            _stats[counter] += 1
+
+
+def _build_formatter():
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        fmt="%(asctime)s [%(levelname)s] %(name)s [%(request_id)s]: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+
+def _build_handlers():
+    formatter = _build_formatter()
+
+    # Stream handler (Render captures stdout)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    handlers = [stream_handler]
+
+    # Optional: File handler (useful for local dev)
+    if not os.getenv("RENDER"):  # Avoid using files on Render
+        file_handler = RotatingFileHandler("app.log", maxBytes=1000000, backupCount=3)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    return handlers
+
+
+def _start_listener():
+    global _listener, _queue
+    with _lock:
+        if _listener is not None:
+            return _queue
+        _queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        _listener = QueueListener(_queue, *_build_handlers(), respect_handler_level=True)
+        _listener.start()
+        return _queue
+
+
+def stop_listener():
+    """
+    Flushes pending records and stops the background logging thread.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork():
+    # Threads do not survive fork(); gunicorn preloads the app in the master, so
+    # each worker needs its own listener reading from a fresh queue
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        new_queue = _start_listener()
+        for handler in list(_queue_handlers):
+            handler.queue = new_queue
+
+
+_queue_handlers = []
+
+atexit.register(stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_log_stats():
+    """
+    Returns counters describing the logging pipeline: records enqueued, dropped
+    because the queue was full, and DEBUG records discarded by sampling.
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats["queue_size"] = _queue.qsize() if _queue is not None else 0
+    return stats
+
 
 def setup_logger(name=__name__):
     logger = logging.getLogger(name)
@@ -8,20 +171,10 @@ def setup_logger(name=__name__):
 
     # Avoid adding multiple handlers if already configured
     if not logger.handlers:
-        formatter = logging.Formatter(
-            fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
-
-        # Stream handler (Render captures stdout)
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(stream_handler)
-
-        # Optional: File handler (useful for local dev)
-        if not os.getenv("RENDER"):  # Avoid using files on Render
-            file_handler = RotatingFileHandler("app.log", maxBytes=1000000, backupCount=3)
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+        # Request threads only enqueue; formatting and I/O happen on the listener thread
+        handler = BoundedQueueHandler(_start_listener())
+        handler.addFilter(DebugSamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+        logger.addHandler(handler)
+        _queue_handlers.append(handler)
 
     return logger
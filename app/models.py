@@ -1,26 +1,209 @@
 from . import db
+from flask import current_app
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import object_session, validates
+from .utils.geo import E7, MAX_LATITUDE_E7, MAX_LONGITUDE_E7, from_e7, to_e7
+from .utils.replicas import RoutingSession
 from werkzeug.security import generate_password_hash, check_password_hash
 
+def normalize_email(email):
+    """
+    Returns the canonical form emails are stored and looked up in.
+    """
+    return email.strip().lower()
+
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Google requests allowed per day; NULL falls back to USAGE_DAILY_BUDGET
+    api_daily_budget = db.Column(db.Integer)
     locations = db.relationship('Location', backref='user', lazy=True)
 
+    # Enforces case-insensitive uniqueness and serves lookups on lower(email)
+    __table_args__ = (
+        db.Index('ix_users_email_lower', db.func.lower(email), unique=True),
+    )
+
+    @validates('email')
+    def validate_email(self, key, email):
+        return normalize_email(email) if email else email
+
+    @classmethod
+    def find_by_email(cls, email):
+        return cls.query.filter(db.func.lower(cls.email) == normalize_email(email)).first()
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @property
+    def is_admin(self):
+        return self.email in current_app.config.get('ADMIN_EMAILS', [])
+
 class Location(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     address = db.Column(db.String(255), nullable=False)
-    latitude = db.Column(db.Float, nullable=False)
-    longitude = db.Column(db.Float, nullable=False)
+    # Degrees * 1e7; use the latitude/longitude properties for float degrees
+    latitude_e7 = db.Column(db.Integer, nullable=False)
+    longitude_e7 = db.Column(db.Integer, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Google place ID; stable across address formatting changes
+    place_id = db.Column(db.String(255))
+
+    __table_args__ = (
+        db.CheckConstraint(f'latitude_e7 BETWEEN -{MAX_LATITUDE_E7} AND {MAX_LATITUDE_E7}',
+                           name='ck_location_latitude_e7'),
+        db.CheckConstraint(f'longitude_e7 BETWEEN -{MAX_LONGITUDE_E7} AND {MAX_LONGITUDE_E7}',
+                           name='ck_location_longitude_e7'),
+        # Serves per-user listings as well as exact and bounding-box coordinate lookups
+        db.Index('ix_location_user_coords', 'user_id', 'latitude_e7', 'longitude_e7'),
+        # Each place is saved at most once per user; NULLs (not yet known) do not collide
+        db.Index('uq_location_user_place', 'user_id', 'place_id', unique=True),
+    )
+
+    @hybrid_property
+    def latitude(self):
+        return from_e7(self.latitude_e7)
+
+    @latitude.inplace.setter
+    def _latitude_setter(self, value):
+        self.latitude_e7 = to_e7(value)
+
+    @latitude.inplace.expression
+    @classmethod
+    def _latitude_expression(cls):
+        return cls.latitude_e7 / float(E7)
+
+    @hybrid_property
+    def longitude(self):
+        return from_e7(self.longitude_e7)
+
+    @longitude.inplace.setter
+    def _longitude_setter(self, value):
+        self.longitude_e7 = to_e7(value)
+
+    @longitude.inplace.expression
+    @classmethod
+    def _longitude_expression(cls):
+        return cls.longitude_e7 / float(E7)
+
+# Called with each user id whose locations changed, once the change is committed
+_location_callbacks = []
+
+def on_locations_committed(callback):
+    """
+    Registers callback(user_id) to run after a commit that inserted, updated or
+    deleted locations of the user. Running it on commit rather than on flush means a
+    concurrent request cannot re-cache the old rows; rolled back changes run nothing.
+    """
+    _location_callbacks.append(callback)
+    return callback
+
+@event.listens_for(Location, "after_insert")
+@event.listens_for(Location, "after_update")
+@event.listens_for(Location, "after_delete")
+def _location_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("location_users", set()).add(target.user_id)
+
+@event.listens_for(RoutingSession, "after_commit")
+def _locations_committed(session):
+    for user_id in session.info.pop("location_users", ()):
+        for callback in _location_callbacks:
+            callback(user_id)
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _locations_rolled_back(session):
+    session.info.pop("location_users", None)
+
+class MigrationCheckpoint(db.Model):
+    __tablename__ = 'migration_checkpoints'
+    name = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ComparisonHistory(db.Model):
+    __tablename__ = 'comparison_history'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    saved_location_id = db.Column(db.Integer, db.ForeignKey('location.id', ondelete='CASCADE'), nullable=False)
+    new_address = db.Column(db.String(255))
+    # The address as typed, which keys the geocode cache that `flask warm-cache` fills
+    new_query = db.Column(db.String(255))
+    # Coordinates of the compared address quantized to 1e-4 degrees (about 11 m)
+    new_lat_q = db.Column(db.Integer, nullable=False)
+    new_lng_q = db.Column(db.Integer, nullable=False)
+    driving_seconds = db.Column(db.Integer)
+    driving_meters = db.Column(db.Integer)
+    walking_seconds = db.Column(db.Integer)
+    walking_meters = db.Column(db.Integer)
+    bicycling_seconds = db.Column(db.Integer)
+    bicycling_meters = db.Column(db.Integer)
+    transit_seconds = db.Column(db.Integer)
+    transit_meters = db.Column(db.Integer)
+    created_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    saved_location = db.relationship('Location')
+
+    __table_args__ = (
+        # Serves both reuse lookups and per-location history for a user
+        db.Index('ix_comparison_history_lookup', 'user_id', 'saved_location_id',
+                 'new_lat_q', 'new_lng_q', 'created_date'),
+    )
+
+class GeocodeCacheEntry(db.Model):
+    """
+    Geocoding result shared by all users, keyed by the normalized address typed.
+    """
+    __tablename__ = 'geocode_cache'
+    query_key = db.Column(db.String(255), primary_key=True)
+    formatted_address = db.Column(db.String(255), nullable=False)
+    latitude_e7 = db.Column(db.Integer, nullable=False)
+    longitude_e7 = db.Column(db.Integer, nullable=False)
+    place_id = db.Column(db.String(255))
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # Serves reverse geocoding's bounding-box lookups of results near a point
+        db.Index('ix_geocode_cache_coords', 'latitude_e7', 'longitude_e7'),
+    )
+
+class TravelTimeCacheEntry(db.Model):
+    """
+    Travel time for one mode from a quantized origin to a destination waypoint
+    (a place_id: reference or coordinates), shared by all users.
+    """
+    __tablename__ = 'travel_time_cache'
+    origin_lat_q = db.Column(db.Integer, primary_key=True)
+    origin_lng_q = db.Column(db.Integer, primary_key=True)
+    destination = db.Column(db.String(255), primary_key=True)
+    mode = db.Column(db.String(16), primary_key=True)
+    seconds = db.Column(db.Integer)
+    meters = db.Column(db.Integer)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class ApiUsage(db.Model):
+    """
+    Google Maps requests per day, user, API and travel mode. Written in batches by
+    app.services.usage; user_id 0 books requests not made for a user.
+    """
+    __tablename__ = 'api_usage'
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(64), primary_key=True)
+    mode = db.Column(db.String(16), primary_key=True, default='')
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    # Distance Matrix origins x destinations, which is what Google bills
+    elements = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,119 @@
+import os
+from functools import wraps
+
+from flask import (
+    Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, send_from_directory, url_for
+)
+from flask_login import current_user, login_required
+
+from .. import db
+from ..logger import get_log_stats
+from ..services.usage import get_usage_report, set_user_budget
+from ..utils.admission import get_admission_stats
+from ..utils.memory import get_memory_report, snapshot_diff, start_tracing, stop_tracing, top_object_types
+from ..utils.profiling import PROFILE_MODES, list_profiles, make_profile_token
+from ..utils.replicas import get_replica_status
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
+def admin_required(view):
+    """
+    Restricts a view to logged-in users listed in ADMIN_EMAILS.
+    """
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route("/profiles")
+@admin_required
+def profiles():
+    directory = current_app.config['PROFILE_DIR']
+    tokens = {mode: make_profile_token(current_app.secret_key, mode) for mode in PROFILE_MODES}
+    return render_template('admin/profiles.html', profiles=list_profiles(directory), tokens=tokens,
+                           token_max_age=current_app.config['PROFILE_TOKEN_MAX_AGE'])
+
+
+@admin_bp.route("/profiles/<filename>")
+@admin_required
+def download_profile(filename):
+    if not filename.endswith('.speedscope.json'):
+        abort(404)
+    directory = os.path.abspath(current_app.config['PROFILE_DIR'])
+    return send_from_directory(directory, filename, as_attachment=True, mimetype='application/json')
+
+
+def _cache_sizes():
+    from ..services.autocomplete import _prediction_cache
+    from ..services.commute import _slot_cache
+
+    return {
+        "Autocomplete predictions": len(_prediction_cache),
+        "Commute slots": len(_slot_cache),
+        "Session identity map": len(db.session.identity_map),
+    }
+
+
+@admin_bp.route("/memory")
+@admin_required
+def memory():
+    report = get_memory_report(_cache_sizes())
+    report["ceiling_mb"] = current_app.config['MAX_WORKER_RSS_MB']
+    report["logging"] = get_log_stats()
+    report["database"] = get_replica_status()
+    report["diff"] = snapshot_diff(depth=request.args.get('depth', 2, type=int))
+    if request.args.get('objects'):
+        report["objects"] = top_object_types()
+    if request.args.get('format') == 'json':
+        return jsonify(report)
+    return render_template('admin/memory.html', report=report)
+
+
+@admin_bp.route("/memory/tracing", methods=["POST"])
+@admin_required
+def memory_tracing():
+    if request.form.get('action') == 'stop':
+        stop_tracing()
+        flash("Stopped tracemalloc.")
+    else:
+        start_tracing(current_app.config['TRACEMALLOC_FRAMES'])
+        flash("Took a new tracemalloc baseline.")
+    return redirect(url_for('admin.memory'))
+
+
+@admin_bp.route("/usage")
+@admin_required
+def usage():
+    days = request.args.get('days', 7, type=int)
+    report = get_usage_report(days)
+    if request.args.get('format') == 'json':
+        return jsonify(days=days, users=report)
+    return render_template('admin/usage.html', report=report, days=days,
+                           default_budget=current_app.config['USAGE_DAILY_BUDGET'])
+
+
+@admin_bp.route("/usage/<int:user_id>/budget", methods=["POST"])
+@admin_required
+def usage_budget(user_id):
+    value = request.form.get('budget', '').strip()
+    if value and not value.isdigit():
+        flash("The budget must be a whole number of requests.")
+    else:
+        set_user_budget(user_id, int(value) if value else None)
+        flash("Budget updated.")
+    return redirect(url_for('admin.usage'))
+
+
+@admin_bp.route("/admission")
+@admin_required
+def admission():
+    stats = get_admission_stats()
+    if request.args.get('format') == 'json':
+        return jsonify(stats)
+    return render_template('admin/admission.html', stats=stats,
+                           threads=int(os.getenv('GUNICORN_THREADS', '8')))
@@ -1,13 +1,30 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from datetime import datetime
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app, Response, abort, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from ..models import User, Location
 from .. import db
 from ..services.travel import compare_locations
 from ..services.address import create_location_with_verified_address, verify_address
+from ..services.autocomplete import autocomplete
+from ..services.clusters import get_clusters, parse_bbox
+from ..services.commute import get_commute_profile
+from ..services.reverse_geocode import reverse_geocode
+from ..services.usage import UsageBudgetExceeded
+from ..services.export import (
+    COMPARISON_FIELDS, EXPORT_FORMATS, LOCATION_FIELDS, gzip_chunks, iter_comparisons, iter_locations, serialize
+)
+from ..services.history import get_location_aggregates, get_recent_comparisons
+from ..services.travel import MODES, format_duration, rank_locations_by_transit
+from ..services.trips import MAX_STOPS, plan_trip
 from ..utils.password import is_password_secure
 
 main_bp = Blueprint('main', __name__)
 
+@main_bp.app_template_filter('duration')
+def duration_filter(seconds):
+    return format_duration(round(seconds)) if seconds is not None else "–"
+
 @main_bp.route("/")
 def home():
     if current_user.is_authenticated:
@@ -24,18 +41,22 @@ def register_user():
             password = request.form.get('password')
             if not email or not password:
                 flash("Please fill all fields.")
-            elif User.query.filter_by(email=email).first():
-                flash("That email address is already in use.")
             else:
                 is_secure, message = is_password_secure(password)
                 if not is_secure:
                     flash(message)
                     return render_template('register.html')
                 
+                # The unique index on lower(email) rejects duplicates, no pre-query needed
                 new_user = User(email=email)
                 new_user.set_password(password)
                 db.session.add(new_user)
-                db.session.commit()
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+                    flash("That email address is already in use.")
+                    return render_template('register.html')
                 flash("Registration successful! Please log in.")
                 return redirect(url_for('main.login'))
         except Exception as e:
@@ -51,7 +72,7 @@ def login():
         try:
             email = request.form.get('email')
             password = request.form.get('password')
-            user = User.query.filter_by(email=email).first()
+            user = User.find_by_email(email) if email else None
             if user and user.check_password(password):
                 login_user(user)
                 return redirect(url_for('main.home'))
@@ -79,11 +100,17 @@ def locations():
             flash('Both name and address are required.')
         else:
             # Create location with verified address and coordinates
-            success, location = create_location_with_verified_address(
-                user_id=current_user.id,
-                name=name,
-                address=address
-            )
+            try:
+                success, location = create_location_with_verified_address(
+                    user_id=current_user.id,
+                    name=name,
+                    address=address,
+                    place_id=request.form.get('place_id'),
+                    session_token=request.form.get('session_token')
+                )
+            except UsageBudgetExceeded as e:
+                flash(str(e))
+                return redirect(url_for('main.locations'))
             
             if success:
                 flash('Location added successfully!')
@@ -106,7 +133,15 @@ def compare_travel():
             return redirect(url_for('main.compare_travel'))
 
         # Verify the new location address and get coordinates
-        is_valid, details = verify_address(new_location_address)
+        try:
+            is_valid, details = verify_address(
+                new_location_address,
+                place_id=request.form.get('place_id'),
+                session_token=request.form.get('session_token')
+            )
+        except UsageBudgetExceeded as e:
+            flash(str(e))
+            return redirect(url_for('main.compare_travel'))
         if not is_valid:
             flash('Could not verify the new location address. Please check and try again.')
             return redirect(url_for('main.compare_travel'))
@@ -117,7 +152,9 @@ def compare_travel():
             saved_location, results = compare_locations(
                 new_location_coords=new_location_coords,
                 saved_location_id=saved_location_id,
-                user_id=current_user.id
+                user_id=current_user.id,
+                new_address=details.get('formatted_address', new_location_address),
+                new_query=new_location_address
             )
             return render_template(
                 'travel_results.html',
@@ -130,4 +167,147 @@ def compare_travel():
             return redirect(url_for('main.compare_travel'))
 
     saved_locations = Location.query.filter_by(user_id=current_user.id).all()
-    return render_template('compare_travel.html', saved_locations=saved_locations)
\ No newline at end of file
+    return render_template('compare_travel.html', saved_locations=saved_locations)
+
+@main_bp.route('/trip', methods=['GET', 'POST'])
+@login_required
+def trip():
+    saved_locations = Location.query.filter_by(user_id=current_user.id).order_by(Location.name).all()
+    plan = None
+    if request.method == 'POST':
+        start_id = request.form.get('start_id', type=int)
+        stop_ids = request.form.getlist('location_ids', type=int)
+        if start_id is None:
+            flash('Choose where the trip starts.')
+        else:
+            try:
+                plan = plan_trip(
+                    current_user.id,
+                    [start_id] + [stop_id for stop_id in stop_ids if stop_id != start_id],
+                    mode=request.form.get('mode', 'driving'),
+                    round_trip=bool(request.form.get('round_trip'))
+                )
+            except (ValueError, UsageBudgetExceeded) as e:
+                flash(str(e))
+    return render_template('trip.html', saved_locations=saved_locations, plan=plan, modes=MODES,
+                           max_stops=MAX_STOPS)
+
+@main_bp.route('/api/autocomplete')
+@login_required
+def address_autocomplete():
+    suggestions = autocomplete(
+        request.args.get('q', ''),
+        user_id=current_user.id,
+        session_token=request.args.get('session_token')
+    )
+    return jsonify(suggestions=suggestions)
+
+@main_bp.route('/api/clusters')
+@login_required
+def location_clusters():
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        clusters = get_clusters(current_user.id, zoom=request.args.get('zoom', 0, type=int), bbox=bbox)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(clusters)
+
+@main_bp.route('/api/transit_ranking')
+@login_required
+def transit_ranking():
+    if not request.args.get('lat') or not request.args.get('lng'):
+        return jsonify(error="lat and lng are required."), 400
+    try:
+        origin = (float(request.args['lat']), float(request.args['lng']))
+        departure = datetime.fromisoformat(request.args['departure']) if request.args.get('departure') else None
+        ranking = rank_locations_by_transit(current_user.id, origin, departure)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(locations=ranking)
+
+@main_bp.route('/api/reverse_geocode')
+@login_required
+def reverse_geocode_point():
+    if not request.args.get('lat') or not request.args.get('lng'):
+        return jsonify(error="lat and lng are required."), 400
+    try:
+        found, details = reverse_geocode(float(request.args['lat']), float(request.args['lng']),
+                                         user_id=current_user.id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except UsageBudgetExceeded as e:
+        return jsonify(error=str(e)), 429
+    if not found:
+        return jsonify(details), 404
+    return jsonify(details)
+
+@main_bp.route('/api/commute_profile')
+@login_required
+def commute_profile():
+    origin = Location.query.filter_by(id=request.args.get('from'), user_id=current_user.id).first()
+    destination = Location.query.filter_by(id=request.args.get('to'), user_id=current_user.id).first()
+    if not origin or not destination:
+        return jsonify(error="Saved location not found or does not belong to user."), 404
+
+    try:
+        profile = get_commute_profile(
+            (origin.latitude, origin.longitude),
+            (destination.latitude, destination.longitude),
+            mode=request.args.get('mode', 'driving'),
+            days=request.args.get('days', 'weekdays'),
+            start=request.args.get('start', '07:00'),
+            end=request.args.get('end', '10:00'),
+            step_minutes=request.args.get('step', 15, type=int),
+            timezone=current_app.config['COMMUTE_TIMEZONE'],
+            origin_place_id=origin.place_id,
+            destination_place_id=destination.place_id
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except UsageBudgetExceeded as e:
+        return jsonify(error=str(e)), 429
+
+    return jsonify(profile)
+
+def _export_response(records, fmt, fields, filename):
+    chunks = serialize(records, fmt, fields)
+    headers = {'Content-Disposition': f'attachment; filename={filename}.{fmt}', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    # stream_with_context keeps the database session open while the body is generated
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@main_bp.route('/export/locations.<fmt>')
+@login_required
+def export_locations(fmt):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    # Exports are ordered by id, so an interrupted download resumes with after_id=<last id received>
+    records = iter_locations(
+        current_user.id,
+        after_id=request.args.get('after_id', 0, type=int),
+        limit=request.args.get('limit', type=int)
+    )
+    return _export_response(records, fmt, LOCATION_FIELDS, 'locations')
+
+@main_bp.route('/export/comparisons.<fmt>')
+@login_required
+def export_comparisons(fmt):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    records = iter_comparisons(
+        current_user.id,
+        after_id=request.args.get('after_id', 0, type=int),
+        limit=request.args.get('limit', type=int)
+    )
+    return _export_response(records, fmt, COMPARISON_FIELDS, 'comparisons')
+
+@main_bp.route('/history')
+@login_required
+def history():
+    return render_template(
+        'history.html',
+        aggregates=get_location_aggregates(current_user.id),
+        comparisons=get_recent_comparisons(current_user.id)
+    )
@@ -1,17 +1,35 @@
 import os
 import requests
-from typing import Dict, Optional, Tuple
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError
+from typing import Callable, Dict, Optional, Tuple
 from ..models import Location, db
+from .gazetteer import get_gazetteer
+from .maps import maps_get
+from .result_cache import get_cached_geocode, store_geocode
+from .usage import UsageBudgetExceeded
+from ..utils.online_migrations import backfill_in_batches
 
+# Rows created before coordinates were stored were defaulted to (0.0, 0.0)
+PLACEHOLDER_COORDINATES = (Location.latitude_e7 == 0) & (Location.longitude_e7 == 0)
 
-def verify_address(address: str) -> Tuple[bool, Dict]:
+
+def verify_address(address: str, place_id: Optional[str] = None,
+                   session_token: Optional[str] = None) -> Tuple[bool, Dict]:
     """
     Verifies an address using the Google Maps Geocoding API.
     Returns a tuple of (is_valid, details) where details contains the formatted address
     and coordinates if valid, or error information if invalid.
     
+    Postcodes and place names found in the local gazetteer are resolved offline, and
+    addresses geocoded recently (by any user, or by `flask warm-cache`) from the cache.
+    When the address was picked from an autocomplete suggestion, its place_id is
+    resolved through Place Details instead, which also closes the billing session.
+    
     Args:
         address (str): The address to verify
+        place_id (str): Place ID of the chosen autocomplete suggestion, if any
+        session_token (str): Autocomplete session token the suggestion came from
         
     Returns:
         Tuple[bool, Dict]: (is_valid, details)
@@ -19,22 +37,41 @@ def verify_address(address: str) -> Tuple[bool, Dict]:
             - details: Dictionary containing either:
                 - For valid addresses: formatted_address, lat, lng
                 - For invalid addresses: error message
+
+    Raises:
+        UsageBudgetExceeded: If Google is needed and the user has used up their daily budget
     """
     if not address:
         return False, {"error": "No address provided"}
 
+    gazetteer = get_gazetteer()
+    if gazetteer is not None and not place_id:
+        entry = gazetteer.lookup(address)
+        if entry:
+            return True, {
+                "formatted_address": entry['label'],
+                "lat": entry['lat'],
+                "lng": entry['lng'],
+                "place_id": None,
+                "types": ["gazetteer"]
+            }
+
+    # The shared cache needs the database, which worker threads of the warm-up do not use
+    use_cache = not place_id and has_app_context()
+    if use_cache:
+        cached = get_cached_geocode(address)
+        if cached:
+            return True, cached
+
     api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
         return False, {"error": "Google Maps API key not configured"}
 
-    url = (
-        f"https://maps.googleapis.com/maps/api/geocode/json"
-        f"?address={address}&key={api_key}"
-    )
+    if place_id:
+        return verify_place(place_id, session_token, fallback_address=address)
 
     try:
-        response = requests.get(url)
-        data = response.json()
+        data = maps_get("geocode/json", {"address": address})
 
         if data.get('status') == 'OK' and data.get('results'):
             result = data['results'][0]
@@ -43,51 +80,128 @@ def verify_address(address: str) -> Tuple[bool, Dict]:
             # Get the formatted address from Google's response
             formatted_address = result.get('formatted_address', address)
             
-            return True, {
+            details = {
                 "formatted_address": formatted_address,
                 "lat": location['lat'],
                 "lng": location['lng'],
                 "place_id": result.get('place_id'),  # Adding place_id for future reference
                 "types": result.get('types', [])  # Adding types for additional context
             }
+            if use_cache:
+                store_geocode(address, details)
+            return True, details
         else:
             return False, {
                 "error": f"Address not found: {data.get('status', 'Unknown error')}"
             }
 
+    except UsageBudgetExceeded:
+        # Not an unverifiable address; routes tell the user their budget is spent
+        raise
+    except requests.RequestException as e:
+        return False, {"error": f"API request failed: {str(e)}"}
+    except Exception as e:
+        return False, {"error": f"Unexpected error: {str(e)}"}
+
+
+def verify_place(place_id: str, session_token: Optional[str] = None,
+                 fallback_address: str = "") -> Tuple[bool, Dict]:
+    """
+    Resolves a place ID from an autocomplete suggestion using the Place Details API.
+    Returns the same (is_valid, details) shape as verify_address.
+    
+    Args:
+        place_id (str): The place ID to resolve
+        session_token (str): The autocomplete session token, so that the keystrokes
+                             and this lookup are billed as a single session
+        fallback_address (str): Address to report if Google omits a formatted one
+        
+    Returns:
+        Tuple[bool, Dict]: (is_valid, details)
+
+    Raises:
+        UsageBudgetExceeded: If the user has used up their daily budget
+    """
+    params = {"place_id": place_id, "fields": "formatted_address,geometry,place_id,types"}
+    if session_token:
+        params["sessiontoken"] = session_token
+
+    try:
+        data = maps_get("place/details/json", params)
+
+        if data.get('status') == 'OK' and data.get('result'):
+            result = data['result']
+            location = result['geometry']['location']
+            return True, {
+                "formatted_address": result.get('formatted_address', fallback_address),
+                "lat": location['lat'],
+                "lng": location['lng'],
+                "place_id": result.get('place_id', place_id),
+                "types": result.get('types', [])
+            }
+        else:
+            return False, {
+                "error": f"Place not found: {data.get('status', 'Unknown error')}"
+            }
+
+    except UsageBudgetExceeded:
+        # Not an unverifiable address; routes tell the user their budget is spent
+        raise
     except requests.RequestException as e:
         return False, {"error": f"API request failed: {str(e)}"}
     except Exception as e:
         return False, {"error": f"Unexpected error: {str(e)}"}
 
 
-def create_location_with_verified_address(user_id: int, name: str, address: str) -> Tuple[bool, Optional[Location]]:
+def create_location_with_verified_address(user_id: int, name: str, address: str,
+                                          place_id: Optional[str] = None,
+                                          session_token: Optional[str] = None) -> Tuple[bool, Optional[Location]]:
     """
     Creates a new location with a verified address.
     
+    Places the user has already saved are not added twice: a known place_id from an
+    autocomplete suggestion returns the stored row without geocoding, and a geocoded
+    place matching a stored row (by place_id, or by address for rows saved before
+    place IDs were kept, which are backfilled here) returns that row.
+    
     Args:
         user_id (int): The ID of the user creating the location
         name (str): The name of the location
         address (str): The address to verify and save
+        place_id (str): Place ID of the chosen autocomplete suggestion, if any
+        session_token (str): Autocomplete session token the suggestion came from
         
     Returns:
         Tuple[bool, Optional[Location]]: (success, location)
             - success: Boolean indicating if the location was created successfully
             - location: The created Location object if successful, None if failed
+
+    Raises:
+        UsageBudgetExceeded: If the user has used up their daily budget
     """
-    is_valid, details = verify_address(address)
+    if place_id:
+        existing = Location.query.filter_by(user_id=user_id, place_id=place_id).first()
+        if existing:
+            return True, existing
+
+    is_valid, details = verify_address(address, place_id=place_id, session_token=session_token)
     
     if not is_valid:
         return False, None
         
     try:
+        existing = find_saved_place(user_id, details.get('place_id'), details['formatted_address'])
+        if existing:
+            return True, existing
+
         # Create new location with the formatted address and coordinates
         location = Location(
             user_id=user_id,
             name=name,
             address=details['formatted_address'],  # Use the formatted address from Google
             latitude=details['lat'],  # Save the latitude
-            longitude=details['lng']  # Save the longitude
+            longitude=details['lng'],  # Save the longitude
+            place_id=details.get('place_id')
         )
         
         db.session.add(location)
@@ -95,11 +209,43 @@ def create_location_with_verified_address(user_id: int, name: str, address: str)
         
         return True, location
         
+    except IntegrityError:
+        # Saved concurrently by another request
+        db.session.rollback()
+        existing = find_saved_place(user_id, details.get('place_id'), details['formatted_address'])
+        return (True, existing) if existing else (False, None)
     except Exception as e:
         db.session.rollback()
         return False, None
 
 
+def find_saved_place(user_id: int, place_id: Optional[str], formatted_address: str) -> Optional[Location]:
+    """
+    Finds a user's saved location for a geocoded place, backfilling the place_id of a
+    matching location saved before place IDs were stored.
+    
+    Args:
+        user_id (int): The ID of the user
+        place_id (str): The place ID returned by Google, if any
+        formatted_address (str): The formatted address returned by Google
+        
+    Returns:
+        Optional[Location]: The saved location, or None if the place is new to the user
+    """
+    if not place_id:
+        return None
+
+    location = Location.query.filter_by(user_id=user_id, place_id=place_id).first()
+    if location:
+        return location
+
+    location = Location.query.filter_by(user_id=user_id, address=formatted_address, place_id=None).first()
+    if location:
+        location.place_id = place_id
+        db.session.commit()
+    return location
+
+
 def get_address_components(address: str) -> Optional[Dict]:
     """
     Gets detailed address components (street, city, state, etc.) for a given address.
@@ -116,15 +262,8 @@ def get_address_components(address: str) -> Optional[Dict]:
     if not is_valid:
         return None
         
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    url = (
-        f"https://maps.googleapis.com/maps/api/geocode/json"
-        f"?address={address}&key={api_key}"
-    )
-    
     try:
-        response = requests.get(url)
-        data = response.json()
+        data = maps_get("geocode/json", {"address": address})
         
         if data.get('status') == 'OK' and data.get('results'):
             components = {}
@@ -148,4 +287,47 @@ def get_address_components(address: str) -> Optional[Dict]:
     except Exception:
         return None
     
-    return None 
\ No newline at end of file
+    return None
+
+
+def regeocode_placeholder_coordinates(batch_size: int = 50, sleep_seconds: float = 1.0,
+                                      progress: Optional[Callable[[int, int], None]] = None,
+                                      restart: bool = False) -> Dict[str, int]:
+    """
+    Re-geocodes locations still holding the (0, 0) placeholder coordinates, in
+    resumable batches so that it can run against a live database.
+    
+    Args:
+        batch_size (int): Locations geocoded per committed batch
+        sleep_seconds (float): Pause between batches to stay under the API rate limit
+        progress (Callable): Called with (processed, total) after each batch
+        restart (bool): Start again from the first location instead of the checkpoint
+        
+    Returns:
+        Dict[str, int]: Counts of locations processed, updated and failed
+    """
+    counts = {"processed": 0, "updated": 0, "failed": 0}
+
+    def geocode_batch(locations):
+        for location in locations:
+            counts["processed"] += 1
+            is_valid, details = verify_address(location.address)
+            if is_valid:
+                location.latitude = details['lat']
+                location.longitude = details['lng']
+                location.place_id = location.place_id or details.get('place_id')
+                counts["updated"] += 1
+            else:
+                counts["failed"] += 1
+
+    backfill_in_batches(
+        "regeocode_placeholder_coordinates",
+        Location,
+        geocode_batch,
+        where=PLACEHOLDER_COORDINATES,
+        batch_size=batch_size,
+        sleep_seconds=sleep_seconds,
+        progress=progress,
+        restart=restart,
+    )
+    return counts
@@ -0,0 +1,134 @@
+import re
+import requests
+from typing import Dict, List, Optional
+from ..models import Location
+from ..utils.cache import LRUCache
+from .maps import maps_get
+
+MIN_QUERY_LENGTH = 3
+MAX_SUGGESTIONS = 5
+
+# Google returns at most five predictions; fewer means the list is exhaustive
+GOOGLE_PREDICTION_LIMIT = 5
+
+# Suggestions are not user specific, so one cache serves every user of the worker
+_prediction_cache = LRUCache(maxsize=5000, ttl=24 * 60 * 60)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercases a query and collapses whitespace so equivalent inputs share cache entries.
+    """
+    return re.sub(r"\s+", " ", (query or "")).strip().lower()
+
+
+def _matches(description: str, query: str) -> bool:
+    """
+    Returns True if every word of the query appears in the description; the last
+    word may be incomplete since the user is still typing it.
+    """
+    words = re.findall(r"\w+", description.lower())
+    *complete, partial = query.split(" ")
+    return (all(w in description.lower() for w in complete)
+            and any(word.startswith(partial) for word in words))
+
+
+def _cached_predictions(query: str) -> Optional[List[Dict]]:
+    """
+    Looks up predictions for the query, or derives them by filtering the cached
+    predictions of a shorter prefix whose result list was exhaustive.
+    """
+    entry = _prediction_cache.get(query)
+    if entry is not None:
+        return entry["predictions"]
+
+    for end in range(len(query) - 1, MIN_QUERY_LENGTH - 1, -1):
+        entry = _prediction_cache.get(query[:end])
+        if entry is None:
+            continue
+        if not entry["complete"]:
+            # A longer input could surface predictions the prefix did not return
+            return None
+        predictions = [p for p in entry["predictions"] if _matches(p["description"], query)]
+        _prediction_cache.set(query, {"predictions": predictions, "complete": True})
+        return predictions
+
+    return None
+
+
+def _fetch_predictions(query: str, session_token: Optional[str]) -> List[Dict]:
+    """
+    Fetches predictions from the Places Autocomplete API and caches them.
+    """
+    params = {"input": query}
+    if session_token:
+        params["sessiontoken"] = session_token
+
+    try:
+        data = maps_get("place/autocomplete/json", params)
+    except requests.RequestException:
+        return []
+
+    if data.get('status') not in ('OK', 'ZERO_RESULTS'):
+        return []
+
+    predictions = [
+        {"description": p['description'], "place_id": p.get('place_id'), "source": "google"}
+        for p in data.get('predictions', [])
+    ]
+    _prediction_cache.set(query, {
+        "predictions": predictions,
+        "complete": len(predictions) < GOOGLE_PREDICTION_LIMIT,
+    })
+    return predictions
+
+
+def _saved_suggestions(user_id: int, query: str) -> List[Dict]:
+    """
+    Returns the user's saved locations whose name or address contains the query.
+    """
+    pattern = f"%{query}%"
+    locations = (
+        Location.query
+        .filter(Location.user_id == user_id)
+        .filter(Location.address.ilike(pattern) | Location.name.ilike(pattern))
+        .order_by(Location.name)
+        .limit(MAX_SUGGESTIONS)
+        .all()
+    )
+    return [
+        {"description": location.address, "place_id": None, "source": "saved", "name": location.name}
+        for location in locations
+    ]
+
+
+def autocomplete(query: str, user_id: int, session_token: Optional[str] = None) -> List[Dict]:
+    """
+    Returns address suggestions for a partially typed query, drawing on the user's
+    saved locations and cached Google predictions before calling the API.
+
+    Args:
+        query (str): The text typed so far
+        user_id (int): The ID of the user typing
+        session_token (str): Autocomplete session token, passed through to Google so
+                             that the final Place Details lookup closes the session
+
+    Returns:
+        List[Dict]: Suggestions with description, place_id and source ("saved" or "google")
+    """
+    query = normalize_query(query)
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+
+    suggestions = _saved_suggestions(user_id, query)
+    predictions = _cached_predictions(query)
+    if predictions is None:
+        predictions = _fetch_predictions(query, session_token)
+
+    seen = {s["description"] for s in suggestions}
+    for prediction in predictions:
+        if prediction["description"] not in seen:
+            suggestions.append(prediction)
+            seen.add(prediction["description"])
+
+    return suggestions[:MAX_SUGGESTIONS]
@@ -0,0 +1,168 @@
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+from ..models import Location, db, on_locations_committed
+from ..utils.cache import LRUCache
+from ..utils.geo import E7, MAX_LATITUDE_E7, MAX_LONGITUDE_E7, from_e7
+from ..utils.replicas import primary, read_only
+
+MAX_ZOOM = 20
+
+# A cell spans a quarter of a 256 px map tile, so clusters sit about 64 px apart
+CELLS_PER_TILE = 4
+
+# Whole-map clusters are cached per user up to this zoom; closer zooms query the viewport
+MAX_CACHED_ZOOM = 12
+
+# Responses are bounded by the viewport; this only guards against absurd viewports
+MAX_CLUSTERS = 2500
+
+# user_id -> {"bounds": ..., "zooms": {zoom: [cells]}}; cleared when the user's locations change
+_cluster_cache = LRUCache(maxsize=1000, ttl=60 * 60)
+
+BBox = Tuple[float, float, float, float]
+
+
+def cell_size_e7(zoom: int) -> int:
+    """
+    Returns the side of a cluster cell at a zoom level, in degrees * 1e7.
+    """
+    return max(1, (360 * E7) // (2 ** zoom * CELLS_PER_TILE))
+
+
+def parse_bbox(value: str) -> BBox:
+    """
+    Parses a "west,south,east,north" bounding box in degrees. west may exceed east
+    for a box crossing the antimeridian.
+    """
+    try:
+        west, south, east, north = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be west,south,east,north")
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180) or not (-180 <= east <= 180):
+        raise ValueError("bbox is out of range")
+    return west, south, east, north
+
+
+def _bbox_condition(bbox: BBox):
+    west, south, east, north = (round(v * E7) for v in bbox)
+    condition = Location.latitude_e7.between(south, north)
+    if west <= east:
+        return condition & Location.longitude_e7.between(west, east)
+    return condition & ((Location.longitude_e7 >= west) | (Location.longitude_e7 <= east))
+
+
+def _in_bbox(lat: float, lng: float, bbox: BBox) -> bool:
+    west, south, east, north = bbox
+    if not south <= lat <= north:
+        return False
+    return west <= lng <= east if west <= east else (lng >= west or lng <= east)
+
+
+def _query_cells(user_id: int, zoom: int, bbox: Optional[BBox] = None) -> List[Dict]:
+    """
+    Groups a user's locations into the grid cells of a zoom level in SQL.
+    """
+    size = cell_size_e7(zoom)
+    # Shifted to be non-negative so integer division floors; BigInteger avoids overflow
+    lat_cell = (sa.cast(Location.latitude_e7, sa.BigInteger) + MAX_LATITUDE_E7) // size
+    lng_cell = (sa.cast(Location.longitude_e7, sa.BigInteger) + MAX_LONGITUDE_E7) // size
+    stmt = (
+        sa.select(
+            sa.func.count(Location.id).label('count'),
+            sa.func.avg(Location.latitude_e7).label('lat_e7'),
+            sa.func.avg(Location.longitude_e7).label('lng_e7'),
+            sa.func.min(Location.id).label('id')
+        )
+        .where(Location.user_id == user_id)
+        .where((Location.latitude_e7 != 0) | (Location.longitude_e7 != 0))
+        .group_by(lat_cell, lng_cell)
+    )
+    if bbox is not None:
+        stmt = stmt.where(_bbox_condition(bbox))
+
+    return [
+        {
+            "lat": round(from_e7(int(row.lat_e7)), 6),
+            "lng": round(from_e7(int(row.lng_e7)), 6),
+            "count": row.count,
+            "id": row.id if row.count == 1 else None,
+        }
+        for row in db.session.execute(stmt)
+    ]
+
+
+def _query_bounds(user_id: int) -> Optional[Dict]:
+    row = db.session.execute(
+        sa.select(
+            sa.func.min(Location.latitude_e7), sa.func.min(Location.longitude_e7),
+            sa.func.max(Location.latitude_e7), sa.func.max(Location.longitude_e7)
+        )
+        .where(Location.user_id == user_id)
+        .where((Location.latitude_e7 != 0) | (Location.longitude_e7 != 0))
+    ).one()
+    if row[0] is None:
+        return None
+    return {"south": from_e7(row[0]), "west": from_e7(row[1]), "north": from_e7(row[2]), "east": from_e7(row[3])}
+
+
+@read_only
+def get_clusters(user_id: int, zoom: int, bbox: Optional[BBox] = None) -> Dict:
+    """
+    Returns a user's locations aggregated into grid clusters for a map view.
+
+    Clusters of the whole map are computed once per user and zoom level and cached
+    until the user's locations change; only those inside the viewport are returned,
+    so the response size depends on the viewport, not on the number of locations.
+    The cache is filled from the primary, since a lagging replica could miss a
+    location just added and the cache would then keep it missing until it expires.
+
+    Args:
+        user_id (int): The ID of the user
+        zoom (int): Map zoom level, 0 (whole world) to MAX_ZOOM
+        bbox (BBox): Viewport as (west, south, east, north); the whole map if None
+
+    Returns:
+        Dict: zoom, clusters (lat, lng, count, and id and name for single locations),
+              total locations in view and the bounds of all the user's locations
+    """
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+
+    entry = _cluster_cache.get(user_id)
+    if entry is None:
+        with primary():
+            entry = {"bounds": _query_bounds(user_id), "zooms": {}}
+        _cluster_cache.set(user_id, entry)
+
+    if zoom <= MAX_CACHED_ZOOM:
+        cells = entry["zooms"].get(zoom)
+        if cells is None:
+            with primary():
+                cells = entry["zooms"][zoom] = _query_cells(user_id, zoom)
+        if bbox is not None:
+            cells = [cell for cell in cells if _in_bbox(cell["lat"], cell["lng"], bbox)]
+    else:
+        cells = _query_cells(user_id, zoom, bbox)
+
+    cells = sorted(cells, key=lambda cell: cell["count"], reverse=True)[:MAX_CLUSTERS]
+    singles = [cell["id"] for cell in cells if cell["id"] is not None]
+    names = dict(db.session.execute(
+        sa.select(Location.id, Location.name).where(Location.id.in_(singles))
+    ).all()) if singles else {}
+
+    clusters = [dict(cell, name=names.get(cell["id"])) if cell["id"] else dict(cell) for cell in cells]
+    return {
+        "zoom": zoom,
+        "clusters": clusters,
+        "total": sum(cell["count"] for cell in cells),
+        "bounds": entry["bounds"],
+    }
+
+
+def invalidate_clusters(user_id: int) -> None:
+    _cluster_cache.delete(user_id)
+
+
+on_locations_committed(invalidate_clusters)
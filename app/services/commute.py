@@ -0,0 +1,201 @@
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import requests
+
+from ..utils.cache import LRUCache
+from .maps import maps_get
+from .travel import MODES, format_waypoint
+from .usage import check_budget, current_usage_user, usage_user
+
+DAY_SETS = {
+    'weekdays': [0, 1, 2, 3, 4],
+    'weekends': [5, 6],
+    'daily': [0, 1, 2, 3, 4, 5, 6],
+}
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+MAX_SLOTS = 200
+MAX_WORKERS = 8
+
+# Walking and cycling times do not depend on when you leave
+TIME_INDEPENDENT_MODES = {'walking', 'bicycling'}
+
+# Weekly traffic patterns are stable, so a slot stays valid for a week
+_slot_cache = LRUCache(maxsize=20000, ttl=7 * 24 * 60 * 60)
+
+
+def _parse_time(value: str) -> time:
+    try:
+        return datetime.strptime(value, "%H:%M").time()
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+
+
+def build_slots(days: str, start: str, end: str, step_minutes: int,
+                now: datetime) -> List[datetime]:
+    """
+    Returns the departure times of a weekly window, each at its next occurrence
+    after ``now`` (Google only accepts future departure times).
+    
+    Args:
+        days (str): One of "weekdays", "weekends" or "daily"
+        start (str): First departure, "HH:MM"
+        end (str): Last departure, "HH:MM" (inclusive)
+        step_minutes (int): Minutes between departures
+        now (datetime): Timezone-aware current time
+        
+    Returns:
+        List[datetime]: Departure times ordered by weekday, then time of day
+    """
+    if days not in DAY_SETS:
+        raise ValueError(f"Invalid days '{days}', expected one of {', '.join(DAY_SETS)}")
+    if step_minutes < 5:
+        raise ValueError("Step must be at least 5 minutes.")
+    start_time, end_time = _parse_time(start), _parse_time(end)
+    if end_time < start_time:
+        raise ValueError("End time must not be before start time.")
+
+    times = []
+    current = datetime.combine(now.date(), start_time)
+    last = datetime.combine(now.date(), end_time)
+    while current <= last:
+        times.append(current.time())
+        current += timedelta(minutes=step_minutes)
+
+    if len(times) * len(DAY_SETS[days]) > MAX_SLOTS:
+        raise ValueError(f"Window has too many departures (maximum {MAX_SLOTS}).")
+
+    slots = []
+    for weekday in DAY_SETS[days]:
+        days_ahead = (weekday - now.weekday()) % 7
+        for slot_time in times:
+            departure = datetime.combine(now.date() + timedelta(days=days_ahead), slot_time, now.tzinfo)
+            if departure <= now:
+                departure += timedelta(days=7)
+            slots.append(departure)
+    return slots
+
+
+def _fetch_slot_duration(origin: str, destination: str, mode: str,
+                         departure: Optional[datetime]) -> Optional[int]:
+    """
+    Returns the travel time in seconds for one departure, or None if unavailable.
+    """
+    params = {"origins": origin, "destinations": destination, "mode": mode}
+    if departure is not None:
+        params["departure_time"] = int(departure.timestamp())
+        if mode == 'driving':
+            params["traffic_model"] = "best_guess"
+
+    try:
+        data = maps_get("distancematrix/json", params)
+        element = data['rows'][0]['elements'][0]
+        # Driving with a departure time reports the traffic-aware duration separately
+        duration = element.get('duration_in_traffic') or element['duration']
+        return int(duration['value'])
+    except (requests.RequestException, KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def get_commute_profile(origin_coords: Tuple[float, float],
+                        destination_coords: Tuple[float, float],
+                        mode: str, days: str = 'weekdays', start: str = '07:00',
+                        end: str = '10:00', step_minutes: int = 15,
+                        timezone: str = 'Europe/London',
+                        now: Optional[datetime] = None,
+                        origin_place_id: Optional[str] = None,
+                        destination_place_id: Optional[str] = None) -> Dict:
+    """
+    Samples travel times across a weekly departure window, fetching uncached slots
+    concurrently and caching each one.
+    
+    Args:
+        origin_coords: Tuple of (latitude, longitude) for the origin
+        destination_coords: Tuple of (latitude, longitude) for the destination
+        mode (str): One of driving, walking, bicycling, transit
+        days (str): "weekdays", "weekends" or "daily"
+        start (str): First departure of the window, "HH:MM"
+        end (str): Last departure of the window, "HH:MM"
+        step_minutes (int): Minutes between sampled departures
+        timezone (str): Timezone the window is expressed in
+        now (datetime): Override for the current time (for tests)
+        origin_place_id (str): Google place ID of the origin, if known
+        destination_place_id (str): Google place ID of the destination, if known
+        
+    Returns:
+        Dict containing the per-slot series and summary statistics in seconds:
+        {
+            'mode': 'driving',
+            'slots': [{'day': 'Mon', 'time': '07:00', 'departure': '...', 'seconds': 1260}, ...],
+            'min': 1140, 'median': 1500, 'max': 2280,
+            'fetched': 12, 'cached': 36
+        }
+    """
+    if mode not in MODES:
+        raise ValueError(f"Invalid mode '{mode}'")
+    if not origin_coords or not destination_coords:
+        raise ValueError("Both origin and destination coordinates must be provided.")
+
+    now = now or datetime.now(ZoneInfo(timezone))
+    slots = build_slots(days, start, end, step_minutes, now)
+    # Slots are cached by these strings, so prefer stable place IDs
+    origin = format_waypoint(origin_coords, origin_place_id)
+    destination = format_waypoint(destination_coords, destination_place_id)
+
+    def cache_key(departure):
+        if mode in TIME_INDEPENDENT_MODES:
+            return (origin, destination, mode)
+        return (origin, destination, mode, departure.weekday(), departure.strftime("%H:%M"))
+
+    durations = {}
+    missing = {}
+    for departure in slots:
+        key = cache_key(departure)
+        cached = _slot_cache.get(key)
+        if cached is not None:
+            durations[key] = cached
+        elif key not in missing:
+            missing[key] = departure
+
+    if missing:
+        # Pool threads do not see the logged-in user, so usage is attributed explicitly;
+        # checking here also loads the user's budget and usage for the threads
+        user_id = current_usage_user()
+        check_budget(user_id)
+
+        def fetch(item):
+            key, departure = item
+            if mode in TIME_INDEPENDENT_MODES:
+                departure = None
+            with usage_user(user_id):
+                return key, _fetch_slot_duration(origin, destination, mode, departure)
+
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(missing))) as pool:
+            for key, seconds in pool.map(fetch, missing.items()):
+                durations[key] = seconds
+                if seconds is not None:
+                    _slot_cache.set(key, seconds)
+
+    series = []
+    for departure in slots:
+        series.append({
+            'day': DAY_NAMES[departure.weekday()],
+            'time': departure.strftime("%H:%M"),
+            'departure': departure.isoformat(),
+            'seconds': durations.get(cache_key(departure)),
+        })
+
+    values = [slot['seconds'] for slot in series if slot['seconds'] is not None]
+    return {
+        'mode': mode,
+        'slots': series,
+        'min': min(values) if values else None,
+        'median': statistics.median(values) if values else None,
+        'max': max(values) if values else None,
+        'fetched': len(missing),
+        'cached': len(slots) - len(missing),
+    }
@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from ..models import ComparisonHistory, Location, db
+from ..utils.geo import QUANTIZE_PRECISION, from_e7
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+
+LOCATION_FIELDS = ['id', 'name', 'address', 'latitude', 'longitude']
+
+COMPARISON_FIELDS = [
+    'id', 'created_date', 'saved_location_id', 'new_address', 'latitude', 'longitude',
+    'driving_seconds', 'walking_seconds', 'bicycling_seconds', 'transit_seconds',
+]
+
+# Rows fetched per round-trip from the server-side cursor
+YIELD_PER = 500
+
+# Serialized rows are grouped into chunks of roughly this many bytes before being sent
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_locations(user_id: int, after_id: int = 0, limit: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Streams a user's locations in id order without loading them all into memory.
+
+    Args:
+        user_id (int): The ID of the user whose locations are exported
+        after_id (int): Only export locations with a greater id, to resume an export
+        limit (int): Maximum number of locations to export
+
+    Returns:
+        Iterator[Dict]: One dictionary per location with LOCATION_FIELDS
+    """
+    stmt = (
+        select(Location.id, Location.name, Location.address, Location.latitude_e7, Location.longitude_e7)
+        .where(Location.user_id == user_id, Location.id > after_id)
+        .order_by(Location.id)
+        .execution_options(yield_per=YIELD_PER)
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+
+    for row in db.session.execute(stmt):
+        record = dict(row._mapping)
+        record['latitude'] = from_e7(record.pop('latitude_e7'))
+        record['longitude'] = from_e7(record.pop('longitude_e7'))
+        yield record
+
+
+def iter_comparisons(user_id: int, after_id: int = 0, limit: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Streams a user's comparison history in id order, with the quantized coordinates
+    of the compared address as latitude/longitude.
+
+    Args:
+        user_id (int): The ID of the user whose comparisons are exported
+        after_id (int): Only export comparisons with a greater id, to resume an export
+        limit (int): Maximum number of comparisons to export
+
+    Returns:
+        Iterator[Dict]: One dictionary per comparison with COMPARISON_FIELDS
+    """
+    stmt = (
+        select(ComparisonHistory.__table__)
+        .where(ComparisonHistory.user_id == user_id, ComparisonHistory.id > after_id)
+        .order_by(ComparisonHistory.id)
+        .execution_options(yield_per=YIELD_PER)
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+
+    scale = 10 ** QUANTIZE_PRECISION
+    for row in db.session.execute(stmt):
+        record = dict(row._mapping)
+        record['latitude'] = record['new_lat_q'] / scale
+        record['longitude'] = record['new_lng_q'] / scale
+        yield record
+
+
+def _csv_lines(records: Iterable[Dict], fields: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_lines(records: Iterable[Dict], fields: List[str]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps({field: record.get(field) for field in fields}, default=str) + "\n"
+
+
+def _geojson_lines(records: Iterable[Dict], fields: List[str]) -> Iterator[str]:
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    for record in records:
+        feature = {
+            "type": "Feature",
+            "id": record.get('id'),
+            "geometry": {"type": "Point", "coordinates": [record['longitude'], record['latitude']]},
+            "properties": {f: record.get(f) for f in fields if f not in ('latitude', 'longitude')},
+        }
+        yield separator + json.dumps(feature, default=str)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+def serialize(records: Iterable[Dict], fmt: str, fields: List[str]) -> Iterator[bytes]:
+    """
+    Serializes records as CSV, NDJSON or GeoJSON, yielding UTF-8 chunks.
+
+    Args:
+        records (Iterable[Dict]): The records to export
+        fmt (str): One of EXPORT_FORMATS
+        fields (List[str]): Fields to include; GeoJSON uses latitude/longitude as geometry
+
+    Returns:
+        Iterator[bytes]: Chunks of at most about CHUNK_SIZE bytes
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'")
+    lines = {'csv': _csv_lines, 'ndjson': _ndjson_lines, 'geojson': _geojson_lines}[fmt](records, fields)
+
+    pending = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(pending).encode("utf-8")
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip-compresses a stream of chunks incrementally.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,185 @@
+import csv
+import mmap
+import re
+import struct
+import sys
+import unicodedata
+from array import array
+from typing import Dict, Optional
+
+# File layout (native little-endian):
+#   header                      MAGIC, version, count
+#   key_offsets   uint32[n+1]   offsets into the key blob
+#   label_offsets uint32[n+1]   offsets into the label blob
+#   lat_e7        int32[n]      latitude in degrees * 1e7
+#   lng_e7        int32[n]      longitude in degrees * 1e7
+#   key blob, label blob        UTF-8, keys sorted bytewise
+MAGIC = b"NWGZ"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+OFFSET = struct.Struct("<I")
+
+_gazetteer = None
+
+
+def normalize_key(text: str) -> str:
+    """
+    Normalizes a place name or postcode for lookup: accents stripped, uppercase,
+    punctuation removed, and for anything containing a digit (postcodes) spaces
+    removed as well, so that "sw1a 1aa" and "SW1A1AA" share a key, as do "Zürich"
+    and "ZURICH".
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    key = re.sub(r"[\W_]+", " ", text.upper()).strip()
+    if any(c.isdigit() for c in key):
+        key = key.replace(" ", "")
+    return key
+
+
+def build_gazetteer(csv_path: str, output_path: str) -> int:
+    """
+    Compiles a CSV gazetteer into the binary index read by Gazetteer.
+
+    The CSV has columns key, lat, lng and an optional label used as the formatted
+    address; a header row is skipped. The first occurrence of a key wins.
+
+    Args:
+        csv_path (str): The source CSV file
+        output_path (str): Where to write the compiled index
+
+    Returns:
+        int: Number of entries written
+    """
+    entries = {}
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            try:
+                lat, lng = float(row[1]), float(row[2])
+            except ValueError:
+                continue  # Header or malformed row
+            key = normalize_key(row[0])
+            if key and key not in entries:
+                label = row[3].strip() if len(row) > 3 and row[3].strip() else row[0].strip()
+                entries[key.encode("utf-8")] = (round(lat * 1e7), round(lng * 1e7), label.encode("utf-8"))
+
+    keys = sorted(entries)
+    key_offsets, label_offsets = array("I", [0]), array("I", [0])
+    lats, lngs = array("i"), array("i")
+    key_blob, label_blob = bytearray(), bytearray()
+    for key in keys:
+        lat_e7, lng_e7, label = entries[key]
+        key_blob += key
+        label_blob += label
+        key_offsets.append(len(key_blob))
+        label_offsets.append(len(label_blob))
+        lats.append(lat_e7)
+        lngs.append(lng_e7)
+
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+        for arr in (key_offsets, label_offsets, lats, lngs):
+            if sys.byteorder != "little":
+                arr.byteswap()
+            arr.tofile(f)
+        f.write(key_blob)
+        f.write(label_blob)
+
+    return len(keys)
+
+
+class Gazetteer:
+    """
+    Read-only view of a compiled gazetteer file.
+
+    The file is memory-mapped, so opening it costs no parsing and forked workers
+    share its pages through the OS page cache. Lookups binary search the sorted keys.
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < HEADER.size:
+                raise ValueError(f"{path} is not a gazetteer index")
+            magic, version, count = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a gazetteer index")
+            if sys.byteorder != "little":
+                raise ValueError("Gazetteer indexes are only supported on little-endian hosts")
+            arrays = 16 * count + 8
+            if len(self._mmap) < HEADER.size + arrays:
+                raise ValueError(f"{path} is truncated")
+            # The last key and label offsets are the lengths of the two blobs
+            keys_size, = OFFSET.unpack_from(self._mmap, HEADER.size + 4 * count)
+            labels_size, = OFFSET.unpack_from(self._mmap, HEADER.size + 8 * count + 4)
+            if len(self._mmap) < HEADER.size + arrays + keys_size + labels_size:
+                raise ValueError(f"{path} is truncated")
+        except ValueError:
+            self._mmap.close()
+            raise
+
+        self.count = count
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        self._key_offsets = view[offset:offset + 4 * (count + 1)].cast("I")
+        offset += 4 * (count + 1)
+        self._label_offsets = view[offset:offset + 4 * (count + 1)].cast("I")
+        offset += 4 * (count + 1)
+        self._lats = view[offset:offset + 4 * count].cast("i")
+        offset += 4 * count
+        self._lngs = view[offset:offset + 4 * count].cast("i")
+        offset += 4 * count
+        self._keys_start = offset
+        self._labels_start = offset + self._key_offsets[count]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key(self, index: int) -> bytes:
+        start = self._keys_start + self._key_offsets[index]
+        end = self._keys_start + self._key_offsets[index + 1]
+        return self._mmap[start:end]
+
+    def lookup(self, text: str) -> Optional[Dict]:
+        """
+        Returns the entry for a place name or postcode, or None if it is not known.
+
+        Returns:
+            Optional[Dict]: label, lat and lng of the entry
+        """
+        key = normalize_key(text).encode("utf-8")
+        if not key:
+            return None
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self._key(lo) != key:
+            return None
+
+        start = self._labels_start + self._label_offsets[lo]
+        end = self._labels_start + self._label_offsets[lo + 1]
+        return {
+            "label": self._mmap[start:end].decode("utf-8"),
+            "lat": self._lats[lo] / 1e7,
+            "lng": self._lngs[lo] / 1e7,
+        }
+
+
+def load_gazetteer(path: Optional[str]) -> Optional[Gazetteer]:
+    """
+    Opens the gazetteer used by verify_address; passing None disables it.
+    """
+    global _gazetteer
+    _gazetteer = Gazetteer(path) if path else None
+    return _gazetteer
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    return _gazetteer
@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from ..models import ComparisonHistory, Location, db
+from ..utils.geo import quantize
+from ..utils.replicas import read_only
+from .travel import MODES, format_distance, format_duration
+
+# Reuse comparisons for six hours unless configured otherwise
+DEFAULT_REUSE_SECONDS = 6 * 60 * 60
+
+
+@read_only
+def find_recent_comparison(user_id: int, saved_location_id: int,
+                           new_location_coords: Tuple[float, float]) -> Optional[ComparisonHistory]:
+    """
+    Returns the user's most recent comparison of the same pair of places if it is
+    younger than COMPARISON_REUSE_SECONDS, otherwise None.
+    
+    Args:
+        user_id (int): The ID of the user comparing
+        saved_location_id (int): The saved location compared against
+        new_location_coords: Tuple of (latitude, longitude) of the new location
+        
+    Returns:
+        Optional[ComparisonHistory]: The reusable entry, if any
+    """
+    max_age = current_app.config.get('COMPARISON_REUSE_SECONDS', DEFAULT_REUSE_SECONDS)
+    if not max_age:
+        return None
+    lat_q, lng_q = quantize(*new_location_coords)
+    return (
+        ComparisonHistory.query
+        .filter_by(user_id=user_id, saved_location_id=saved_location_id, new_lat_q=lat_q, new_lng_q=lng_q)
+        .filter(ComparisonHistory.created_date >= datetime.utcnow() - timedelta(seconds=max_age))
+        .order_by(ComparisonHistory.created_date.desc())
+        .first()
+    )
+
+
+def record_comparison(user_id: int, saved_location_id: int, new_location_coords: Tuple[float, float],
+                      results: Dict[str, Dict], new_address: Optional[str] = None,
+                      new_query: Optional[str] = None) -> Optional[ComparisonHistory]:
+    """
+    Stores the numeric results of a comparison. Nothing is stored if every mode failed.
+    
+    Args:
+        user_id (int): The ID of the user comparing
+        saved_location_id (int): The saved location compared against
+        new_location_coords: Tuple of (latitude, longitude) of the new location
+        results (Dict): get_travel_times results fetched with include_values=True
+        new_address (str): The verified address of the new location
+        new_query (str): The address as the user typed it
+        
+    Returns:
+        Optional[ComparisonHistory]: The stored entry
+    """
+    values = {}
+    for mode in MODES:
+        result = results.get(mode, {})
+        values[f'{mode}_seconds'] = result.get('duration_value')
+        values[f'{mode}_meters'] = result.get('distance_value')
+    if all(v is None for v in values.values()):
+        return None
+
+    lat_q, lng_q = quantize(*new_location_coords)
+    entry = ComparisonHistory(
+        user_id=user_id,
+        saved_location_id=saved_location_id,
+        new_address=new_address[:255] if new_address else None,
+        new_query=new_query[:255] if new_query else None,
+        new_lat_q=lat_q,
+        new_lng_q=lng_q,
+        **values
+    )
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+def results_from_history(entry: ComparisonHistory) -> Dict[str, Dict[str, str]]:
+    """
+    Rebuilds the get_travel_times result format from a stored comparison.
+    """
+    return {
+        mode: {
+            'duration': format_duration(getattr(entry, f'{mode}_seconds')),
+            'distance': format_distance(getattr(entry, f'{mode}_meters')),
+        }
+        for mode in MODES
+    }
+
+
+@read_only
+def get_location_aggregates(user_id: int) -> List[Dict]:
+    """
+    Returns, per saved location, how often it was compared and the average travel
+    time by mode, aggregated in SQL.
+    
+    Args:
+        user_id (int): The ID of the user
+        
+    Returns:
+        List[Dict]: name, address, comparisons, last_compared and avg_<mode> (seconds)
+    """
+    averages = [func.avg(getattr(ComparisonHistory, f'{mode}_seconds')).label(f'avg_{mode}') for mode in MODES]
+    stmt = (
+        select(
+            Location.id,
+            Location.name,
+            Location.address,
+            func.count(ComparisonHistory.id).label('comparisons'),
+            func.max(ComparisonHistory.created_date).label('last_compared'),
+            *averages
+        )
+        .join(ComparisonHistory, ComparisonHistory.saved_location_id == Location.id)
+        .where(ComparisonHistory.user_id == user_id)
+        .group_by(Location.id, Location.name, Location.address)
+        .order_by(func.count(ComparisonHistory.id).desc())
+    )
+    return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+
+@read_only
+def get_recent_comparisons(user_id: int, limit: int = 50) -> List[Dict]:
+    """
+    Returns the user's most recent comparisons, each annotated using window functions
+    with the average driving and transit time to the same saved location.
+    
+    Args:
+        user_id (int): The ID of the user
+        limit (int): Maximum number of comparisons returned
+        
+    Returns:
+        List[Dict]: Comparison columns plus location_name, location_avg_<mode> and
+                    visit (1 for the latest comparison against that location)
+    """
+    partition = {'partition_by': ComparisonHistory.saved_location_id}
+    ranked = (
+        select(
+            ComparisonHistory,
+            Location.name.label('location_name'),
+            func.avg(ComparisonHistory.driving_seconds).over(**partition).label('location_avg_driving'),
+            func.avg(ComparisonHistory.transit_seconds).over(**partition).label('location_avg_transit'),
+            func.row_number().over(
+                order_by=ComparisonHistory.created_date.desc(), **partition
+            ).label('visit'),
+        )
+        .join(Location, ComparisonHistory.saved_location_id == Location.id)
+        .where(ComparisonHistory.user_id == user_id)
+        .subquery()
+    )
+    stmt = select(ranked).order_by(ranked.c.created_date.desc()).limit(limit)
+    return [dict(row._mapping) for row in db.session.execute(stmt)]
@@ -0,0 +1,33 @@
+import os
+import requests
+from typing import Dict
+
+from .usage import check_budget, record_usage
+
+# Point at the local stand-in (`flask maps-standin`) to develop and test offline
+MAPS_BASE_URL = (os.getenv("GOOGLE_MAPS_BASE_URL") or "https://maps.googleapis.com/maps/api").rstrip("/")
+
+# Seconds before a Google request is abandoned, so a slow API cannot hold a worker
+REQUEST_TIMEOUT = 10
+
+
+def maps_get(path: str, params: Dict) -> Dict:
+    """
+    Calls a Google Maps web service and returns its decoded JSON response.
+    
+    Args:
+        path (str): The service path, e.g. "geocode/json"
+        params (Dict): Query parameters; the API key is added automatically
+        
+    Returns:
+        Dict: The decoded JSON body
+        
+    Raises:
+        requests.RequestException: If the request fails
+        UsageBudgetExceeded: If the current user has used up their daily budget
+    """
+    check_budget()
+    record_usage(path, params)
+    params = dict(params, key=os.environ.get("GOOGLE_API_KEY"))
+    response = requests.get(f"{MAPS_BASE_URL}/{path}", params=params, timeout=REQUEST_TIMEOUT)
+    return response.json()
@@ -0,0 +1,214 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from ..models import GeocodeCacheEntry, TravelTimeCacheEntry, db
+from ..utils.geo import from_e7, quantize, to_e7
+from .autocomplete import normalize_query
+from .travel import MODES
+
+# Addresses rarely move; travel times drift with roadworks and timetables
+DEFAULT_GEOCODE_CACHE_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_TRAVEL_CACHE_SECONDS = 24 * 60 * 60
+
+# Rows per upsert statement, well under SQLite's limit of 999 bound parameters
+UPSERT_ROWS = 100
+
+
+def geocode_key(address: str) -> str:
+    """
+    Returns the cache key of a typed address, so that case and spacing variants share it.
+    """
+    return normalize_query(address)[:255]
+
+
+def is_fresh(updated_date: datetime, config_key: str, default: int, margin: int = 0) -> bool:
+    """
+    Returns True if an entry updated at updated_date is still valid for at least
+    margin more seconds under the lifetime configured as config_key.
+    """
+    max_age = current_app.config.get(config_key, default)
+    return updated_date >= datetime.utcnow() - timedelta(seconds=max_age - margin)
+
+
+def get_cached_geocode(address: str, margin: int = 0) -> Optional[Dict]:
+    """
+    Returns the cached geocoding result of an address in verify_address's format, or
+    None if it was never geocoded or has expired.
+    """
+    entry = db.session.get(GeocodeCacheEntry, geocode_key(address))
+    if entry is None or not is_fresh(entry.updated_date, 'GEOCODE_CACHE_SECONDS',
+                                     DEFAULT_GEOCODE_CACHE_SECONDS, margin):
+        return None
+    return {
+        "formatted_address": entry.formatted_address,
+        "lat": from_e7(entry.latitude_e7),
+        "lng": from_e7(entry.longitude_e7),
+        "place_id": entry.place_id,
+        "types": ["cache"]
+    }
+
+
+def store_geocode(address: str, details: Dict) -> None:
+    """
+    Caches a successful verify_address result for the address typed.
+    """
+    db.session.merge(GeocodeCacheEntry(
+        query_key=geocode_key(address),
+        formatted_address=details['formatted_address'][:255],
+        latitude_e7=to_e7(details['lat']),
+        longitude_e7=to_e7(details['lng']),
+        place_id=details.get('place_id'),
+        updated_date=datetime.utcnow()
+    ))
+    db.session.commit()
+
+
+def get_cached_travel_times(origin_coords: Tuple[float, float], destination: str,
+                            margin: int = 0) -> Dict[str, Dict]:
+    """
+    Returns the unexpired cached travel times from an origin to a destination waypoint.
+
+    Args:
+        origin_coords: Tuple of (latitude, longitude) of the origin, quantized for lookup
+        destination (str): The destination as formatted by format_waypoint
+        margin (int): Treat entries expiring within this many seconds as missing
+
+    Returns:
+        Dict: duration_value and distance_value per cached mode; missing modes are absent
+    """
+    lat_q, lng_q = quantize(*origin_coords)
+    entries = TravelTimeCacheEntry.query.filter_by(
+        origin_lat_q=lat_q, origin_lng_q=lng_q, destination=destination
+    ).all()
+    return {
+        entry.mode: {'duration_value': entry.seconds, 'distance_value': entry.meters}
+        for entry in entries
+        if is_fresh(entry.updated_date, 'TRAVEL_CACHE_SECONDS', DEFAULT_TRAVEL_CACHE_SECONDS, margin)
+    }
+
+
+def store_travel_times(origin_coords: Tuple[float, float], destination: str,
+                       results: Dict[str, Dict]) -> int:
+    """
+    Caches the modes of a get_travel_times(include_values=True) result that Google answered.
+
+    Returns:
+        int: Number of modes stored
+    """
+    lat_q, lng_q = quantize(*origin_coords)
+    now = datetime.utcnow()
+    stored = 0
+    for mode in MODES:
+        result = results.get(mode, {})
+        # Offline estimates are cheap to recompute and must not stand in for Google's
+        if result.get('duration_value') is None or result.get('provider') == 'local':
+            continue
+        db.session.merge(TravelTimeCacheEntry(
+            origin_lat_q=lat_q,
+            origin_lng_q=lng_q,
+            destination=destination[:255],
+            mode=mode,
+            seconds=result['duration_value'],
+            meters=result.get('distance_value'),
+            updated_date=now
+        ))
+        stored += 1
+    db.session.commit()
+    return stored
+
+
+def get_cached_travel_matrix(origins: List[Tuple[float, float]], destinations: List[str],
+                             mode: str) -> Dict[Tuple[int, int], Dict]:
+    """
+    Returns the unexpired cached travel times of one mode between every origin and
+    destination waypoint, with a single query.
+
+    Args:
+        origins: (latitude, longitude) of each origin, quantized for lookup
+        destinations: Each destination as formatted by format_waypoint
+        mode (str): The travel mode
+
+    Returns:
+        Dict: (origin index, destination index) -> duration_value and distance_value;
+              pairs not cached are absent
+    """
+    origin_indexes: Dict[Tuple[int, int], List[int]] = {}
+    for i, coords in enumerate(origins):
+        origin_indexes.setdefault(quantize(*coords), []).append(i)
+    destination_indexes: Dict[str, List[int]] = {}
+    for j, destination in enumerate(destinations):
+        destination_indexes.setdefault(destination[:255], []).append(j)
+
+    entries = TravelTimeCacheEntry.query.filter(
+        TravelTimeCacheEntry.mode == mode,
+        TravelTimeCacheEntry.destination.in_(list(destination_indexes)),
+        TravelTimeCacheEntry.origin_lat_q.in_({lat_q for lat_q, _ in origin_indexes}),
+        TravelTimeCacheEntry.origin_lng_q.in_({lng_q for _, lng_q in origin_indexes}),
+    ).all()
+
+    cached = {}
+    for entry in entries:
+        if not is_fresh(entry.updated_date, 'TRAVEL_CACHE_SECONDS', DEFAULT_TRAVEL_CACHE_SECONDS):
+            continue
+        for i in origin_indexes.get((entry.origin_lat_q, entry.origin_lng_q), ()):
+            for j in destination_indexes[entry.destination]:
+                cached[(i, j)] = {'duration_value': entry.seconds, 'distance_value': entry.meters}
+    return cached
+
+
+def store_travel_matrix(origins: List[Tuple[float, float]], destinations: List[str], mode: str,
+                        values: Dict[Tuple[int, int], Tuple[int, Optional[int]]]) -> int:
+    """
+    Caches travel times answered by Google for (origin index, destination index) pairs.
+
+    Args:
+        values: (origin index, destination index) -> (seconds, meters)
+
+    Returns:
+        int: Number of pairs stored
+    """
+    now = datetime.utcnow()
+    # Keyed like the table, so origins quantized to the same cell do not conflict twice in one statement
+    rows = {}
+    for (i, j), (seconds, meters) in values.items():
+        lat_q, lng_q = quantize(*origins[i])
+        destination = destinations[j][:255]
+        rows[lat_q, lng_q, destination] = {
+            "origin_lat_q": lat_q,
+            "origin_lng_q": lng_q,
+            "destination": destination,
+            "mode": mode,
+            "seconds": seconds,
+            "meters": meters,
+            "updated_date": now,
+        }
+    rows = list(rows.values())
+    for start in range(0, len(rows), UPSERT_ROWS):
+        _upsert_travel_times(rows[start:start + UPSERT_ROWS])
+    db.session.commit()
+    return len(values)
+
+
+def _upsert_travel_times(rows: List[Dict]) -> None:
+    table = TravelTimeCacheEntry.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.origin_lat_q, table.c.origin_lng_q, table.c.destination, table.c.mode],
+            set_={
+                "seconds": stmt.excluded.seconds,
+                "meters": stmt.excluded.meters,
+                "updated_date": stmt.excluded.updated_date,
+            },
+        )
+        db.session.execute(stmt)
+    else:
+        for row in rows:
+            db.session.merge(TravelTimeCacheEntry(**row))
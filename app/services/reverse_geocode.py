@@ -0,0 +1,257 @@
+"""
+Reverse geocoding: turns a coordinate (a map click, a device location) into an address.
+
+Before Google is called, the point is matched against the user's saved locations
+and against addresses geocoded before, by any user, within REVERSE_GEOCODE_RADIUS_M.
+Both are kept in memory by grid cell, so a lookup near one made before only scans
+a few cells and does not touch the database. Google's answers are also stored by the
+quantized point clicked, since the address found can be farther than the radius.
+"""
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+import sqlalchemy as sa
+from flask import current_app
+
+from ..models import GeocodeCacheEntry, Location, db, on_locations_committed
+from ..utils.cache import LRUCache
+from ..utils.geo import (
+    E7, MAX_LATITUDE_E7, MAX_LONGITUDE_E7, QUANTIZE_PRECISION, from_e7, grid_cell, grid_ring, grid_ring_meters,
+    haversine_m, quantize, to_e7
+)
+from .address import PLACEHOLDER_COORDINATES
+from .maps import maps_get
+from .result_cache import DEFAULT_GEOCODE_CACHE_SECONDS, store_geocode
+from .usage import UsageBudgetExceeded
+
+# Cells are about 55 m high, and narrower away from the equator
+CELL_DEGREES = 0.0005
+CELL_E7 = round(CELL_DEGREES * E7)
+
+DEFAULT_RADIUS_M = 25
+
+# Bounds the cells scanned near the poles, where cells become very narrow
+MAX_RINGS = 8
+
+# Geocode cache keys of Google results by the point clicked, quantized to about 11 m
+POINT_KEY_PREFIX = "latlng:"
+
+# cell -> [(lat_e7, lng_e7, details)] of previous geocoding results; an empty list
+# records that the database had none in the cell
+_cell_cache = LRUCache(maxsize=20000, ttl=60 * 60)
+
+# user_id -> {cell: [(lat_e7, lng_e7, details)]} of saved locations; cleared when they change
+_saved_cache = LRUCache(maxsize=1000, ttl=60 * 60)
+
+Point = Tuple[int, int, Dict]
+
+
+def _window(lat: float, lng: float, radius_m: float) -> List[int]:
+    """
+    Returns the cells around a point that contain everything within radius_m of it.
+    """
+    ring_meters = grid_ring_meters(lat, CELL_DEGREES, 1)
+    rings = min(MAX_RINGS, max(1, math.ceil(radius_m / ring_meters))) if ring_meters > 0 else MAX_RINGS
+    return [cell for ring in range(rings + 1) for cell in grid_ring(lat, lng, CELL_DEGREES, ring)]
+
+
+def _nearest(points: Iterable[Point], lat: float, lng: float, radius_m: float) -> Optional[Tuple[Dict, float]]:
+    best, best_meters = None, radius_m
+    for lat_e7, lng_e7, details in points:
+        meters = haversine_m(lat, lng, from_e7(lat_e7), from_e7(lng_e7))
+        if meters <= best_meters:
+            best, best_meters = details, meters
+    return (best, best_meters) if best is not None else None
+
+
+def _saved_cells(user_id: int) -> Dict[int, List[Point]]:
+    cells = _saved_cache.get(user_id)
+    if cells is None:
+        cells = {}
+        rows = db.session.execute(
+            sa.select(Location.id, Location.name, Location.address, Location.place_id,
+                      Location.latitude_e7, Location.longitude_e7)
+            .where(Location.user_id == user_id)
+            .where(~PLACEHOLDER_COORDINATES)
+        )
+        for row in rows:
+            cells.setdefault(grid_cell(row.latitude_e7, row.longitude_e7, CELL_DEGREES), []).append((
+                row.latitude_e7, row.longitude_e7, {
+                    "formatted_address": row.address,
+                    "lat": from_e7(row.latitude_e7),
+                    "lng": from_e7(row.longitude_e7),
+                    "place_id": row.place_id,
+                    "types": ["saved"],
+                    "location_id": row.id,
+                    "name": row.name,
+                }
+            ))
+        _saved_cache.set(user_id, cells)
+    return cells
+
+
+def _entry_details(entry: GeocodeCacheEntry) -> Dict:
+    return {
+        "formatted_address": entry.formatted_address,
+        "lat": from_e7(entry.latitude_e7),
+        "lng": from_e7(entry.longitude_e7),
+        "place_id": entry.place_id,
+        "types": ["cache"],
+    }
+
+
+def _point_key(lat_q: int, lng_q: int) -> str:
+    return f"{POINT_KEY_PREFIX}{lat_q},{lng_q}"
+
+
+def _max_age() -> timedelta:
+    return timedelta(seconds=current_app.config.get('GEOCODE_CACHE_SECONDS', DEFAULT_GEOCODE_CACHE_SECONDS))
+
+
+def _load_cells(cells: List[int]) -> None:
+    """
+    Reads the cached geocoding results in the bounding box of cells into the cell cache.
+    """
+    rows = [cell >> 32 for cell in cells]
+    columns = [cell & 0xFFFFFFFF for cell in cells]
+    stmt = (
+        sa.select(GeocodeCacheEntry)
+        .where(GeocodeCacheEntry.latitude_e7.between(
+            min(rows) * CELL_E7 - MAX_LATITUDE_E7, (max(rows) + 1) * CELL_E7 - MAX_LATITUDE_E7 - 1))
+        .where(GeocodeCacheEntry.longitude_e7.between(
+            min(columns) * CELL_E7 - MAX_LONGITUDE_E7, (max(columns) + 1) * CELL_E7 - MAX_LONGITUDE_E7 - 1))
+        .where(GeocodeCacheEntry.updated_date >= datetime.utcnow() - _max_age())
+        # Results by clicked point duplicate the row stored under their address
+        .where(~GeocodeCacheEntry.query_key.startswith(POINT_KEY_PREFIX))
+    )
+    found: Dict[int, List[Point]] = {cell: [] for cell in cells}
+    for entry in db.session.scalars(stmt):
+        cell = grid_cell(entry.latitude_e7, entry.longitude_e7, CELL_DEGREES)
+        if cell in found:
+            found[cell].append((entry.latitude_e7, entry.longitude_e7, _entry_details(entry)))
+    for cell, points in found.items():
+        _cell_cache.set(cell, points)
+
+
+def _cached_points(cells: List[int]) -> List[Point]:
+    missing = [cell for cell in cells if cell not in _cell_cache]
+    if missing:
+        _load_cells(missing)
+    points: List[Point] = []
+    for cell in cells:
+        points.extend(_cell_cache.get(cell) or ())
+    return points
+
+
+def _stored_point_result(lat: float, lng: float, radius_m: float) -> Optional[Tuple[Dict, float]]:
+    """
+    Finds a Google result stored for a point clicked within radius_m, reading the
+    quantized point and its eight neighbours by key. A result can be farther than the
+    radius from where it was clicked, so the cells of its own coordinates miss it.
+    """
+    lat_q, lng_q = quantize(lat, lng)
+    keys = {_point_key(lat_q + i, lng_q + j): (lat_q + i, lng_q + j) for i in (-1, 0, 1) for j in (-1, 0, 1)}
+    stmt = (
+        sa.select(GeocodeCacheEntry)
+        .where(GeocodeCacheEntry.query_key.in_(keys))
+        .where(GeocodeCacheEntry.updated_date >= datetime.utcnow() - _max_age())
+    )
+    scale = 10 ** (7 - QUANTIZE_PRECISION)
+    points = [(keys[entry.query_key][0] * scale, keys[entry.query_key][1] * scale, _entry_details(entry))
+              for entry in db.session.scalars(stmt)]
+    for point in points:
+        _remember(*point)
+    return _nearest(points, lat, lng, radius_m)
+
+
+def _remember(lat_e7: int, lng_e7: int, details: Dict) -> None:
+    """
+    Adds a geocoding result at a point to its cell, if the cell is cached; otherwise
+    it is read from the database with the rest of the cell when next needed.
+    """
+    points = _cell_cache.get(grid_cell(lat_e7, lng_e7, CELL_DEGREES))
+    if points is not None:
+        points.append((lat_e7, lng_e7, dict(details, types=["cache"])))
+
+
+def reverse_geocode(lat: float, lng: float, user_id: Optional[int] = None,
+                    radius_m: Optional[float] = None) -> Tuple[bool, Dict]:
+    """
+    Finds the address of a point: a saved location of the user or a previously
+    geocoded address within radius_m, otherwise Google's reverse geocoding result.
+    Returns the same (is_valid, details) shape as verify_address.
+
+    Args:
+        lat (float): Latitude of the point
+        lng (float): Longitude of the point
+        user_id (int): Whose saved locations to consider, if any
+        radius_m (float): How close a known address must be; REVERSE_GEOCODE_RADIUS_M by default
+
+    Returns:
+        Tuple[bool, Dict]: (is_valid, details)
+            - details: formatted_address, lat, lng, place_id, types (["saved"] with
+              location_id and name for saved locations, ["cache"] for previous
+              results) and distance_m from the point, or an error message
+
+    Raises:
+        ValueError: If the coordinates are out of range
+        UsageBudgetExceeded: If Google is needed and the user has used up their daily budget
+    """
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Coordinates are out of range")
+    if radius_m is None:
+        radius_m = current_app.config.get('REVERSE_GEOCODE_RADIUS_M', DEFAULT_RADIUS_M)
+
+    cells = _window(lat, lng, radius_m)
+    match = None
+    if user_id is not None:
+        saved = _saved_cells(user_id)
+        match = _nearest((point for cell in cells for point in saved.get(cell, ())), lat, lng, radius_m)
+    if match is None:
+        match = _nearest(_cached_points(cells), lat, lng, radius_m)
+    if match is None:
+        match = _stored_point_result(lat, lng, radius_m)
+    if match is not None:
+        # Measured to the address, which is farther than the match for results remembered at a query point
+        details = match[0]
+        return True, dict(details, distance_m=round(haversine_m(lat, lng, details['lat'], details['lng'])))
+
+    if not os.environ.get("GOOGLE_API_KEY"):
+        return False, {"error": "Google Maps API key not configured"}
+
+    try:
+        data = maps_get("geocode/json", {"latlng": f"{lat:.7f},{lng:.7f}"})
+    except UsageBudgetExceeded:
+        raise
+    except requests.RequestException as e:
+        return False, {"error": f"API request failed: {str(e)}"}
+
+    if data.get('status') != 'OK' or not data.get('results'):
+        return False, {"error": f"Address not found: {data.get('status', 'Unknown error')}"}
+
+    result = data['results'][0]
+    location = result['geometry']['location']
+    details = {
+        "formatted_address": result['formatted_address'],
+        "lat": location['lat'],
+        "lng": location['lng'],
+        "place_id": result.get('place_id'),
+        "types": result.get('types', []),
+    }
+    # Cached under its own address, so typing it in later resolves offline too, and
+    # under the point clicked, which may be farther than the radius from the address
+    store_geocode(details['formatted_address'], details)
+    store_geocode(_point_key(*quantize(lat, lng)), details)
+    _remember(to_e7(details['lat']), to_e7(details['lng']), details)
+    _remember(to_e7(lat), to_e7(lng), details)
+    return True, dict(details, distance_m=round(haversine_m(lat, lng, details['lat'], details['lng'])))
+
+
+def invalidate_saved(user_id: int) -> None:
+    _saved_cache.delete(user_id)
+
+
+on_locations_committed(invalidate_saved)
@@ -0,0 +1,481 @@
+"""
+Offline road routing.
+
+`flask build-road-graph` compiles an OpenStreetMap extract into a road graph for
+driving, walking and cycling. Chains of nodes between junctions are merged into
+single edges, and each mode's edges are stored in compressed sparse row form
+(forward and reverse) in one memory-mapped file. Queries snap coordinates to the
+nearest junction and run Dijkstra over travel time: bidirectional for a single
+pair, one search per origin for a matrix.
+"""
+import bz2
+import gzip
+import heapq
+import struct
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.geo import E7, grid_cell, grid_ring, grid_ring_meters, haversine_m
+from ..utils.packed import PackedFile, write_arrays
+
+try:
+    import osmium
+except ImportError:  # pyosmium is optional, only needed to read .pbf extracts
+    osmium = None
+
+ROUTING_MODES = ("driving", "walking", "bicycling")
+
+# km/h by highway class; classes missing from a mode's table are not routable for it
+DRIVING_SPEEDS = {
+    "motorway": 100, "motorway_link": 60, "trunk": 80, "trunk_link": 50,
+    "primary": 60, "primary_link": 45, "secondary": 50, "secondary_link": 40,
+    "tertiary": 40, "tertiary_link": 35, "unclassified": 30, "residential": 25,
+    "living_street": 10, "service": 15, "road": 25,
+}
+WALKING_SPEEDS = dict(
+    {highway: 5 for highway in DRIVING_SPEEDS if not highway.startswith("motorway")},
+    footway=5, pedestrian=5, path=5, track=5, cycleway=5, bridleway=5, steps=2,
+)
+BICYCLING_SPEEDS = dict(
+    {highway: 16 for highway in DRIVING_SPEEDS if not highway.startswith("motorway")},
+    living_street=10, service=12, cycleway=18, path=12, track=10,
+)
+SPEEDS = {"driving": DRIVING_SPEEDS, "walking": WALKING_SPEEDS, "bicycling": BICYCLING_SPEEDS}
+
+# Tags that override the general access tag for each mode
+ACCESS_TAGS = {
+    "driving": ("motor_vehicle", "motorcar"),
+    "walking": ("foot",),
+    "bicycling": ("bicycle",),
+}
+DENIED = {"no", "private", "agricultural", "forestry", "delivery"}
+ALLOWED = {"yes", "designated", "permissive", "destination"}
+
+# km/h assumed between a coordinate and the junction it is snapped to
+ACCESS_SPEEDS = {"driving": 15, "walking": 5, "bicycling": 12}
+
+# Snapping searches this many rings of grid cells around a coordinate
+CELL_DEGREES = 0.01
+MAX_SNAP_RINGS = 3
+
+# Label of nodes not reached yet, above any real travel time in tenths of a second
+UNREACHED = 2 ** 62
+
+# File layout (native little-endian):
+#   header                      MAGIC, version, node count, edge count per mode
+#   lat_e7, lng_e7  int32[n]    junction coordinates, nodes ordered by grid cell
+#   cells           int64[n]    grid cell of each node, ascending
+#   then per mode, forward then reverse:
+#     offsets       uint32[n+1] first edge of each node
+#     targets       uint32[m]
+#     times         uint32[m]   tenths of a second
+#     lengths       uint32[m]   meters
+MAGIC = b"NWRG"
+VERSION = 1
+HEADER = struct.Struct("<4sII" + "I" * len(ROUTING_MODES))
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _read_osm_xml(path: str) -> Tuple[Dict[int, Tuple[int, int]], List]:
+    nodes, ways = {}, []
+    with _open_text(path) as f:
+        refs, tags = [], {}
+        for _, element in ET.iterparse(f, events=("end",)):
+            tag = element.tag
+            if tag == "node":
+                nodes[int(element.get("id"))] = (round(float(element.get("lat")) * E7),
+                                                 round(float(element.get("lon")) * E7))
+                refs, tags = [], {}
+                element.clear()
+            elif tag == "nd":
+                refs.append(int(element.get("ref")))
+            elif tag == "tag":
+                tags[element.get("k")] = element.get("v")
+            elif tag == "way":
+                if "highway" in tags:
+                    ways.append((refs, tags))
+                refs, tags = [], {}
+                element.clear()
+            elif tag == "relation":
+                refs, tags = [], {}
+                element.clear()
+    return nodes, ways
+
+
+def _read_osm_pbf(path: str) -> Tuple[Dict[int, Tuple[int, int]], List]:
+    if osmium is None:
+        raise ValueError("Reading .pbf extracts requires pyosmium (pip install osmium); "
+                         "convert to .osm XML otherwise")
+    nodes, ways = {}, []
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, node):
+            nodes[node.id] = (round(node.location.lat * E7), round(node.location.lon * E7))
+
+        def way(self, way):
+            if "highway" in way.tags:
+                ways.append(([ref.ref for ref in way.nodes], {tag.k: tag.v for tag in way.tags}))
+
+    Handler().apply_file(path)
+    return nodes, ways
+
+
+def _parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    number, _, unit = value.strip().partition(" ")
+    try:
+        speed = float(number)
+    except ValueError:
+        return None
+    return speed * 1.609 if unit.strip() == "mph" else speed
+
+
+def way_profile(tags: Dict[str, str], mode: str) -> Optional[Tuple[float, bool, bool]]:
+    """
+    Returns (km/h, forward allowed, backward allowed) of a way for a mode, or None
+    if the mode may not use it.
+    """
+    speed = SPEEDS[mode].get(tags.get("highway"))
+    mode_access = next((tags[key] for key in ACCESS_TAGS[mode] if key in tags), None)
+    if (mode_access or tags.get("access")) in DENIED:
+        return None
+    if speed is None:
+        # Other classes only when explicitly open to the mode, e.g. a footway with bicycle=yes
+        if mode_access not in ALLOWED:
+            return None
+        speed = SPEEDS[mode].get("path", 10)
+    if mode == "driving":
+        speed = _parse_maxspeed(tags.get("maxspeed")) or speed
+    if mode == "walking":
+        return speed, True, True
+
+    oneway = tags.get("oneway")
+    if mode == "bicycling" and (tags.get("oneway:bicycle") == "no" or tags.get("cycleway", "").startswith("opposite")):
+        oneway = "no"
+    if oneway is None and (tags.get("junction") in ("roundabout", "circular") or tags.get("highway") == "motorway"):
+        oneway = "yes"
+    if oneway in ("yes", "true", "1"):
+        return speed, True, False
+    if oneway == "-1":
+        return speed, False, True
+    return speed, True, True
+
+
+def _csr(node_count: int, edges: List[Tuple[int, int, int, int]]) -> Tuple[array, ...]:
+    edges.sort()
+    offsets, targets, times, lengths = array("I", [0] * (node_count + 1)), array("I"), array("I"), array("I")
+    for source, target, tenths, meters in edges:
+        offsets[source + 1] += 1
+        targets.append(target)
+        times.append(tenths)
+        lengths.append(meters)
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+    return offsets, targets, times, lengths
+
+
+def build_road_graph(osm_path: str, output_path: str) -> Dict:
+    """
+    Compiles an OpenStreetMap extract (.osm, .osm.gz, .osm.bz2, or .pbf with
+    pyosmium installed) into the road graph file read by RoadGraph.
+
+    Args:
+        osm_path (str): The extract to read
+        output_path (str): Where to write the graph
+
+    Returns:
+        Dict: node count and edge count per mode
+    """
+    if osm_path.endswith(".pbf"):
+        nodes, ways = _read_osm_pbf(osm_path)
+    else:
+        nodes, ways = _read_osm_xml(osm_path)
+
+    profiles = []
+    uses: Dict[int, int] = {}
+    for refs, tags in ways:
+        refs = [ref for ref in refs if ref in nodes]
+        way_profiles = {mode: way_profile(tags, mode) for mode in ROUTING_MODES}
+        if len(refs) < 2 or not any(way_profiles.values()):
+            continue
+        profiles.append((refs, way_profiles))
+        for i, ref in enumerate(refs):
+            # Way ends count twice so that they always become junctions
+            uses[ref] = uses.get(ref, 0) + (2 if i in (0, len(refs) - 1) else 1)
+
+    # Only junctions are kept; the nodes between them are merged into one edge
+    junctions = sorted((ref for ref, count in uses.items() if count > 1), key=lambda ref: grid_cell(*nodes[ref], CELL_DEGREES))
+    index = {ref: i for i, ref in enumerate(junctions)}
+
+    edges: Dict[str, List] = {mode: [] for mode in ROUTING_MODES}
+    for refs, way_profiles in profiles:
+        start, meters = refs[0], 0.0
+        for previous, ref in zip(refs, refs[1:]):
+            meters += haversine_m(*(v / E7 for v in nodes[previous]), *(v / E7 for v in nodes[ref]))
+            if ref not in index:
+                continue
+            for mode, profile in way_profiles.items():
+                if profile is None:
+                    continue
+                speed, forward, backward = profile
+                tenths = max(1, round(meters / (speed / 3.6) * 10))
+                if forward:
+                    edges[mode].append((index[start], index[ref], tenths, round(meters)))
+                if backward:
+                    edges[mode].append((index[ref], index[start], tenths, round(meters)))
+            start, meters = ref, 0.0
+
+    count = len(junctions)
+    lats = array("i", (nodes[ref][0] for ref in junctions))
+    lngs = array("i", (nodes[ref][1] for ref in junctions))
+    cells = array("q", (grid_cell(*nodes[ref], CELL_DEGREES) for ref in junctions))
+    arrays = [lats, lngs, cells]
+    for mode in ROUTING_MODES:
+        arrays.extend(_csr(count, list(edges[mode])))
+        arrays.extend(_csr(count, [(t, s, tenths, meters) for s, t, tenths, meters in edges[mode]]))
+    with open(output_path, "wb") as f:
+        write_arrays(f, HEADER.pack(MAGIC, VERSION, count, *(len(edges[mode]) for mode in ROUTING_MODES)), arrays)
+
+    return {"nodes": count, "edges": {mode: len(edges[mode]) for mode in ROUTING_MODES}}
+
+
+class _ModeGraph:
+    """
+    Forward and reverse CSR arrays of one mode.
+    """
+    def __init__(self, forward, reverse):
+        self.forward = forward
+        self.reverse = reverse
+
+    def routable(self, node: int) -> bool:
+        offsets = self.forward[0]
+        reverse_offsets = self.reverse[0]
+        return offsets[node] != offsets[node + 1] or reverse_offsets[node] != reverse_offsets[node + 1]
+
+
+class RoadGraph:
+    """
+    Read-only view of a road graph file built by build_road_graph.
+
+    The file is memory-mapped, so opening it costs no parsing and forked workers
+    share its pages through the OS page cache.
+    """
+    def __init__(self, path: str):
+        self._file = PackedFile(path, HEADER, MAGIC, VERSION, "road graph")
+        count, *edge_counts = self._file.header
+        take = self._file.take
+        self.node_count = count
+        self._lats = take("i", count)
+        self._lngs = take("i", count)
+        self._cells = take("q", count)
+        self.modes: Dict[str, _ModeGraph] = {}
+        for mode, edges in zip(ROUTING_MODES, edge_counts):
+            forward = (take("I", count + 1), take("I", edges), take("I", edges), take("I", edges))
+            reverse = (take("I", count + 1), take("I", edges), take("I", edges), take("I", edges))
+            self.modes[mode] = _ModeGraph(forward, reverse)
+        self.edge_counts = dict(zip(ROUTING_MODES, edge_counts))
+        self.size_bytes = self._file.size_bytes
+
+    def coordinates(self, node: int) -> Tuple[float, float]:
+        return self._lats[node] / E7, self._lngs[node] / E7
+
+    def nearest_node(self, lat: float, lng: float, mode: str) -> Optional[Tuple[int, float]]:
+        """
+        Returns the nearest junction a mode can use and its distance in meters, or
+        None if there is none within MAX_SNAP_RINGS grid cells.
+        """
+        graph = self.modes[mode]
+        best = None
+        for ring in range(MAX_SNAP_RINGS + 1):
+            for key in grid_ring(lat, lng, CELL_DEGREES, ring):
+                for node in range(bisect_left(self._cells, key), bisect_right(self._cells, key)):
+                    if not graph.routable(node):
+                        continue
+                    meters = haversine_m(lat, lng, *self.coordinates(node))
+                    if best is None or meters < best[1]:
+                        best = (node, meters)
+            # A node in the next ring can still be nearer than one found in this ring
+            if best is not None and best[1] <= grid_ring_meters(lat, CELL_DEGREES, ring):
+                break
+        return best
+
+    def route(self, mode: str, origin: Tuple[float, float],
+              destination: Tuple[float, float]) -> Optional[Dict[str, int]]:
+        """
+        Returns the fastest route between two coordinates with bidirectional Dijkstra.
+
+        Returns:
+            Optional[Dict[str, int]]: seconds and meters, or None if either point is
+                                      off the network or no route connects them
+        """
+        source, target = self.nearest_node(*origin, mode), self.nearest_node(*destination, mode)
+        if source is None or target is None:
+            return None
+        best = self._bidirectional(self.modes[mode], source[0], target[0])
+        return self._result(mode, best, source[1] + target[1])
+
+    def _result(self, mode: str, label: Optional[Tuple[int, int]], access_meters: float) -> Optional[Dict[str, int]]:
+        if label is None:
+            return None
+        tenths = label[0] + round(access_meters / (ACCESS_SPEEDS[mode] / 3.6) * 10)
+        return {"seconds": round(tenths / 10), "meters": round(label[1] + access_meters)}
+
+    def _bidirectional(self, graph: _ModeGraph, source: int, target: int) -> Optional[Tuple[int, int]]:
+        if source == target:
+            return 0, 0
+        # Labels live in flat lists: much faster than dicts for the inner loop
+        n = self.node_count
+        sides = (graph.forward, graph.reverse)
+        times_to = ([UNREACHED] * n, [UNREACHED] * n)
+        meters_to = ([0] * n, [0] * n)
+        settled = (bytearray(n), bytearray(n))
+        times_to[0][source] = times_to[1][target] = 0
+        queues = ([(0, source)], [(0, target)])
+        best_tenths, best_meters = UNREACHED, 0
+        heappush, heappop = heapq.heappush, heapq.heappop
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best_tenths:
+                break
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            queue = queues[side]
+            tenths, node = heappop(queue)
+            done = settled[side]
+            if done[node]:
+                continue
+            done[node] = 1
+            offsets, targets, times, lengths = sides[side]
+            own, own_meters = times_to[side], meters_to[side]
+            other, other_meters = times_to[1 - side], meters_to[1 - side]
+            meters = own_meters[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = tenths + times[edge]
+                if candidate < own[neighbour]:
+                    own[neighbour] = candidate
+                    own_meters[neighbour] = meters + lengths[edge]
+                    heappush(queue, (candidate, neighbour))
+                    if candidate + other[neighbour] < best_tenths:
+                        best_tenths = candidate + other[neighbour]
+                        best_meters = own_meters[neighbour] + other_meters[neighbour]
+        return (best_tenths, best_meters) if best_tenths < UNREACHED else None
+
+    def _one_to_many_nodes(self, graph: _ModeGraph, source: int, targets_wanted: set) -> Tuple[List[int], List[int]]:
+        n = self.node_count
+        times_to, meters_to, settled = [UNREACHED] * n, [0] * n, bytearray(n)
+        times_to[source] = 0
+        remaining = set(targets_wanted)
+        offsets, targets, times, lengths = graph.forward
+        queue = [(0, source)]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        while queue and remaining:
+            tenths, node = heappop(queue)
+            if settled[node]:
+                continue
+            settled[node] = 1
+            remaining.discard(node)
+            meters = meters_to[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = tenths + times[edge]
+                if candidate < times_to[neighbour]:
+                    times_to[neighbour] = candidate
+                    meters_to[neighbour] = meters + lengths[edge]
+                    heappush(queue, (candidate, neighbour))
+        return times_to, meters_to
+
+    def one_to_many(self, mode: str, origin: Tuple[float, float],
+                    destinations: List[Tuple[float, float]]) -> List[Optional[Dict[str, int]]]:
+        """
+        Returns the fastest route from one coordinate to each of several, with one
+        Dijkstra search that stops once every destination is settled.
+        """
+        return self.matrix(mode, [origin], destinations)[0]
+
+    def matrix(self, mode: str, origins: List[Tuple[float, float]],
+               destinations: List[Tuple[float, float]]) -> List[List[Optional[Dict[str, int]]]]:
+        """
+        Returns the routes between every origin and destination, one row per origin.
+        Destinations are snapped once and each origin costs one one-to-many search.
+        """
+        graph = self.modes[mode]
+        snapped = [self.nearest_node(*destination, mode) for destination in destinations]
+        wanted = {target[0] for target in snapped if target is not None}
+        rows = []
+        for origin in origins:
+            source = self.nearest_node(*origin, mode)
+            if source is None:
+                rows.append([None] * len(destinations))
+                continue
+            times_to, meters_to = self._one_to_many_nodes(graph, source[0], wanted)
+            rows.append([
+                self._result(mode, (times_to[target[0]], meters_to[target[0]]), source[1] + target[1])
+                if target is not None and times_to[target[0]] < UNREACHED else None
+                for target in snapped
+            ])
+        return rows
+
+    def close(self):
+        self._file.close()
+
+
+def benchmark(path: str, mode: str = "driving", points: int = 20, seed: int = 0) -> Dict:
+    """
+    Times a points x points matrix and as many single routes between random junctions.
+
+    Returns:
+        Dict: matrix_ms, route_ms (mean per route), routed and unreachable pair counts
+    """
+    import random
+
+    graph = RoadGraph(path)
+    rng = random.Random(seed)
+    candidates = [node for node in range(graph.node_count) if graph.modes[mode].routable(node)]
+    if not candidates:
+        raise ValueError(f"The graph has no {mode} edges")
+    coords = [graph.coordinates(rng.choice(candidates)) for _ in range(points)]
+
+    start = time.perf_counter()
+    rows = graph.matrix(mode, coords, coords)
+    matrix_ms = (time.perf_counter() - start) * 1000
+
+    pairs = list(zip(coords, coords[1:] + coords[:1]))
+    start = time.perf_counter()
+    for origin, destination in pairs:
+        graph.route(mode, origin, destination)
+    route_ms = (time.perf_counter() - start) * 1000 / max(1, len(pairs))
+
+    cells = [cell for row in rows for cell in row]
+    graph.close()
+    return {
+        "matrix_ms": matrix_ms,
+        "route_ms": route_ms,
+        "routed": sum(1 for cell in cells if cell is not None),
+        "unreachable": sum(1 for cell in cells if cell is None),
+    }
+
+
+_road_graph = None
+
+
+def load_road_graph(path: Optional[str]) -> Optional[RoadGraph]:
+    """
+    Opens the road graph used by the local travel provider; passing None disables it.
+    """
+    global _road_graph
+    _road_graph = RoadGraph(path) if path else None
+    return _road_graph
+
+
+def get_road_graph() -> Optional[RoadGraph]:
+    return _road_graph
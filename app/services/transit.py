@@ -0,0 +1,529 @@
+"""
+Offline public transport routing.
+
+`flask build-transit` compiles a GTFS feed into packed arrays of stops, route
+patterns (trips sharing a stop sequence, ordered by departure), their stop times,
+footpath transfers and service calendars, in one memory-mapped file. Queries run
+RAPTOR: each round scans the patterns serving stops improved in the previous
+round, so round k finds the earliest arrivals using k vehicles. One search from
+an origin answers any number of destinations.
+"""
+import csv
+import io
+import math
+import struct
+import time
+import zipfile
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..utils.geo import E7, grid_cell, grid_ring, grid_ring_meters, haversine_m, to_e7
+from ..utils.packed import PackedFile, write_arrays
+
+# Walking between a coordinate and stops, and between nearby stops
+WALK_SPEED_MPS = 1.2
+# Straight-line distances are stretched by this to approximate the streets walked
+WALK_DETOUR = 1.3
+MAX_ACCESS_METERS = 800
+MAX_TRANSFER_METERS = 300
+# Destinations this close may be walked to directly when that is faster
+MAX_WALK_ONLY_METERS = 2000
+
+# At most this many vehicles per journey
+MAX_ROUNDS = 5
+
+CELL_DEGREES = 0.005
+
+UNREACHED = 2 ** 31 - 1
+
+# Trips of the previous service day keep their times past 24:00
+DAY_SECONDS = 24 * 3600
+
+# File layout (native little-endian), stops ordered by grid cell:
+#   header                                   MAGIC, version, then the counts below
+#   stop_lat, stop_lng        int32[S]
+#   stop_cells                int64[S]       ascending
+#   pattern_stop_offsets      uint32[P+1] -> pattern_stops uint32[PS]
+#   pattern_trip_offsets      uint32[P+1]    trips of a pattern are contiguous, by departure
+#   trip_service              uint32[T]
+#   trip_time_offsets         uint32[T]   -> stop_times int32[ST], (arrival, departure) per stop
+#   stop_pattern_offsets      uint32[S+1] -> stop_patterns, stop_positions uint32[SP]
+#   transfer_offsets          uint32[S+1] -> transfer_targets, transfer_seconds uint32[X]
+#   service_start, service_end, service_days  int32[N]  YYYYMMDD, YYYYMMDD, Monday = bit 0
+#   exception_dates, exception_services, exception_types  int32[E]  by date; 1 adds, 2 removes
+MAGIC = b"NWTR"
+VERSION = 1
+HEADER = struct.Struct("<4sI" + "I" * 9)
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def _parse_time(value: str) -> Optional[int]:
+    # GTFS times may pass 24:00:00 for trips running after midnight
+    if not value or not value.strip():
+        return None
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _read_table(feed: zipfile.ZipFile, name: str) -> Iterator[Dict[str, str]]:
+    try:
+        handle = feed.open(name)
+    except KeyError:
+        return
+    with io.TextIOWrapper(handle, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            yield {key.strip(): (value or "").strip() for key, value in row.items() if key}
+
+
+def _walk_seconds(meters: float) -> int:
+    return round(meters * WALK_DETOUR / WALK_SPEED_MPS)
+
+
+def _stop_times_by_trip(feed: zipfile.ZipFile, stop_index: Dict[str, int],
+                        trip_ids: Dict[str, int]) -> Dict[int, List[Tuple[int, int, int, int]]]:
+    trips: Dict[int, List[Tuple[int, int, int, int]]] = {}
+    for row in _read_table(feed, "stop_times.txt"):
+        trip = trip_ids.get(row["trip_id"])
+        stop = stop_index.get(row["stop_id"])
+        if trip is None or stop is None:
+            continue
+        arrival = _parse_time(row.get("arrival_time"))
+        departure = _parse_time(row.get("departure_time"))
+        trips.setdefault(trip, []).append((
+            int(row["stop_sequence"]), stop,
+            arrival if arrival is not None else (departure if departure is not None else -1),
+            departure if departure is not None else (arrival if arrival is not None else -1),
+        ))
+
+    for trip, rows in trips.items():
+        rows.sort()
+        # Stops without times (not timepoints) take the previous stop's departure
+        last = None
+        for i, (sequence, stop, arrival, departure) in enumerate(rows):
+            if arrival < 0:
+                arrival = departure = last if last is not None else 0
+            rows[i] = (sequence, stop, arrival, departure)
+            last = departure
+    return trips
+
+
+def _patterns(trips: Dict[int, List[Tuple[int, int, int, int]]]) -> List[Tuple[Tuple[int, ...], List[int]]]:
+    """
+    Groups trips by stop sequence and then into patterns where no trip overtakes
+    another, which RAPTOR relies on to pick the earliest trip by binary search.
+    """
+    by_stops: Dict[Tuple[int, ...], List[int]] = {}
+    for trip, rows in trips.items():
+        if len(rows) > 1:
+            by_stops.setdefault(tuple(row[1] for row in rows), []).append(trip)
+
+    patterns = []
+    for stops, trip_list in by_stops.items():
+        trip_list.sort(key=lambda trip: [row[3] for row in trips[trip]])
+        groups: List[List[int]] = []
+        for trip in trip_list:
+            times = trips[trip]
+            for group in groups:
+                last = trips[group[-1]]
+                if all(a[2] <= b[2] and a[3] <= b[3] for a, b in zip(last, times)):
+                    group.append(trip)
+                    break
+            else:
+                groups.append([trip])
+        patterns.extend((stops, group) for group in groups)
+    return patterns
+
+
+def build_transit_network(feed_path: str, output_path: str) -> Dict:
+    """
+    Compiles a GTFS feed zip into the network file read by TransitNetwork.
+
+    Footpaths between stops come from transfers.txt and from walking between
+    stops up to MAX_TRANSFER_METERS apart.
+
+    Args:
+        feed_path (str): The GTFS zip
+        output_path (str): Where to write the network
+
+    Returns:
+        Dict: stop, pattern, trip, transfer and service counts
+    """
+    with zipfile.ZipFile(feed_path) as feed:
+        stops = {}
+        for row in _read_table(feed, "stops.txt"):
+            # Stations (location_type 1) only group platforms; trips call at the platforms
+            if row.get("location_type", "0") not in ("", "0") or not row.get("stop_lat"):
+                continue
+            stops[row["stop_id"]] = (to_e7(float(row["stop_lat"])), to_e7(float(row["stop_lon"])))
+        if not stops:
+            raise ValueError(f"{feed_path} has no stops")
+        stop_ids = sorted(stops, key=lambda stop_id: grid_cell(*stops[stop_id], CELL_DEGREES))
+        stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+        services: Dict[str, int] = {}
+        calendar = []
+        for row in _read_table(feed, "calendar.txt"):
+            services[row["service_id"]] = len(calendar)
+            days = sum(1 << i for i, day in enumerate(WEEKDAYS) if row.get(day) == "1")
+            calendar.append((int(row["start_date"]), int(row["end_date"]), days))
+        exceptions = []
+        for row in _read_table(feed, "calendar_dates.txt"):
+            if row["service_id"] not in services:
+                # Services defined only by their dates
+                services[row["service_id"]] = len(calendar)
+                calendar.append((0, 0, 0))
+            exceptions.append((int(row["date"]), services[row["service_id"]], int(row["exception_type"])))
+        exceptions.sort()
+
+        trip_ids, trip_services = {}, []
+        for row in _read_table(feed, "trips.txt"):
+            if row["service_id"] in services:
+                trip_ids[row["trip_id"]] = len(trip_services)
+                trip_services.append(services[row["service_id"]])
+
+        trips = _stop_times_by_trip(feed, stop_index, trip_ids)
+        transfer_rows = list(_read_table(feed, "transfers.txt"))
+
+    patterns = _patterns(trips)
+    pattern_stop_offsets, pattern_stops = array("I", [0]), array("I")
+    pattern_trip_offsets, trip_service, trip_time_offsets = array("I", [0]), array("I"), array("I")
+    stop_times = array("i")
+    serving: List[List[Tuple[int, int]]] = [[] for _ in stop_ids]
+    for p, (sequence, group) in enumerate(patterns):
+        pattern_stops.extend(sequence)
+        pattern_stop_offsets.append(len(pattern_stops))
+        for position, stop in enumerate(sequence):
+            serving[stop].append((p, position))
+        for trip in group:
+            trip_service.append(trip_services[trip])
+            trip_time_offsets.append(len(stop_times))
+            for _, _, arrival, departure in trips[trip]:
+                stop_times.extend((arrival, departure))
+        pattern_trip_offsets.append(len(trip_service))
+
+    stop_pattern_offsets, stop_patterns, stop_positions = array("I", [0]), array("I"), array("I")
+    for entries in serving:
+        for p, position in entries:
+            stop_patterns.append(p)
+            stop_positions.append(position)
+        stop_pattern_offsets.append(len(stop_patterns))
+
+    # Footpaths: walking to nearby stops, overridden by the feed's minimum transfer times
+    lats = array("i", (stops[stop_id][0] for stop_id in stop_ids))
+    lngs = array("i", (stops[stop_id][1] for stop_id in stop_ids))
+    cells = array("q", (grid_cell(lats[i], lngs[i], CELL_DEGREES) for i in range(len(stop_ids))))
+    footpaths: List[Dict[int, int]] = [{} for _ in stop_ids]
+    for stop in range(len(stop_ids)):
+        lat, lng = lats[stop] / E7, lngs[stop] / E7
+        # Cells narrow away from the equator, so more rings are needed to cover the distance
+        rings = math.ceil(MAX_TRANSFER_METERS / max(1.0, grid_ring_meters(lat, CELL_DEGREES, 1)))
+        for ring in range(rings + 1):
+            for key in grid_ring(lat, lng, CELL_DEGREES, ring):
+                for other in range(bisect_left(cells, key), bisect_right(cells, key)):
+                    meters = haversine_m(lat, lng, lats[other] / E7, lngs[other] / E7)
+                    if other != stop and meters <= MAX_TRANSFER_METERS:
+                        footpaths[stop][other] = _walk_seconds(meters)
+    for row in transfer_rows:
+        origin, target = stop_index.get(row.get("from_stop_id")), stop_index.get(row.get("to_stop_id"))
+        if origin is None or target is None or origin == target:
+            continue
+        if row.get("transfer_type") == "3":
+            footpaths[origin].pop(target, None)
+        elif row.get("min_transfer_time"):
+            footpaths[origin][target] = int(float(row["min_transfer_time"]))
+
+    transfer_offsets, transfer_targets, transfer_seconds = array("I", [0]), array("I"), array("I")
+    for paths in footpaths:
+        for target, seconds in sorted(paths.items()):
+            transfer_targets.append(target)
+            transfer_seconds.append(seconds)
+        transfer_offsets.append(len(transfer_targets))
+
+    counts = (len(stop_ids), len(patterns), len(trip_service), len(pattern_stops), len(stop_times),
+              len(stop_patterns), len(transfer_targets), len(calendar), len(exceptions))
+    arrays = [
+        lats, lngs, cells,
+        pattern_stop_offsets, pattern_stops, pattern_trip_offsets, trip_service, trip_time_offsets, stop_times,
+        stop_pattern_offsets, stop_patterns, stop_positions,
+        transfer_offsets, transfer_targets, transfer_seconds,
+        array("i", (c[0] for c in calendar)), array("i", (c[1] for c in calendar)), array("i", (c[2] for c in calendar)),
+        array("i", (e[0] for e in exceptions)), array("i", (e[1] for e in exceptions)),
+        array("i", (e[2] for e in exceptions)),
+    ]
+    with open(output_path, "wb") as f:
+        write_arrays(f, HEADER.pack(MAGIC, VERSION, *counts), arrays)
+
+    return {
+        "stops": len(stop_ids),
+        "patterns": len(patterns),
+        "trips": len(trip_service),
+        "transfers": len(transfer_targets),
+        "services": len(calendar),
+    }
+
+
+class TransitNetwork:
+    """
+    Read-only view of a network file built by build_transit_network.
+    """
+    def __init__(self, path: str):
+        self._file = PackedFile(path, HEADER, MAGIC, VERSION, "transit network")
+        (self.stop_count, self.pattern_count, self.trip_count, pattern_stop_total, stop_time_total,
+         stop_pattern_total, transfer_total, service_count, exception_count) = self._file.header
+        take = self._file.take
+        stops = self.stop_count
+        self._lats = take("i", stops)
+        self._lngs = take("i", stops)
+        self._cells = take("q", stops)
+        self._pattern_stop_offsets = take("I", self.pattern_count + 1)
+        self._pattern_stops = take("I", pattern_stop_total)
+        self._pattern_trip_offsets = take("I", self.pattern_count + 1)
+        self._trip_service = take("I", self.trip_count)
+        self._trip_time_offsets = take("I", self.trip_count)
+        self._stop_times = take("i", stop_time_total)
+        self._stop_pattern_offsets = take("I", stops + 1)
+        self._stop_patterns = take("I", stop_pattern_total)
+        self._stop_positions = take("I", stop_pattern_total)
+        self._transfer_offsets = take("I", stops + 1)
+        self._transfer_targets = take("I", transfer_total)
+        self._transfer_seconds = take("I", transfer_total)
+        self._service_start = take("i", service_count)
+        self._service_end = take("i", service_count)
+        self._service_days = take("i", service_count)
+        self._exception_dates = take("i", exception_count)
+        self._exception_services = take("i", exception_count)
+        self._exception_types = take("i", exception_count)
+        self.service_count = service_count
+        self.size_bytes = self._file.size_bytes
+
+    def coordinates(self, stop: int) -> Tuple[float, float]:
+        return self._lats[stop] / E7, self._lngs[stop] / E7
+
+    def active_services(self, day: date) -> bytearray:
+        """
+        Returns a flag per service telling whether it runs on a date.
+        """
+        key = int(day.strftime("%Y%m%d"))
+        bit = 1 << day.weekday()
+        active = bytearray(
+            1 if self._service_start[i] <= key <= self._service_end[i] and self._service_days[i] & bit else 0
+            for i in range(self.service_count)
+        )
+        for i in range(bisect_left(self._exception_dates, key), bisect_right(self._exception_dates, key)):
+            active[self._exception_services[i]] = 1 if self._exception_types[i] == 1 else 0
+        return active
+
+    def stops_near(self, lat: float, lng: float, max_meters: float = MAX_ACCESS_METERS) -> List[Tuple[int, float]]:
+        """
+        Returns the stops within max_meters of a coordinate and their distances.
+        """
+        rings = math.ceil(max_meters / max(1.0, grid_ring_meters(lat, CELL_DEGREES, 1)))
+        found = []
+        for ring in range(rings + 1):
+            for key in grid_ring(lat, lng, CELL_DEGREES, ring):
+                for stop in range(bisect_left(self._cells, key), bisect_right(self._cells, key)):
+                    meters = haversine_m(lat, lng, *self.coordinates(stop))
+                    if meters <= max_meters:
+                        found.append((stop, meters))
+        return found
+
+    def _earliest_trip_on(self, pattern: int, position: int, at: int, active: bytearray) -> Optional[int]:
+        first, last = self._pattern_trip_offsets[pattern], self._pattern_trip_offsets[pattern + 1]
+        offsets, times, services = self._trip_time_offsets, self._stop_times, self._trip_service
+        index = 2 * position + 1
+        # Departures at a position are ordered across the pattern's trips
+        lo, hi = first, last
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[offsets[mid] + index] < at:
+                lo = mid + 1
+            else:
+                hi = mid
+        for trip in range(lo, last):
+            if active[services[trip]]:
+                return trip
+        return None
+
+    def _earliest_trip(self, pattern: int, position: int, at: int,
+                       days: List[Tuple[bytearray, int]]) -> Optional[Tuple[int, int]]:
+        # days pairs each service day's flags with the shift onto the query day's clock
+        found = None
+        for active, shift in days:
+            trip = self._earliest_trip_on(pattern, position, at - shift, active)
+            if trip is not None:
+                departure = self._stop_times[self._trip_time_offsets[trip] + 2 * position + 1] + shift
+                if found is None or departure < found[0]:
+                    found = (departure, trip, shift)
+        return None if found is None else found[1:]
+
+    def earliest_arrivals(self, sources: Dict[int, int], active: bytearray,
+                          max_rounds: int = MAX_ROUNDS, previous_active: Optional[bytearray] = None) -> List[int]:
+        """
+        Runs RAPTOR from stops reached at given times (seconds after midnight).
+
+        Args:
+            sources (Dict[int, int]): Stop index to the time it is reached
+            active (bytearray): Services running on the query day
+            max_rounds (int): Most trips ridden
+            previous_active (Optional[bytearray]): Services running the day before,
+                whose trips past 24:00 are boarded 24 hours earlier on the query day
+
+        Returns:
+            List[int]: Earliest arrival at every stop, UNREACHED where none
+        """
+        best = [UNREACHED] * self.stop_count
+        previous = [UNREACHED] * self.stop_count
+        for stop, at in sources.items():
+            best[stop] = previous[stop] = min(at, best[stop])
+        marked = set(sources)
+        days = [(active, 0)]
+        if previous_active is not None:
+            days.append((previous_active, -DAY_SECONDS))
+
+        pattern_stop_offsets, pattern_stops = self._pattern_stop_offsets, self._pattern_stops
+        stop_pattern_offsets, stop_patterns, stop_positions = (
+            self._stop_pattern_offsets, self._stop_patterns, self._stop_positions)
+        transfer_offsets, transfer_targets, transfer_seconds = (
+            self._transfer_offsets, self._transfer_targets, self._transfer_seconds)
+        trip_time_offsets, stop_times = self._trip_time_offsets, self._stop_times
+
+        # Walking on from the access stops, so round 1 can board at their neighbours
+        for stop in sources:
+            for i in range(transfer_offsets[stop], transfer_offsets[stop + 1]):
+                target = transfer_targets[i]
+                arrival = best[stop] + transfer_seconds[i]
+                if arrival < best[target]:
+                    best[target] = previous[target] = arrival
+                    marked.add(target)
+
+        for _ in range(max_rounds):
+            # Each pattern is scanned from the first stop improved in the previous round
+            queue: Dict[int, int] = {}
+            for stop in marked:
+                for i in range(stop_pattern_offsets[stop], stop_pattern_offsets[stop + 1]):
+                    pattern, position = stop_patterns[i], stop_positions[i]
+                    if position < queue.get(pattern, UNREACHED):
+                        queue[pattern] = position
+
+            current = list(previous)
+            improved = set()
+            for pattern, start in queue.items():
+                base = pattern_stop_offsets[pattern]
+                trip, times_at, shift = None, 0, 0
+                for position in range(start, pattern_stop_offsets[pattern + 1] - base):
+                    stop = pattern_stops[base + position]
+                    if trip is not None:
+                        arrival = stop_times[times_at + 2 * position] + shift
+                        if arrival < best[stop]:
+                            best[stop] = current[stop] = arrival
+                            improved.add(stop)
+                    boarding = previous[stop]
+                    if boarding < UNREACHED and (
+                            trip is None or boarding <= stop_times[times_at + 2 * position + 1] + shift):
+                        earlier = self._earliest_trip(pattern, position, boarding, days)
+                        if earlier is not None and earlier != (trip, shift):
+                            (trip, shift), times_at = earlier, trip_time_offsets[earlier[0]]
+
+            for stop in list(improved):
+                for i in range(transfer_offsets[stop], transfer_offsets[stop + 1]):
+                    target = transfer_targets[i]
+                    arrival = current[stop] + transfer_seconds[i]
+                    if arrival < best[target]:
+                        best[target] = current[target] = arrival
+                        improved.add(target)
+
+            if not improved:
+                break
+            marked, previous = improved, current
+        return best
+
+    def one_to_many(self, origin: Tuple[float, float], destinations: List[Tuple[float, float]],
+                    departure: datetime, max_rounds: int = MAX_ROUNDS) -> List[Optional[Dict[str, int]]]:
+        """
+        Returns the earliest arrival from one coordinate to each of several when
+        leaving at departure (local time of the feed), with one RAPTOR search.
+        Walking all the way is used when it is faster.
+
+        Returns:
+            List[Optional[Dict[str, int]]]: seconds of travel and walking meters
+                                            at both ends, or None if unreachable
+        """
+        start = departure.hour * 3600 + departure.minute * 60 + departure.second
+        sources = {}
+        for stop, meters in self.stops_near(*origin):
+            at = start + _walk_seconds(meters)
+            if at < sources.get(stop, UNREACHED):
+                sources[stop] = at
+        day = departure.date()
+        arrivals = self.earliest_arrivals(sources, self.active_services(day), max_rounds,
+                                          self.active_services(day - timedelta(days=1))) if sources else None
+
+        results = []
+        for destination in destinations:
+            direct = haversine_m(*origin, *destination)
+            best = (start + _walk_seconds(direct), direct) if direct <= MAX_WALK_ONLY_METERS else None
+            if arrivals is not None:
+                for stop, meters in self.stops_near(*destination):
+                    if arrivals[stop] < UNREACHED:
+                        at = arrivals[stop] + _walk_seconds(meters)
+                        if best is None or at < best[0]:
+                            best = (at, meters)
+            results.append(None if best is None else {"seconds": best[0] - start, "walk_meters": round(best[1])})
+        return results
+
+    def route(self, origin: Tuple[float, float], destination: Tuple[float, float],
+              departure: datetime) -> Optional[Dict[str, int]]:
+        return self.one_to_many(origin, [destination], departure)[0]
+
+    def close(self):
+        self._file.close()
+
+
+def benchmark(path: str, queries: int = 50, destinations: int = 20, departure: Optional[datetime] = None,
+              seed: int = 0) -> Dict:
+    """
+    Times one-to-many queries between random stops of a network.
+
+    Returns:
+        Dict: query_ms (mean per one-to-many query), reached and unreachable counts
+    """
+    import random
+
+    network = TransitNetwork(path)
+    rng = random.Random(seed)
+    departure = departure or datetime.combine(date.today() + timedelta(days=(7 - date.today().weekday()) % 7),
+                                              datetime.min.time()).replace(hour=8)
+    points = [network.coordinates(rng.randrange(network.stop_count)) for _ in range(queries + destinations)]
+    targets = points[queries:]
+
+    start = time.perf_counter()
+    results = [network.one_to_many(origin, targets, departure) for origin in points[:queries]]
+    elapsed = time.perf_counter() - start
+
+    cells = [cell for row in results for cell in row]
+    network.close()
+    return {
+        "query_ms": elapsed * 1000 / max(1, queries),
+        "reached": sum(1 for cell in cells if cell is not None),
+        "unreachable": sum(1 for cell in cells if cell is None),
+        "departure": departure,
+    }
+
+
+_transit_network = None
+
+
+def load_transit_network(path: Optional[str]) -> Optional[TransitNetwork]:
+    """
+    Opens the network used by the local transit provider; passing None disables it.
+    """
+    global _transit_network
+    _transit_network = TransitNetwork(path) if path else None
+    return _transit_network
+
+
+def get_transit_network() -> Optional[TransitNetwork]:
+    return _transit_network
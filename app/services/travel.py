@@ -1,7 +1,37 @@
-import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
 import requests
+from flask import current_app, has_app_context
+
 from ..models import Location
-from typing import Dict, Tuple
+from .maps import maps_get
+from .roads import get_road_graph
+from .transit import get_transit_network
+from typing import Dict, List, Optional, Tuple
+
+MODES = ['driving', 'walking', 'bicycling', 'transit']
+
+# "google" calls the Distance Matrix API, "local" only the offline road graph or
+# transit network, and "auto" falls back to them when Google fails
+TRAVEL_PROVIDERS = ('google', 'local', 'auto')
+
+
+def travel_provider(mode: Optional[str] = None) -> str:
+    """
+    Returns the provider configured for a mode: TRANSIT_PROVIDER for transit,
+    TRAVEL_PROVIDER otherwise, and "google" outside an app context.
+    """
+    if not has_app_context():
+        return 'google'
+    return current_app.config.get('TRANSIT_PROVIDER' if mode == 'transit' else 'TRAVEL_PROVIDER', 'google')
+
+
+def _local_available(mode: str) -> bool:
+    if mode == 'transit':
+        return get_transit_network() is not None
+    graph = get_road_graph()
+    return graph is not None and mode in graph.modes
 
 
 def format_coordinates(lat: float, lng: float) -> str:
@@ -11,15 +41,90 @@ def format_coordinates(lat: float, lng: float) -> str:
     return f"{lat},{lng}"
 
 
+def format_waypoint(coords: Tuple[float, float], place_id: Optional[str] = None) -> str:
+    """
+    Formats a Distance Matrix origin or destination, preferring the place ID when known
+    so that requests (and anything cached by them) key on a stable identifier.
+    """
+    if place_id:
+        return f"place_id:{place_id}"
+    return format_coordinates(*coords)
+
+
+def format_duration(seconds: Optional[int]) -> str:
+    """
+    Formats a duration in seconds the way Google's text fields do, e.g. "1 hour 5 mins".
+    """
+    if seconds is None:
+        return "Unavailable"
+    minutes = max(1, round(seconds / 60))
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes:
+        parts.append(f"{minutes} min{'s' if minutes != 1 else ''}")
+    return " ".join(parts)
+
+
+def format_distance(meters: Optional[int]) -> str:
+    """
+    Formats a distance in meters the way Google's text fields do, e.g. "5.2 km".
+    """
+    if meters is None:
+        return "Unavailable"
+    if meters < 1000:
+        return f"{meters} m"
+    return f"{meters / 1000:.1f} km"
+
+
+def _local_travel_time(origin_coords: Tuple[float, float], destination_coords: Tuple[float, float],
+                       mode: str, include_values: bool) -> Dict:
+    """
+    Routes one mode on the offline road graph, or transit on the transit network
+    leaving now, in the shape get_travel_times returns. Results are marked with
+    'provider' so that they are not cached as Google's. Transit has no distance.
+    """
+    route = None
+    if mode == 'transit' and _local_available(mode):
+        departure = datetime.now(ZoneInfo(current_app.config['COMMUTE_TIMEZONE'])).replace(tzinfo=None)
+        route = get_transit_network().route(origin_coords, destination_coords, departure)
+        route = route and {'seconds': route['seconds'], 'meters': None}
+    elif _local_available(mode):
+        route = get_road_graph().route(mode, origin_coords, destination_coords)
+    result = {
+        'duration': format_duration(route and route['seconds']),
+        'distance': format_distance(route and route['meters']),
+        'provider': 'local',
+    }
+    if include_values:
+        result['duration_value'] = route and route['seconds']
+        result['distance_value'] = route and route['meters']
+    return result
+
+
 def get_travel_times(origin_coords: Tuple[float, float], 
-                    destination_coords: Tuple[float, float]) -> Dict[str, Dict[str, str]]:
+                    destination_coords: Tuple[float, float],
+                    include_values: bool = False,
+                    destination_place_id: Optional[str] = None,
+                    modes: Optional[List[str]] = None) -> Dict[str, Dict]:
     """
     Queries the Google Distance Matrix API for travel times across multiple modes.
     Returns a dictionary with travel durations and distances for each mode.
+
+    With TRAVEL_PROVIDER "local" driving, walking and cycling are routed on the
+    offline road graph instead, and with TRANSIT_PROVIDER "local" transit on the
+    offline transit network; with "auto" only when Google fails. Such results
+    carry 'provider': 'local'.
     
     Args:
         origin_coords: Tuple of (latitude, longitude) for the origin
         destination_coords: Tuple of (latitude, longitude) for the destination
+        include_values: Also return 'duration_value' (seconds) and 'distance_value'
+                        (meters) for each mode, None when unavailable
+        destination_place_id: Google place ID of the destination, used instead of
+                              its coordinates when known
+        modes: Subset of MODES to query, all of them by default
         
     Returns:
         Dict containing travel information for each mode:
@@ -32,56 +137,77 @@ def get_travel_times(origin_coords: Tuple[float, float],
     if not origin_coords or not destination_coords:
         raise ValueError("Both origin and destination coordinates must be provided.")
 
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    modes = ['driving', 'walking', 'bicycling', 'transit']
     results = {}
 
     # Format coordinates for API request
     origin_str = format_coordinates(*origin_coords)
-    dest_str = format_coordinates(*destination_coords)
+    dest_str = format_waypoint(destination_coords, destination_place_id)
 
-    for mode in modes:
-        url = (
-            f"https://maps.googleapis.com/maps/api/distancematrix/json"
-            f"?origins={origin_str}&destinations={dest_str}"
-            f"&mode={mode}&key={api_key}"
-        )
-        response = requests.get(url)
-        data = response.json()
+    for mode in modes or MODES:
+        provider = travel_provider(mode)
+        if provider == 'local':
+            results[mode] = _local_travel_time(origin_coords, destination_coords, mode, include_values)
+            continue
+
+        try:
+            data = maps_get("distancematrix/json", {
+                "origins": origin_str,
+                "destinations": dest_str,
+                "mode": mode,
+            })
+        except requests.RequestException:
+            if provider != 'auto':
+                raise
+            data = {}
 
         if data.get('status') == 'OK':
             try:
-                duration = data['rows'][0]['elements'][0]['duration']['text']
-                distance = data['rows'][0]['elements'][0]['distance']['text']
+                element = data['rows'][0]['elements'][0]
                 results[mode] = {
-                    'duration': duration,
-                    'distance': distance
+                    'duration': element['duration']['text'],
+                    'distance': element['distance']['text']
                 }
+                if include_values:
+                    results[mode]['duration_value'] = element['duration'].get('value')
+                    results[mode]['distance_value'] = element['distance'].get('value')
             except (KeyError, IndexError):
                 results[mode] = {
                     'duration': "Unavailable",
                     'distance': "Unavailable"
                 }
+        elif provider == 'auto' and _local_available(mode):
+            results[mode] = _local_travel_time(origin_coords, destination_coords, mode, include_values)
         else:
             results[mode] = {
                 'duration': "API error",
                 'distance': "API error"
             }
+        if include_values:
+            results[mode].setdefault('duration_value', None)
+            results[mode].setdefault('distance_value', None)
 
     return results
 
 
 def compare_locations(new_location_coords: Tuple[float, float], 
                      saved_location_id: int, 
-                     user_id: int) -> Tuple[Location, Dict[str, Dict[str, str]]]:
+                     user_id: int,
+                     new_address: Optional[str] = None,
+                     new_query: Optional[str] = None) -> Tuple[Location, Dict[str, Dict[str, str]]]:
     """
     Compares travel times between a new location and a saved location using coordinates.
     Returns a tuple: (saved_location, results dict).
     
+    A recent comparison of the same pair from the user's history is reused instead
+    of calling Google, as are travel times cached for the pair by any user or by
+    `flask warm-cache`; fresh results are added to the history and the cache.
+    
     Args:
         new_location_coords: Tuple of (latitude, longitude) for the new location
         saved_location_id: ID of the saved location to compare against
         user_id: ID of the user who owns the saved location
+        new_address: The verified address of the new location, recorded in the history
+        new_query: The address as the user typed it, recorded for `flask warm-cache`
         
     Returns:
         Tuple containing:
@@ -101,16 +227,81 @@ def compare_locations(new_location_coords: Tuple[float, float],
     if not saved_location:
         raise ValueError("Saved location not found or does not belong to user.")
 
-    if not saved_location.latitude or not saved_location.longitude:
+    # Stored coordinates are range-checked by the database; only the placeholder remains
+    if saved_location.latitude_e7 == 0 and saved_location.longitude_e7 == 0:
         raise ValueError("Saved location is missing coordinates.")
 
-    # Validate saved location coordinates
-    if not (-90 <= saved_location.latitude <= 90) or not (-180 <= saved_location.longitude <= 180):
+    from .history import find_recent_comparison, record_comparison, results_from_history
+    from .result_cache import get_cached_travel_times, store_travel_times
+
+    recent = find_recent_comparison(user_id, saved_location.id, new_location_coords)
+    if recent:
+        return saved_location, results_from_history(recent)
+
+    destination_coords = (saved_location.latitude, saved_location.longitude)
+    destination = format_waypoint(destination_coords, saved_location.place_id)
+    results = {
+        mode: {'duration': format_duration(cached['duration_value']),
+               'distance': format_distance(cached['distance_value']), **cached}
+        for mode, cached in get_cached_travel_times(new_location_coords, destination).items()
+    }
+    missing = [mode for mode in MODES if mode not in results]
+    if missing:
+        # Use coordinates for comparison
+        fetched = get_travel_times(
+            new_location_coords,
+            destination_coords,
+            include_values=True,
+            destination_place_id=saved_location.place_id,
+            modes=missing
+        )
+        store_travel_times(new_location_coords, destination, fetched)
+        results.update(fetched)
+    results = {mode: results[mode] for mode in MODES}
+
+    record_comparison(user_id, saved_location.id, new_location_coords, results, new_address, new_query)
+    return saved_location, {
+        mode: {'duration': result['duration'], 'distance': result['distance']}
+        for mode, result in results.items()
+    }
+
+
+def rank_locations_by_transit(user_id: int, origin_coords: Tuple[float, float],
+                              departure: Optional[datetime] = None) -> List[Dict]:
+    """
+    Ranks a user's saved locations by transit time from a point, with a single
+    one-to-many query of the offline transit network.
+
+    Args:
+        user_id: ID of the user whose locations are ranked
+        origin_coords: Tuple of (latitude, longitude) to leave from
+        departure: Local departure time, now by default
+
+    Returns:
+        List of dicts with the location's id, name and address, 'seconds' and
+        'duration', fastest first; unreachable locations come last with None
+    """
+    from .address import PLACEHOLDER_COORDINATES
+
+    network = get_transit_network()
+    if network is None:
+        raise ValueError("No transit network is configured.")
+    lat, lng = origin_coords
+    if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
         raise ValueError("Invalid coordinates")
 
-    # Use coordinates for comparison
-    results = get_travel_times(
-        new_location_coords,
-        (saved_location.latitude, saved_location.longitude)
-    )
-    return saved_location, results
+    departure = departure or datetime.now(ZoneInfo(current_app.config['COMMUTE_TIMEZONE'])).replace(tzinfo=None)
+    locations = Location.query.filter_by(user_id=user_id).filter(~PLACEHOLDER_COORDINATES) \
+        .order_by(Location.id).all()
+    routes = network.one_to_many(origin_coords, [(l.latitude, l.longitude) for l in locations], departure)
+    ranking = [
+        {
+            'id': location.id,
+            'name': location.name,
+            'address': location.address,
+            'seconds': route and route['seconds'],
+            'duration': format_duration(route and route['seconds']),
+        }
+        for location, route in zip(locations, routes)
+    ]
+    return sorted(ranking, key=lambda entry: (entry['seconds'] is None, entry['seconds'] or 0))
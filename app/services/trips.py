@@ -0,0 +1,380 @@
+"""
+Multi-stop trip planning over a user's saved locations.
+
+The N x N travel time matrix for one mode is assembled from the shared travel time
+cache, the offline road graph or transit network when configured, and batched
+Distance Matrix requests for the rest. The visiting order is then solved exactly
+with Held-Karp dynamic programming for up to EXACT_MAX_STOPS stops, and otherwise
+by nearest-neighbour construction improved with 2-opt and Or-opt moves until no
+move helps or TRIP_SOLVER_SECONDS runs out.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import requests
+from flask import current_app
+
+from ..models import Location
+from .maps import maps_get
+from .roads import get_road_graph
+from .transit import get_transit_network
+from .travel import (
+    MODES, _local_available, format_coordinates, format_distance, format_duration, format_waypoint, travel_provider
+)
+from .usage import check_budget, current_usage_user, usage_user
+
+MAX_STOPS = 25
+
+# Held-Karp takes 2^(N-1) * N^2 steps: about a tenth of a second at 13 stops
+EXACT_MAX_STOPS = 13
+
+# Distance Matrix accepts up to 100 elements per request
+BATCH_SIZE = 10
+MAX_WORKERS = 8
+
+DEFAULT_SOLVER_SECONDS = 0.5
+
+# Cost of a leg with no route, so that any order avoiding it is preferred
+UNREACHABLE = 10 ** 9
+
+# Or-opt moves segments of up to this many consecutive stops
+OR_OPT_SEGMENT = 3
+
+Matrix = List[List[Optional[Tuple[int, Optional[int]]]]]
+
+
+def _route_cost(cost: List[List[int]], route: List[int], round_trip: bool) -> int:
+    total = sum(cost[a][b] for a, b in zip(route, route[1:]))
+    return total + cost[route[-1]][route[0]] if round_trip else total
+
+
+def solve_exact(cost: List[List[int]], round_trip: bool = False) -> List[int]:
+    """
+    Returns the cheapest order starting at stop 0 and visiting every stop, by Held-Karp
+    dynamic programming over subsets.
+
+    Args:
+        cost: Square matrix of leg costs, cost[from][to]
+        round_trip (bool): Include the leg back to stop 0
+
+    Returns:
+        List[int]: Stop indexes in visiting order, starting with 0
+    """
+    n = len(cost)
+    if n <= 2:
+        return list(range(n))
+
+    # best[mask][j]: cheapest path from 0 through the stops in mask (bit j - 1 for stop j), ending at j
+    full = 1 << (n - 1)
+    infinity = float("inf")
+    best = [[infinity] * n for _ in range(full)]
+    parent = [[0] * n for _ in range(full)]
+    for j in range(1, n):
+        best[1 << (j - 1)][j] = cost[0][j]
+
+    for mask in range(1, full):
+        row = best[mask]
+        for j in range(1, n):
+            so_far = row[j]
+            if so_far == infinity:
+                continue
+            leg = cost[j]
+            for k in range(1, n):
+                bit = 1 << (k - 1)
+                if mask & bit:
+                    continue
+                value = so_far + leg[k]
+                if value < best[mask | bit][k]:
+                    best[mask | bit][k] = value
+                    parent[mask | bit][k] = j
+
+    last_row = best[full - 1]
+    last = min(range(1, n), key=lambda j: last_row[j] + (cost[j][0] if round_trip else 0))
+    route, mask = [], full - 1
+    while last:
+        route.append(last)
+        mask, last = mask ^ (1 << (last - 1)), parent[mask][last]
+    return [0] + route[::-1]
+
+
+def _nearest_neighbour(cost: List[List[int]]) -> List[int]:
+    route, remaining = [0], set(range(1, len(cost)))
+    while remaining:
+        nearest = min(remaining, key=lambda k: cost[route[-1]][k])
+        route.append(nearest)
+        remaining.remove(nearest)
+    return route
+
+
+def solve_heuristic(cost: List[List[int]], round_trip: bool = False,
+                    deadline: Optional[float] = None) -> Tuple[List[int], bool]:
+    """
+    Builds an order starting at stop 0 by nearest neighbour, then improves it with
+    2-opt (reversing a stretch) and Or-opt (moving up to OR_OPT_SEGMENT consecutive
+    stops elsewhere) until no move helps or the deadline passes. Costs are compared
+    over whole routes, so asymmetric matrices are handled correctly.
+
+    Args:
+        cost: Square matrix of leg costs, cost[from][to]
+        round_trip (bool): Include the leg back to stop 0
+        deadline (float): time.perf_counter() value to stop improving at
+
+    Returns:
+        Tuple[List[int], bool]: The order, and whether it is a local optimum
+                                (False if the deadline cut the search short)
+    """
+    route = _nearest_neighbour(cost)
+    best = _route_cost(cost, route, round_trip)
+    n = len(route)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            if deadline is not None and time.perf_counter() > deadline:
+                return route, False
+            for k in range(i + 1, n):
+                candidate = route[:i] + route[i:k + 1][::-1] + route[k + 1:]
+                value = _route_cost(cost, candidate, round_trip)
+                if value < best:
+                    route, best, improved = candidate, value, True
+
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            for i in range(1, n - length + 1):
+                if deadline is not None and time.perf_counter() > deadline:
+                    return route, False
+                segment, rest = route[i:i + length], route[:i] + route[i + length:]
+                for j in range(1, len(rest) + 1):
+                    if j == i:
+                        continue
+                    candidate = rest[:j] + segment + rest[j:]
+                    value = _route_cost(cost, candidate, round_trip)
+                    if value < best:
+                        route, best, improved = candidate, value, True
+                        break
+    return route, True
+
+
+def _fetch_block(origins: List[str], destinations: List[str], mode: str) -> Optional[List[List]]:
+    """
+    Returns one Distance Matrix block as rows of (seconds, meters) or None per element,
+    or None if the request failed.
+    """
+    try:
+        data = maps_get("distancematrix/json", {
+            "origins": "|".join(origins),
+            "destinations": "|".join(destinations),
+            "mode": mode,
+        })
+        if data.get('status') != 'OK':
+            return None
+        return [
+            [
+                (element['duration']['value'], element.get('distance', {}).get('value'))
+                if element.get('status') == 'OK' else None
+                for element in row['elements']
+            ]
+            for row in data['rows']
+        ]
+    except (requests.RequestException, KeyError, TypeError, ValueError):
+        return None
+
+
+def _google_matrix(coords: List[Tuple[float, float]], waypoints: List[str], mode: str,
+                   missing: List[Tuple[int, int]]) -> Tuple[Dict[Tuple[int, int], Tuple], int, bool]:
+    """
+    Fetches the missing pairs in blocks of up to BATCH_SIZE x BATCH_SIZE, concurrently.
+
+    Returns:
+        Tuple: (pair -> (seconds, meters) or None, requests made, whether any request failed)
+    """
+    by_origin: Dict[int, List[int]] = {}
+    for i, j in missing:
+        by_origin.setdefault(i, []).append(j)
+    origins = sorted(by_origin)
+    blocks = []
+    for start in range(0, len(origins), BATCH_SIZE):
+        block_origins = origins[start:start + BATCH_SIZE]
+        block_destinations = sorted({j for i in block_origins for j in by_origin[i]})
+        for offset in range(0, len(block_destinations), BATCH_SIZE):
+            blocks.append((block_origins, block_destinations[offset:offset + BATCH_SIZE]))
+
+    # Pool threads do not see the logged-in user, so usage is attributed explicitly
+    user_id = current_usage_user()
+    check_budget(user_id)
+
+    def fetch(block):
+        block_origins, block_destinations = block
+        with usage_user(user_id):
+            return block, _fetch_block([format_coordinates(*coords[i]) for i in block_origins],
+                                       [waypoints[j] for j in block_destinations], mode)
+
+    wanted = set(missing)
+    values: Dict[Tuple[int, int], Tuple] = {}
+    failed = False
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(blocks))) as pool:
+        for (block_origins, block_destinations), rows in pool.map(fetch, blocks):
+            if rows is None:
+                failed = True
+                continue
+            for i, row in zip(block_origins, rows):
+                for j, value in zip(block_destinations, row):
+                    # Blocks also cover pairs that were cached or are the same stop
+                    if (i, j) in wanted:
+                        values[(i, j)] = value
+    return values, len(blocks), failed
+
+
+def _local_matrix(coords: List[Tuple[float, float]], mode: str) -> Matrix:
+    if mode == 'transit':
+        network = get_transit_network()
+        departure = datetime.now(ZoneInfo(current_app.config['COMMUTE_TIMEZONE'])).replace(tzinfo=None)
+        return [
+            [route and (route['seconds'], None) for route in network.one_to_many(origin, coords, departure)]
+            for origin in coords
+        ]
+    return [
+        [route and (route['seconds'], route['meters']) for route in row]
+        for row in get_road_graph().matrix(mode, coords, coords)
+    ]
+
+
+def build_travel_matrix(stops: List[Location], mode: str) -> Tuple[Matrix, Dict]:
+    """
+    Returns the travel times between every pair of stops for one mode.
+
+    Cached pairs are reused, the rest fetched from Google in batched requests and
+    cached, or routed offline as get_travel_times would for the configured provider.
+
+    Returns:
+        Tuple: the matrix of (seconds, meters) or None per pair, and counts of the
+               pairs 'cached', 'fetched' and 'local' and the Google 'requests' made
+    """
+    from .result_cache import get_cached_travel_matrix, store_travel_matrix
+
+    coords = [(stop.latitude, stop.longitude) for stop in stops]
+    waypoints = [format_waypoint(c, stop.place_id) for c, stop in zip(coords, stops)]
+    n = len(stops)
+    matrix: Matrix = [[(0, 0) if i == j else None for j in range(n)] for i in range(n)]
+    stats = {'cached': 0, 'fetched': 0, 'local': 0, 'requests': 0}
+
+    provider = travel_provider(mode)
+    if provider == 'local':
+        if not _local_available(mode):
+            raise ValueError(f"No offline network is configured for {mode}.")
+        matrix = _local_matrix(coords, mode)
+        stats['local'] = n * (n - 1)
+        return matrix, stats
+
+    for (i, j), cached in get_cached_travel_matrix(coords, waypoints, mode).items():
+        if i != j:
+            matrix[i][j] = (cached['duration_value'], cached['distance_value'])
+            stats['cached'] += 1
+
+    missing = [(i, j) for i in range(n) for j in range(n) if i != j and matrix[i][j] is None]
+    failed = False
+    if missing:
+        values, stats['requests'], failed = _google_matrix(coords, waypoints, mode, missing)
+        answered = {pair: value for pair, value in values.items() if value is not None}
+        for (i, j), value in answered.items():
+            matrix[i][j] = value
+        stats['fetched'] = len(answered)
+        if answered:
+            store_travel_matrix(coords, waypoints, mode, answered)
+
+    if failed and provider == 'auto' and _local_available(mode):
+        local = _local_matrix(coords, mode)
+        for i, j in missing:
+            if matrix[i][j] is None and local[i][j] is not None:
+                matrix[i][j] = local[i][j]
+                stats['local'] += 1
+    return matrix, stats
+
+
+def plan_trip(user_id: int, location_ids: List[int], mode: str = 'driving',
+              round_trip: bool = False) -> Dict:
+    """
+    Finds the fastest order to visit several saved locations, starting at the first.
+
+    Args:
+        user_id (int): The ID of the user who owns the locations
+        location_ids (List[int]): The stops; the first is where the trip starts
+        mode (str): One of MODES
+        round_trip (bool): Return to the start at the end
+
+    Returns:
+        Dict: stops (id, name, address, lat, lng) in visiting order, legs (from_id,
+              to_id, seconds, meters, duration, distance), total_seconds,
+              total_duration, total_meters, total_distance, method ("exact" or "heuristic"),
+              optimal (False if the heuristic ran out of time), solve_ms and the
+              matrix counts of build_travel_matrix
+
+    Raises:
+        ValueError: If the stops or mode are invalid
+    """
+    if mode not in MODES:
+        raise ValueError(f"Invalid mode '{mode}'")
+    ids = list(dict.fromkeys(location_ids))
+    if len(ids) < 2:
+        raise ValueError("Choose at least two locations.")
+    if len(ids) > MAX_STOPS:
+        raise ValueError(f"A trip can have at most {MAX_STOPS} stops.")
+
+    found = {location.id: location for location in
+             Location.query.filter(Location.user_id == user_id, Location.id.in_(ids))}
+    if len(found) != len(ids):
+        raise ValueError("Saved location not found or does not belong to user.")
+    stops = [found[location_id] for location_id in ids]
+    if any(not stop.latitude_e7 and not stop.longitude_e7 for stop in stops):
+        raise ValueError("Saved location is missing coordinates.")
+
+    matrix, stats = build_travel_matrix(stops, mode)
+    cost = [[UNREACHABLE if value is None else value[0] for value in row] for row in matrix]
+
+    started = time.perf_counter()
+    if len(stops) <= EXACT_MAX_STOPS:
+        order, method, optimal = solve_exact(cost, round_trip), 'exact', True
+    else:
+        seconds = current_app.config.get('TRIP_SOLVER_SECONDS', DEFAULT_SOLVER_SECONDS)
+        order, optimal = solve_heuristic(cost, round_trip, deadline=started + seconds)
+        method = 'heuristic'
+    solve_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    visits = order + [order[0]] if round_trip else order
+    legs = []
+    for a, b in zip(visits, visits[1:]):
+        seconds, meters = matrix[a][b] or (None, None)
+        legs.append({
+            'from_id': stops[a].id,
+            'to_id': stops[b].id,
+            'seconds': seconds,
+            'meters': meters,
+            'duration': format_duration(seconds),
+            'distance': format_distance(meters),
+        })
+    reachable = all(leg['seconds'] is not None for leg in legs)
+    total_seconds = sum(leg['seconds'] for leg in legs) if reachable else None
+    has_meters = reachable and all(leg['meters'] is not None for leg in legs)
+    total_meters = sum(leg['meters'] for leg in legs) if has_meters else None
+
+    return {
+        'mode': mode,
+        'round_trip': round_trip,
+        'stops': [
+            {'id': stops[i].id, 'name': stops[i].name, 'address': stops[i].address,
+             'lat': stops[i].latitude, 'lng': stops[i].longitude}
+            for i in order
+        ],
+        'legs': legs,
+        'total_seconds': total_seconds,
+        'total_duration': format_duration(total_seconds),
+        'total_meters': total_meters,
+        'total_distance': format_distance(total_meters),
+        'method': method,
+        'optimal': optimal,
+        'solve_ms': solve_ms,
+        **stats,
+    }
@@ -0,0 +1,305 @@
+"""
+Per-user ledger of Google Maps API usage.
+
+Every request made through maps_get is counted in memory per day, user, endpoint
+and mode. A background thread flushes the counts every USAGE_FLUSH_SECONDS with
+one batched upsert, so requests never write to the database themselves. Daily
+budgets are checked against the in-memory totals before each request.
+"""
+import atexit
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import requests
+import sqlalchemy as sa
+from flask import has_app_context, has_request_context
+from flask_login import current_user
+
+from ..logger import setup_logger
+from ..models import ApiUsage, User, db
+from ..utils.cache import LRUCache
+
+logger = setup_logger(__name__)
+
+# Requests made outside any user's action (e.g. `flask warm-cache`) are booked here
+SYSTEM_USER_ID = 0
+
+_usage_user: ContextVar[Optional[int]] = ContextVar("usage_user", default=None)
+_lock = threading.Lock()
+# (day, user_id, endpoint, mode) -> requests / elements not yet flushed
+_pending_requests: Counter = Counter()
+_pending_elements: Counter = Counter()
+# (day, user_id) -> requests made today, once loaded from the database
+_used_today: Dict = {}
+_budgets = LRUCache(maxsize=10000, ttl=60)
+_settings = {"app": None, "default_budget": 0, "flush_seconds": 5, "pid": None}
+
+
+class UsageBudgetExceeded(requests.RequestException):
+    """
+    Raised instead of calling Google once a user has spent their daily budget.
+    Callers already treat request exceptions as an unavailable API.
+    """
+
+
+@contextmanager
+def usage_user(user_id: Optional[int]):
+    """
+    Attributes the Google requests made inside the block to a user. Needed in worker
+    threads, which do not see the request's logged-in user.
+    """
+    token = _usage_user.set(user_id)
+    try:
+        yield
+    finally:
+        _usage_user.reset(token)
+
+
+def current_usage_user() -> int:
+    """
+    Returns the user Google requests are currently attributed to.
+    """
+    user_id = _usage_user.get()
+    if user_id is None and has_request_context() and current_user.is_authenticated:
+        user_id = current_user.id
+    return user_id if user_id is not None else SYSTEM_USER_ID
+
+
+def endpoint_name(path: str) -> str:
+    """
+    Returns the API name of a maps_get path, e.g. "distancematrix" for "distancematrix/json".
+    """
+    return path.rsplit("/json", 1)[0]
+
+
+def _budget_for(user_id: int) -> int:
+    budget = _budgets.get(user_id)
+    if budget is None:
+        budget = _settings["default_budget"]
+        if has_app_context():
+            override = db.session.scalar(sa.select(User.api_daily_budget).where(User.id == user_id))
+            budget = budget if override is None else override
+            _budgets.set(user_id, budget)
+    return budget
+
+
+def _used(user_id: int, day: date) -> int:
+    key = (day, user_id)
+    used = _used_today.get(key)
+    if used is None:
+        if not has_app_context():
+            return 0
+        used = db.session.scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(ApiUsage.requests), 0))
+            .where(ApiUsage.day == day, ApiUsage.user_id == user_id)
+        )
+        with _lock:
+            # Include what was counted but not yet flushed
+            used += sum(n for (d, u, _, _), n in _pending_requests.items() if d == day and u == user_id)
+            _used_today[key] = used
+    return used
+
+
+def check_budget(user_id: Optional[int] = None) -> None:
+    """
+    Raises UsageBudgetExceeded if the user has used up their daily request budget.
+    A budget of 0 means unlimited; requests not made for a user are never limited.
+    """
+    user_id = current_usage_user() if user_id is None else user_id
+    if user_id == SYSTEM_USER_ID:
+        return
+    budget = _budget_for(user_id)
+    if budget and _used(user_id, datetime.utcnow().date()) >= budget:
+        raise UsageBudgetExceeded(f"Daily Google Maps budget of {budget} requests used up")
+
+
+def record_usage(path: str, params: Dict, user_id: Optional[int] = None) -> None:
+    """
+    Counts one Google request in memory; Distance Matrix elements are counted too,
+    since they are what Google bills.
+    """
+    user_id = current_usage_user() if user_id is None else user_id
+    day = datetime.utcnow().date()
+    elements = 1
+    if "origins" in params and "destinations" in params:
+        elements = len(str(params["origins"]).split("|")) * len(str(params["destinations"]).split("|"))
+    key = (day, user_id, endpoint_name(path), params.get("mode", ""))
+
+    with _lock:
+        _pending_requests[key] += 1
+        _pending_elements[key] += elements
+        if (day, user_id) in _used_today:
+            _used_today[(day, user_id)] += 1
+    _ensure_flusher()
+
+
+def flush_usage() -> int:
+    """
+    Writes the pending counts to the api_usage table in one batched upsert.
+    Requires an app context.
+
+    Returns:
+        int: Number of rows upserted
+    """
+    with _lock:
+        requests_by_key = dict(_pending_requests)
+        elements_by_key = dict(_pending_elements)
+        _pending_requests.clear()
+        _pending_elements.clear()
+    if not requests_by_key:
+        return 0
+
+    rows = [
+        dict(zip(("day", "user_id", "endpoint", "mode"), key), requests=count, elements=elements_by_key.get(key, 0))
+        for key, count in requests_by_key.items()
+    ]
+    try:
+        _upsert(rows)
+    except sa.exc.SQLAlchemyError:
+        db.session.rollback()
+        logger.exception("Could not flush API usage, will retry")
+        with _lock:
+            _pending_requests.update(requests_by_key)
+            _pending_elements.update(elements_by_key)
+        return 0
+    return len(rows)
+
+
+def _upsert(rows: List[Dict]) -> None:
+    table = ApiUsage.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.user_id, table.c.endpoint, table.c.mode],
+            set_={
+                "requests": table.c.requests + stmt.excluded.requests,
+                "elements": table.c.elements + stmt.excluded.elements,
+            },
+        )
+        db.session.execute(stmt)
+    else:
+        for row in rows:
+            key = (table.c.day == row["day"]) & (table.c.user_id == row["user_id"]) & \
+                  (table.c.endpoint == row["endpoint"]) & (table.c.mode == row["mode"])
+            updated = db.session.execute(table.update().where(key).values(
+                requests=table.c.requests + row["requests"], elements=table.c.elements + row["elements"]
+            ))
+            if not updated.rowcount:
+                db.session.execute(table.insert().values(**row))
+    db.session.commit()
+
+
+def _flush_loop(app, stop: threading.Event, interval: float):
+    while not stop.wait(interval):
+        with app.app_context():
+            flush_usage()
+        # Forget previous days' totals
+        today = datetime.utcnow().date()
+        with _lock:
+            for key in [k for k in _used_today if k[0] != today]:
+                del _used_today[key]
+
+
+def _ensure_flusher():
+    # Started lazily so that each forked worker runs its own flusher
+    if _settings["pid"] == os.getpid() or not _settings["app"] or not _settings["flush_seconds"]:
+        return
+    with _lock:
+        if _settings["pid"] == os.getpid():
+            return
+        _settings["pid"] = os.getpid()
+    thread = threading.Thread(
+        target=_flush_loop, args=(_settings["app"], threading.Event(), _settings["flush_seconds"]),
+        name="usage-flusher", daemon=True
+    )
+    thread.start()
+
+
+def _flush_at_exit():
+    app = _settings["app"]
+    if app is not None and _settings["flush_seconds"] and _pending_requests:
+        with app.app_context():
+            flush_usage()
+
+
+def _reset_after_fork():
+    # Counts made in the preloading parent stay with the parent
+    global _lock
+    _lock = threading.Lock()
+    _pending_requests.clear()
+    _pending_elements.clear()
+    _used_today.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def set_user_budget(user_id: int, budget: Optional[int]) -> None:
+    """
+    Sets a user's daily request budget; None reverts to USAGE_DAILY_BUDGET.
+    """
+    db.session.execute(sa.update(User).where(User.id == user_id).values(api_daily_budget=budget))
+    db.session.commit()
+    _budgets.delete(user_id)
+
+
+def get_usage_report(days: int = 7) -> List[Dict]:
+    """
+    Returns each user's API usage over the last days, heaviest users first.
+
+    Returns:
+        List[Dict]: user_id, email, requests, elements, today, budget and a
+                    per-endpoint (and Distance Matrix per-mode) breakdown of requests
+    """
+    flush_usage()
+    today = datetime.utcnow().date()
+    stmt = (
+        sa.select(
+            ApiUsage.user_id, User.email, ApiUsage.endpoint, ApiUsage.mode,
+            sa.func.sum(ApiUsage.requests).label("requests"),
+            sa.func.sum(ApiUsage.elements).label("elements"),
+            sa.func.sum(sa.case((ApiUsage.day == today, ApiUsage.requests), else_=0)).label("today"),
+        )
+        .outerjoin(User, User.id == ApiUsage.user_id)
+        .where(ApiUsage.day > today - timedelta(days=days))
+        .group_by(ApiUsage.user_id, User.email, ApiUsage.endpoint, ApiUsage.mode)
+    )
+
+    users: Dict[int, Dict] = {}
+    for row in db.session.execute(stmt):
+        entry = users.setdefault(row.user_id, {
+            "user_id": row.user_id,
+            "email": row.email or ("(system)" if row.user_id == SYSTEM_USER_ID else "(deleted)"),
+            "requests": 0, "elements": 0, "today": 0, "endpoints": Counter(),
+        })
+        entry["requests"] += row.requests
+        entry["elements"] += row.elements
+        entry["today"] += row.today
+        entry["endpoints"][f"{row.endpoint} ({row.mode})" if row.mode else row.endpoint] += row.requests
+
+    for user_id, entry in users.items():
+        entry["budget"] = None if user_id == SYSTEM_USER_ID else _budget_for(user_id)
+    return sorted(users.values(), key=lambda entry: entry["requests"], reverse=True)
+
+
+def init_usage(app):
+    """
+    Configures budgets and the flush interval from the app config.
+    """
+    _settings["app"] = app
+    _settings["default_budget"] = app.config.get("USAGE_DAILY_BUDGET", 0)
+    _settings["flush_seconds"] = app.config.get("USAGE_FLUSH_SECONDS", 5)
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,275 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import requests
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from ..logger import setup_logger
+from ..models import ComparisonHistory, Location, MigrationCheckpoint, db
+from ..utils.geo import QUANTIZE_PRECISION, from_e7
+from .address import verify_address
+from .gazetteer import get_gazetteer
+from .result_cache import geocode_key, get_cached_geocode, get_cached_travel_times, store_geocode, store_travel_times
+from .travel import MODES, format_waypoint, get_travel_times
+
+logger = setup_logger(__name__)
+
+WARM_SOURCES = ('history', 'locations')
+
+# Entries that would expire within this many seconds are refreshed too, so a
+# nightly run keeps the next day's comparisons cached
+DEFAULT_REFRESH_MARGIN = 6 * 60 * 60
+
+
+def _travel_item(origin, destination_coords, place_id) -> Dict:
+    return {
+        "kind": "travel",
+        "origin": origin,
+        "destination_coords": destination_coords,
+        "place_id": place_id,
+        "destination": format_waypoint(destination_coords, place_id),
+    }
+
+
+def collect_history_items(days: int = 7, limit: int = 500) -> List[Dict]:
+    """
+    Returns the addresses typed and the (address, saved location) pairs compared
+    most often over the last days, each most popular first.
+
+    Addresses are geocoded as typed, since that is what keys the geocode cache; case
+    and spacing variants are warmed once.
+
+    Args:
+        days (int): How far back to read the comparison history
+        limit (int): Maximum number of addresses, and of pairs
+
+    Returns:
+        List[Dict]: Geocode and travel work items
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    typed = func.count(ComparisonHistory.id).label('typed')
+    queries = db.session.execute(
+        select(ComparisonHistory.new_query, typed)
+        .where(ComparisonHistory.created_date >= since)
+        .where(ComparisonHistory.new_query.isnot(None))
+        .group_by(ComparisonHistory.new_query)
+        .order_by(typed.desc(), ComparisonHistory.new_query)
+        .limit(limit)
+    )
+    items, keys = [], set()
+    for row in queries:
+        if geocode_key(row.new_query) not in keys:
+            keys.add(geocode_key(row.new_query))
+            items.append({"kind": "geocode", "address": row.new_query})
+
+    comparisons = func.count(ComparisonHistory.id).label('comparisons')
+    stmt = (
+        select(
+            ComparisonHistory.new_lat_q,
+            ComparisonHistory.new_lng_q,
+            Location.latitude_e7,
+            Location.longitude_e7,
+            Location.place_id,
+            comparisons
+        )
+        .join(Location, Location.id == ComparisonHistory.saved_location_id)
+        .where(ComparisonHistory.created_date >= since)
+        .group_by(ComparisonHistory.saved_location_id, ComparisonHistory.new_lat_q, ComparisonHistory.new_lng_q,
+                  Location.latitude_e7, Location.longitude_e7, Location.place_id)
+        .order_by(comparisons.desc(), ComparisonHistory.saved_location_id,
+                  ComparisonHistory.new_lat_q, ComparisonHistory.new_lng_q)
+        .limit(limit)
+    )
+
+    scale = 10 ** QUANTIZE_PRECISION
+    for row in db.session.execute(stmt):
+        items.append(_travel_item(
+            (row.new_lat_q / scale, row.new_lng_q / scale),
+            (from_e7(row.latitude_e7), from_e7(row.longitude_e7)),
+            row.place_id
+        ))
+    return items
+
+
+def collect_location_items(limit: int = 500) -> List[Dict]:
+    """
+    Returns the pairs of locations saved by the same user (each way round) up to limit.
+    Saved locations keep only Google's formatted address, not what was typed, so
+    there are no addresses to geocode.
+
+    Returns:
+        List[Dict]: Travel work items
+    """
+    origin, destination = aliased(Location), aliased(Location)
+    stmt = (
+        select(origin.latitude_e7, origin.longitude_e7,
+               destination.latitude_e7.label('dest_lat_e7'), destination.longitude_e7.label('dest_lng_e7'),
+               destination.place_id)
+        .join(destination, (destination.user_id == origin.user_id) & (destination.id != origin.id))
+        .where((origin.latitude_e7 != 0) | (origin.longitude_e7 != 0))
+        .where((destination.latitude_e7 != 0) | (destination.longitude_e7 != 0))
+        .order_by(origin.user_id, origin.id, destination.id)
+        .limit(limit)
+    )
+    return [
+        _travel_item(
+            (from_e7(row.latitude_e7), from_e7(row.longitude_e7)),
+            (from_e7(row.dest_lat_e7), from_e7(row.dest_lng_e7)),
+            row.place_id
+        )
+        for row in db.session.execute(stmt)
+    ]
+
+
+def _missing_modes(item: Dict, margin: int) -> List[str]:
+    cached = get_cached_travel_times(item["origin"], item["destination"], margin)
+    return [mode for mode in MODES if mode not in cached]
+
+
+def cache_coverage(items: List[Dict], margin: int = 0) -> Dict[str, Dict[str, int]]:
+    """
+    Counts how many of the work items are answered by the cache.
+
+    Returns:
+        Dict: cached and total counts for "geocode" (addresses) and "travel" (pair modes)
+    """
+    coverage = {"geocode": {"cached": 0, "total": 0}, "travel": {"cached": 0, "total": 0}}
+    for item in items:
+        if item["kind"] == "geocode":
+            coverage["geocode"]["total"] += 1
+            coverage["geocode"]["cached"] += _geocode_answered(item["address"], margin)
+        else:
+            coverage["travel"]["total"] += len(MODES)
+            coverage["travel"]["cached"] += len(MODES) - len(_missing_modes(item, margin))
+    return coverage
+
+
+def _geocode_answered(address: str, margin: int) -> bool:
+    # Addresses in the gazetteer are resolved offline and never cached
+    gazetteer = get_gazetteer()
+    if gazetteer is not None and gazetteer.lookup(address):
+        return True
+    return get_cached_geocode(address, margin) is not None
+
+
+def _fetch(item: Dict):
+    # Runs in a worker thread without an app context, so verify_address skips the
+    # database cache and asks Google; results are stored by the caller
+    if item["kind"] == "geocode":
+        return verify_address(item["address"])
+    return get_travel_times(item["origin"], item["destination_coords"], include_values=True,
+                            destination_place_id=item["place_id"], modes=item["modes"])
+
+
+def warm_cache(source: str = 'history', days: int = 7, limit: int = 500, budget: int = 1000,
+               workers: int = 4, margin: int = DEFAULT_REFRESH_MARGIN, report_only: bool = False,
+               progress: Optional[Callable[[int, int], None]] = None, restart: bool = False) -> Dict:
+    """
+    Pre-populates the geocode and travel time caches for the most requested
+    addresses and pairs, so the first comparison of the day does not wait on Google.
+
+    Google is called concurrently from a thread pool; results are stored from the
+    calling thread. The checkpoint records how many leading candidates are done, in
+    their deterministic order, after each item; a run that was interrupted or ran out
+    of budget is resumed past them. Once every candidate is done, the next run
+    starts from the first again.
+
+    Args:
+        source (str): "history" for recently compared pairs, "locations" for all saved locations
+        days (int): History window for the "history" source
+        limit (int): Maximum number of pairs considered
+        budget (int): Maximum number of Google requests to make
+        workers (int): Concurrent Google requests
+        margin (int): Also refresh entries expiring within this many seconds
+        report_only (bool): Only report the current coverage
+        progress (Callable): Called with (processed, total) after each item
+        restart (bool): Start from the first candidate even if the last run did not finish
+
+    Returns:
+        Dict: candidates, resumed (candidates skipped as done by an earlier run), planned,
+              warmed, failed, over_budget, requests, budget and the coverage before and
+              after the run (see cache_coverage)
+    """
+    if source not in WARM_SOURCES:
+        raise ValueError(f"Unknown warm-up source '{source}'")
+
+    items = collect_history_items(days, limit) if source == 'history' else collect_location_items(limit)
+    report = {"candidates": len(items), "resumed": 0, "planned": 0, "warmed": 0, "failed": 0, "over_budget": 0,
+              "requests": 0, "budget": budget, "before": cache_coverage(items)}
+    if report_only:
+        report["after"] = report["before"]
+        return report
+
+    checkpoint_name = f"warm_cache_{source}"
+    checkpoint = db.session.get(MigrationCheckpoint, checkpoint_name)
+    if checkpoint is None:
+        checkpoint = MigrationCheckpoint(name=checkpoint_name, last_id=0, processed=0)
+        db.session.add(checkpoint)
+    elif restart or checkpoint.completed:
+        # last_id is the number of leading candidates done
+        checkpoint.last_id = 0
+        checkpoint.processed = 0
+    checkpoint.completed = False
+    db.session.commit()
+
+    # Plan in popularity order until the budget is spent
+    done = [index < checkpoint.last_id for index in range(len(items))]
+    report["resumed"] = min(checkpoint.last_id, len(items))
+    planned = []
+    for index, item in enumerate(items):
+        if done[index]:
+            continue
+        if item["kind"] == "geocode":
+            cost = 0 if _geocode_answered(item["address"], margin) else 1
+        else:
+            item["modes"] = _missing_modes(item, margin)
+            cost = len(item["modes"])
+        if not cost:
+            done[index] = True
+            continue
+        if report["requests"] + cost > budget:
+            report["over_budget"] += 1
+            continue
+        report["requests"] += cost
+        planned.append((index, item))
+    report["planned"] = len(planned)
+
+    def advance():
+        while checkpoint.last_id < len(items) and done[checkpoint.last_id]:
+            checkpoint.last_id += 1
+        checkpoint.updated_date = datetime.utcnow()
+        db.session.commit()
+
+    advance()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(_fetch, item): (index, item) for index, item in planned}
+        for finished, future in enumerate(as_completed(futures), start=1):
+            index, item = futures[future]
+            try:
+                if item["kind"] == "geocode":
+                    is_valid, details = future.result()
+                    warmed = is_valid and "gazetteer" not in details["types"]
+                    if warmed:
+                        store_geocode(item["address"], details)
+                else:
+                    warmed = store_travel_times(item["origin"], item["destination"], future.result()) > 0
+            except requests.RequestException:
+                logger.exception(f"Warm-up request failed for {item}")
+                warmed = False
+
+            report["warmed" if warmed else "failed"] += 1
+            done[index] = True
+            checkpoint.processed += 1
+            advance()
+            if progress:
+                progress(finished, len(planned))
+
+    checkpoint.completed = checkpoint.last_id >= len(items)
+    db.session.commit()
+
+    report["after"] = cache_coverage(items)
+    logger.info(f"Cache warm-up ({source}): warmed {report['warmed']}, failed {report['failed']}, "
+                f"{report['requests']}/{budget} requests")
+    return report
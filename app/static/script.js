@@ -0,0 +1,231 @@
+// Address autocomplete for inputs marked with data-autocomplete="<endpoint url>"
+(function () {
+  var DEBOUNCE_MS = 200;
+  var MIN_QUERY_LENGTH = 3;
+
+  function newSessionToken() {
+    if (window.crypto && crypto.randomUUID) {
+      return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+
+  function attachAutocomplete(input) {
+    var form = input.form;
+    var list = document.getElementById(input.getAttribute('list'));
+    var placeField = form.querySelector('input[name="place_id"]');
+    var tokenField = form.querySelector('input[name="session_token"]');
+    var endpoint = input.getAttribute('data-autocomplete');
+
+    // One token per page view groups every keystroke and the final lookup into a single billing session
+    tokenField.value = newSessionToken();
+
+    var timer = null;
+    var controller = null;
+    var responses = {};   // query -> suggestions, so backspacing never refetches
+    var byDescription = {};
+
+    function render(suggestions) {
+      list.innerHTML = '';
+      suggestions.forEach(function (suggestion) {
+        byDescription[suggestion.description] = suggestion;
+        var option = document.createElement('option');
+        option.value = suggestion.description;
+        if (suggestion.name) {
+          option.label = suggestion.name;
+        }
+        list.appendChild(option);
+      });
+    }
+
+    function fetchSuggestions(query) {
+      if (responses[query]) {
+        render(responses[query]);
+        return;
+      }
+      if (controller) {
+        controller.abort();
+      }
+      controller = window.AbortController ? new AbortController() : null;
+      var url = endpoint + '?q=' + encodeURIComponent(query) +
+        '&session_token=' + encodeURIComponent(tokenField.value);
+      fetch(url, { credentials: 'same-origin', signal: controller && controller.signal })
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          responses[query] = data.suggestions;
+          render(data.suggestions);
+        })
+        .catch(function () { /* aborted or offline: keep the previous suggestions */ });
+    }
+
+    input.addEventListener('input', function () {
+      var chosen = byDescription[input.value];
+      placeField.value = chosen && chosen.place_id ? chosen.place_id : '';
+      if (chosen) {
+        return;
+      }
+
+      clearTimeout(timer);
+      var query = input.value.trim().toLowerCase();
+      if (query.length < MIN_QUERY_LENGTH) {
+        return;
+      }
+      timer = setTimeout(function () { fetchSuggestions(query); }, DEBOUNCE_MS);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    var inputs = document.querySelectorAll('input[data-autocomplete]');
+    Array.prototype.forEach.call(inputs, attachAutocomplete);
+  });
+})();
+
+// Clustered map of saved locations for elements marked with data-clusters="<endpoint url>".
+// Only the clusters inside the viewport are requested, so the payload does not grow with the account.
+(function () {
+  var TILE_SIZE = 256;
+  var MAX_ZOOM = 20;
+  var FETCH_DELAY_MS = 150;
+
+  function project(lat, lng, zoom) {
+    var scale = TILE_SIZE * Math.pow(2, zoom);
+    var sin = Math.sin(Math.max(-85, Math.min(85, lat)) * Math.PI / 180);
+    return {
+      x: (lng + 180) / 360 * scale,
+      y: (0.5 - Math.log((1 + sin) / (1 - sin)) / (4 * Math.PI)) * scale
+    };
+  }
+
+  function unproject(x, y, zoom) {
+    var scale = TILE_SIZE * Math.pow(2, zoom);
+    var n = Math.PI - 2 * Math.PI * y / scale;
+    return {
+      lat: 180 / Math.PI * Math.atan(Math.sinh(n)),
+      lng: x / scale * 360 - 180
+    };
+  }
+
+  function attachClusterMap(element) {
+    var canvas = element.querySelector('canvas');
+    var context = canvas.getContext('2d');
+    var endpoint = element.getAttribute('data-clusters');
+    var view = { lat: 20, lng: 0, zoom: 2 };
+    var clusters = [];
+    var timer = null;
+    var controller = null;
+
+    function origin() {
+      var center = project(view.lat, view.lng, view.zoom);
+      return { x: center.x - canvas.width / 2, y: center.y - canvas.height / 2 };
+    }
+
+    function draw() {
+      var offset = origin();
+      context.clearRect(0, 0, canvas.width, canvas.height);
+      context.font = '12px sans-serif';
+      context.textAlign = 'center';
+      context.textBaseline = 'middle';
+      clusters.forEach(function (cluster) {
+        var point = project(cluster.lat, cluster.lng, view.zoom);
+        var x = point.x - offset.x;
+        var y = point.y - offset.y;
+        var radius = cluster.count > 1 ? 10 + 4 * Math.log(cluster.count) : 6;
+        context.beginPath();
+        context.arc(x, y, radius, 0, 2 * Math.PI);
+        context.fillStyle = cluster.count > 1 ? 'rgba(0, 123, 255, 0.7)' : '#dc3545';
+        context.fill();
+        context.fillStyle = cluster.count > 1 ? '#fff' : '#333';
+        if (cluster.count > 1) {
+          context.fillText(cluster.count, x, y);
+        } else if (cluster.name) {
+          context.fillText(cluster.name, x, y - 14);
+        }
+      });
+    }
+
+    function bbox() {
+      var offset = origin();
+      var northWest = unproject(offset.x, offset.y, view.zoom);
+      var southEast = unproject(offset.x + canvas.width, offset.y + canvas.height, view.zoom);
+      var clamp = function (lng) { return Math.max(-180, Math.min(180, lng)); };
+      return [clamp(northWest.lng), Math.max(-90, southEast.lat), clamp(southEast.lng), Math.min(90, northWest.lat)]
+        .map(function (value) { return value.toFixed(5); }).join(',');
+    }
+
+    function load(fit) {
+      if (controller) {
+        controller.abort();
+      }
+      controller = window.AbortController ? new AbortController() : null;
+      var url = endpoint + '?zoom=' + view.zoom + (fit ? '' : '&bbox=' + bbox());
+      fetch(url, { credentials: 'same-origin', signal: controller && controller.signal })
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (fit && data.bounds) {
+            fitBounds(data.bounds);
+            return load(false);
+          }
+          clusters = data.clusters || [];
+          draw();
+        })
+        .catch(function () { /* aborted by a newer view */ });
+    }
+
+    function scheduleLoad() {
+      draw();
+      clearTimeout(timer);
+      timer = setTimeout(function () { load(false); }, FETCH_DELAY_MS);
+    }
+
+    function fitBounds(bounds) {
+      view.lat = (bounds.north + bounds.south) / 2;
+      view.lng = (bounds.east + bounds.west) / 2;
+      for (view.zoom = MAX_ZOOM; view.zoom > 0; view.zoom--) {
+        var northEast = project(bounds.north, bounds.east, view.zoom);
+        var southWest = project(bounds.south, bounds.west, view.zoom);
+        if (northEast.x - southWest.x < canvas.width * 0.8 && southWest.y - northEast.y < canvas.height * 0.8) {
+          break;
+        }
+      }
+      view.zoom = Math.min(view.zoom, 16);
+    }
+
+    function zoomBy(delta) {
+      var zoom = Math.max(0, Math.min(MAX_ZOOM, view.zoom + delta));
+      if (zoom !== view.zoom) {
+        view.zoom = zoom;
+        scheduleLoad();
+      }
+    }
+
+    var drag = null;
+    canvas.addEventListener('mousedown', function (event) {
+      drag = { x: event.clientX, y: event.clientY, center: project(view.lat, view.lng, view.zoom) };
+    });
+    window.addEventListener('mousemove', function (event) {
+      if (!drag) {
+        return;
+      }
+      var ratio = canvas.width / canvas.getBoundingClientRect().width;
+      var center = unproject(drag.center.x - (event.clientX - drag.x) * ratio,
+                             drag.center.y - (event.clientY - drag.y) * ratio, view.zoom);
+      view.lat = Math.max(-85, Math.min(85, center.lat));
+      view.lng = center.lng;
+      scheduleLoad();
+    });
+    window.addEventListener('mouseup', function () { drag = null; });
+    canvas.addEventListener('wheel', function (event) {
+      event.preventDefault();
+      zoomBy(event.deltaY < 0 ? 1 : -1);
+    }, { passive: false });
+    Array.prototype.forEach.call(element.querySelectorAll('[data-zoom]'), function (button) {
+      button.addEventListener('click', function () { zoomBy(parseInt(button.getAttribute('data-zoom'), 10)); });
+    });
+
+    load(true);
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    Array.prototype.forEach.call(document.querySelectorAll('[data-clusters]'), attachClusterMap);
+  });
+})();
@@ -0,0 +1,247 @@
+"""
+Admission control for expensive endpoints.
+
+Routes listed in ADMISSION_ENDPOINTS fan out into blocking Google requests and can
+hold a worker thread for seconds. Each worker runs at most ADMISSION_MAX_IN_FLIGHT
+of them at once, and at most ADMISSION_PER_USER for one user. When the worker is
+full, a request waits up to ADMISSION_QUEUE_SECONDS for a slot behind no more than
+ADMISSION_MAX_QUEUE others; otherwise it is shed at once with a 503, or a 429 when
+its user is over their own limit, both carrying Retry-After. Every other route
+skips admission, so with more threads than in-flight plus queued slots, cheap
+routes such as login always find a free thread.
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Hashable, Optional
+
+from flask import g, jsonify, make_response, request
+from flask_login import current_user
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Why a request was shed: the status it gets and the message shown
+SHED_REASONS = {
+    "user": (429, "You have too many requests in progress. Please try again shortly."),
+    "busy": (503, "The server is busy. Please try again shortly."),
+    "timeout": (503, "The server is busy. Please try again shortly."),
+}
+
+# Bounds for Retry-After, which is otherwise the endpoint's mean service time
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+_condition = threading.Condition()
+_state = {"in_flight": 0, "waiting": 0, "peak_in_flight": 0, "peak_waiting": 0, "started": datetime.utcnow()}
+# user key -> admitted or waiting requests
+_per_user: Counter = Counter()
+# endpoint -> admitted, queued, shed_* counts and seconds spent waiting / being served
+_stats: Dict[str, Counter] = defaultdict(Counter)
+_settings = {"max_in_flight": 0, "per_user": 0, "queue_seconds": 0.0, "max_queue": 0, "endpoints": {}}
+
+
+def parse_endpoints(entries) -> Dict[str, Optional[frozenset]]:
+    """
+    Parses ADMISSION_ENDPOINTS entries such as "main.commute_profile" (any method)
+    or "POST main.compare_travel" into endpoint -> methods (None for any).
+    """
+    endpoints: Dict[str, Optional[frozenset]] = {}
+    for entry in entries:
+        parts = entry.split()
+        if len(parts) == 1:
+            endpoints[parts[0]] = None
+        elif len(parts) == 2:
+            methods = endpoints.get(parts[1], frozenset())
+            if methods is not None:
+                endpoints[parts[1]] = methods | {parts[0].upper()}
+        else:
+            raise ValueError(f"Invalid admission endpoint '{entry}'")
+    return endpoints
+
+
+def admit(user_key: Hashable, endpoint: str) -> Optional[str]:
+    """
+    Takes an in-flight slot for a request, waiting for one if the worker is full.
+
+    Args:
+        user_key (Hashable): Whom the request counts against
+        endpoint (str): The endpoint, for the statistics
+
+    Returns:
+        Optional[str]: None once admitted, otherwise the key of SHED_REASONS it was shed for
+    """
+    max_in_flight = _settings["max_in_flight"]
+    stats = _stats[endpoint]
+    with _condition:
+        # Waiting requests count against their user too, so one user cannot fill the queue
+        if _settings["per_user"] and _per_user[user_key] >= _settings["per_user"]:
+            stats["shed_user"] += 1
+            return "user"
+
+        # Queue behind earlier waiters even if a slot just freed, to keep arrivals in order
+        if _state["in_flight"] >= max_in_flight or _state["waiting"]:
+            if _state["waiting"] >= _settings["max_queue"] or not _settings["queue_seconds"]:
+                stats["shed_busy"] += 1
+                return "busy"
+
+            _per_user[user_key] += 1
+            _state["waiting"] += 1
+            _state["peak_waiting"] = max(_state["peak_waiting"], _state["waiting"])
+            stats["queued"] += 1
+            started = time.perf_counter()
+            admitted = _condition.wait_for(lambda: _state["in_flight"] < max_in_flight, _settings["queue_seconds"])
+            _state["waiting"] -= 1
+            stats["wait_seconds"] += time.perf_counter() - started
+            if not admitted:
+                _release_user(user_key)
+                stats["shed_timeout"] += 1
+                return "timeout"
+        else:
+            _per_user[user_key] += 1
+
+        _state["in_flight"] += 1
+        _state["peak_in_flight"] = max(_state["peak_in_flight"], _state["in_flight"])
+        stats["admitted"] += 1
+    return None
+
+
+def _release_user(user_key: Hashable) -> None:
+    _per_user[user_key] -= 1
+    if _per_user[user_key] <= 0:
+        del _per_user[user_key]
+
+
+def release(user_key: Hashable, endpoint: str, seconds: float) -> None:
+    """
+    Frees the slot taken by admit and records how long the request held it.
+    """
+    with _condition:
+        _state["in_flight"] -= 1
+        _release_user(user_key)
+        stats = _stats[endpoint]
+        stats["completed"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        _condition.notify()
+
+
+def retry_after(endpoint: str) -> int:
+    """
+    Returns the seconds a shed client should wait: the endpoint's mean service time,
+    after which a slot has most likely freed up.
+    """
+    stats = _stats.get(endpoint) or Counter()
+    mean = stats["seconds"] / stats["completed"] if stats["completed"] else 0
+    return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(mean)))
+
+
+def get_admission_stats() -> Dict:
+    """
+    Returns this worker's limits, current load and per-endpoint shedding statistics.
+    """
+    with _condition:
+        endpoints = []
+        for endpoint, stats in sorted(_stats.items()):
+            shed = stats["shed_user"] + stats["shed_busy"] + stats["shed_timeout"]
+            arrived = stats["admitted"] + shed
+            endpoints.append({
+                "endpoint": endpoint,
+                "admitted": stats["admitted"],
+                "queued": stats["queued"],
+                "shed_user": stats["shed_user"],
+                "shed_busy": stats["shed_busy"],
+                "shed_timeout": stats["shed_timeout"],
+                "shed_rate": round(shed / arrived, 3) if arrived else 0.0,
+                "mean_wait_ms": round(stats["wait_seconds"] / stats["queued"] * 1000) if stats["queued"] else 0,
+                "mean_ms": round(stats["seconds"] / stats["completed"] * 1000) if stats["completed"] else 0,
+                "max_ms": round(stats["max_seconds"] * 1000),
+            })
+        return {
+            "pid": os.getpid(),
+            "started": _state["started"].isoformat(timespec="seconds"),
+            "limits": {
+                "max_in_flight": _settings["max_in_flight"],
+                "per_user": _settings["per_user"],
+                "max_queue": _settings["max_queue"],
+                "queue_seconds": _settings["queue_seconds"],
+            },
+            "in_flight": _state["in_flight"],
+            "waiting": _state["waiting"],
+            "peak_in_flight": _state["peak_in_flight"],
+            "peak_waiting": _state["peak_waiting"],
+            "users": len(_per_user),
+            "endpoints": endpoints,
+        }
+
+
+def _reset_after_fork():
+    # Each forked worker admits requests against its own threads
+    global _condition
+    _condition = threading.Condition()
+    _per_user.clear()
+    _stats.clear()
+    _state.update(in_flight=0, waiting=0, peak_in_flight=0, peak_waiting=0, started=datetime.utcnow())
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _limited_endpoint() -> Optional[str]:
+    endpoints = _settings["endpoints"]
+    if request.endpoint not in endpoints:
+        return None
+    methods = endpoints[request.endpoint]
+    return request.endpoint if methods is None or request.method in methods else None
+
+
+def _shed_response(reason: str, endpoint: str):
+    status, message = SHED_REASONS[reason]
+    logger.warning(f"Shed {request.method} {request.path} ({reason}): {_state['in_flight']} in flight, "
+                   f"{_state['waiting']} waiting")
+    if request.path.startswith("/api/") or request.accept_mimetypes.best == "application/json":
+        response = jsonify(error=message)
+    else:
+        response = make_response(message)
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after(endpoint))
+    return response
+
+
+def init_admission(app):
+    """
+    Limits the endpoints in ADMISSION_ENDPOINTS; ADMISSION_MAX_IN_FLIGHT = 0 disables admission control.
+    """
+    _settings.update(
+        max_in_flight=app.config.get("ADMISSION_MAX_IN_FLIGHT", 0),
+        per_user=app.config.get("ADMISSION_PER_USER", 0),
+        queue_seconds=app.config.get("ADMISSION_QUEUE_SECONDS", 0.0),
+        max_queue=app.config.get("ADMISSION_MAX_QUEUE", 0),
+        endpoints=parse_endpoints(app.config.get("ADMISSION_ENDPOINTS", [])),
+    )
+    if not _settings["max_in_flight"]:
+        return
+
+    @app.before_request
+    def admit_request():
+        endpoint = _limited_endpoint()
+        if endpoint is None:
+            return None
+        user_key = current_user.id if current_user.is_authenticated else f"ip:{request.remote_addr}"
+        reason = admit(user_key, endpoint)
+        if reason:
+            return _shed_response(reason, endpoint)
+        g.admission = (user_key, endpoint, time.perf_counter())
+
+    @app.teardown_request
+    def release_request(exc):
+        # Runs after streamed responses finish too, so exports hold their slot until done
+        admission = g.pop("admission", None)
+        if admission is not None:
+            user_key, endpoint, started = admission
+            release(user_key, endpoint, time.perf_counter() - started)
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from typing import Dict, Optional
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Binary formats (png, ico, ...) are already compressed or too small to benefit
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".map"}
+
+# Precompressed variants in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def fingerprint(path: str, length: int = 10) -> str:
+    """
+    Returns a short content hash for the file at the given path.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def build_assets(static_folder: str) -> Dict[str, str]:
+    """
+    Copies every static file to a content-hashed name under ``dist/`` and writes
+    gzip (and brotli, when installed) siblings for text assets.
+
+    Args:
+        static_folder (str): The application's static folder
+
+    Returns:
+        Dict[str, str]: The manifest mapping original to fingerprinted filenames
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist_folder):
+        shutil.rmtree(dist_folder)
+    os.makedirs(dist_folder)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        # Never fingerprint our own output
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(filename)
+            hashed = f"{DIST_DIR}/{stem}.{fingerprint(source)}{ext}"
+            target = os.path.join(static_folder, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(source, "rb") as f:
+                    data = f.read()
+                # mtime=0 keeps the output byte-for-byte reproducible between builds
+                with open(target + ".gz", "wb") as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + ".br", "wb") as f:
+                        f.write(brotli.compress(data, quality=11))
+
+            manifest[filename] = hashed
+
+    with open(os.path.join(dist_folder, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest(static_folder: str) -> Dict[str, str]:
+    """
+    Loads the asset manifest, returning an empty mapping if assets were not built.
+    """
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _negotiate_encoding(static_folder: str, filename: str) -> Optional[str]:
+    """
+    Picks the best precompressed variant the client accepts, if one exists on disk.
+    """
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(
+            os.path.join(static_folder, filename + suffix)
+        ):
+            return encoding
+    return None
+
+
+def init_assets(app):
+    """
+    Hooks the asset manifest into ``url_for('static', ...)`` and serves the
+    fingerprinted files precompressed with immutable cache headers.
+    """
+    static_folder = app.static_folder
+    manifest = load_manifest(static_folder)
+    fingerprinted = set(manifest.values())
+    suffixes = dict(ENCODINGS)
+    max_age = app.config.get("STATIC_CACHE_MAX_AGE", 31536000)
+
+    app.extensions["asset_manifest"] = manifest
+
+    if not manifest:
+        return
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = manifest[values["filename"]]
+
+    def static(filename):
+        if filename not in fingerprinted:
+            return app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        encoding = _negotiate_encoding(static_folder, filename)
+        if encoding:
+            response = send_from_directory(
+                static_folder, filename + suffixes[encoding], mimetype=mimetype
+            )
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = send_from_directory(static_folder, filename, mimetype=mimetype)
+
+        # The name changes whenever the content does, so browsers never need to revalidate
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.view_functions["static"] = static
@@ -0,0 +1,168 @@
+"""
+Memory-mapped Bloom filter of SHA-1 digests.
+
+Items are keyed by their SHA-1 digest, so a filter can be built from plaintext
+lists or from lists of hex digests (such as the Pwned Passwords "HASH:count"
+files) alike. The file is mapped read-only: opening it costs no parsing and
+forked workers share its pages through the OS page cache.
+"""
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from typing import Iterable, Iterator
+
+from .memory import current_rss_bytes
+
+# File layout: header (MAGIC, version, hash count, bit count), then the bit array
+MAGIC = b"NWBF"
+VERSION = 1
+HEADER = struct.Struct("<4sIIQ")
+
+_HEX_DIGEST = re.compile(r"^[0-9A-Fa-f]{40}(:\d+)?$")
+
+
+def optimal_parameters(count: int, fp_rate: float):
+    """
+    Returns the (bits, hashes) that give the target false-positive rate for count items.
+    """
+    if not 0 < fp_rate < 1:
+        raise ValueError("fp_rate must be between 0 and 1")
+    count = max(1, count)
+    bits = math.ceil(-count * math.log(fp_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / count * math.log(2)))
+    return bits, hashes
+
+
+def expected_fp_rate(count: int, bits: int, hashes: int) -> float:
+    return (1 - math.exp(-hashes * count / bits)) ** hashes
+
+
+def digest(item: str) -> bytes:
+    return hashlib.sha1(item.encode("utf-8")).digest()
+
+
+def _digests(lines: Iterable[str]) -> Iterator[bytes]:
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if _HEX_DIGEST.match(line):
+            yield bytes.fromhex(line[:40])
+        else:
+            yield digest(line)
+
+
+def _positions(key: bytes, bits: int, hashes: int) -> Iterator[int]:
+    # Double hashing: the digest is already uniform, so two halves of it suffice
+    h1 = int.from_bytes(key[:8], "little")
+    h2 = int.from_bytes(key[8:16], "little") | 1
+    for i in range(hashes):
+        yield (h1 + i * h2) % bits
+
+
+def build_bloom_filter(source_path: str, output_path: str, fp_rate: float = 0.001) -> dict:
+    """
+    Builds a filter file from a list with one plaintext item or SHA-1 hex digest
+    (optionally followed by ":count") per line.
+
+    Args:
+        source_path (str): The list to read; it is read twice, to size the filter first
+        output_path (str): Where to write the filter
+        fp_rate (float): Target false-positive rate
+
+    Returns:
+        dict: count, bits, hashes, size_bytes and the expected fp_rate
+    """
+    with open(source_path, encoding="utf-8", errors="replace") as f:
+        count = sum(1 for line in f if line.strip())
+
+    bits, hashes = optimal_parameters(count, fp_rate)
+    array = bytearray((bits + 7) // 8)
+    with open(source_path, encoding="utf-8", errors="replace") as f:
+        for key in _digests(f):
+            for position in _positions(key, bits, hashes):
+                array[position >> 3] |= 1 << (position & 7)
+
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, hashes, bits))
+        f.write(array)
+
+    return {
+        "count": count,
+        "bits": bits,
+        "hashes": hashes,
+        "size_bytes": HEADER.size + len(array),
+        "fp_rate": expected_fp_rate(count, bits, hashes),
+    }
+
+
+class BloomFilter:
+    """
+    Read-only view of a filter file built by build_bloom_filter.
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < HEADER.size:
+                raise ValueError(f"{path} is not a Bloom filter")
+            magic, version, self.hashes, self.bits = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a Bloom filter")
+            if len(self._mmap) < HEADER.size + (self.bits + 7) // 8:
+                raise ValueError(f"{path} is truncated")
+        except ValueError:
+            self._mmap.close()
+            raise
+        self.size_bytes = len(self._mmap)
+
+    def contains_digest(self, key: bytes) -> bool:
+        data, offset = self._mmap, HEADER.size
+        for position in _positions(key, self.bits, self.hashes):
+            if not data[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __contains__(self, item: str) -> bool:
+        return self.contains_digest(digest(item))
+
+    def close(self):
+        self._mmap.close()
+
+
+def benchmark(path: str, lookups: int = 100_000, members: Iterable[str] = ()) -> dict:
+    """
+    Opens a filter and measures the cost of lookups and the resident memory they add.
+
+    Args:
+        path (str): The filter file
+        lookups (int): Number of random (almost certainly absent) items to look up
+        members (Iterable[str]): Known members, checked to be found
+
+    Returns:
+        dict: size_bytes, lookup_us (mean microseconds per lookup), measured_fp_rate,
+              rss_added_bytes and members_missed
+    """
+    items = [os.urandom(12).hex() for _ in range(lookups)]
+    rss_before = current_rss_bytes()
+    bloom = BloomFilter(path)
+
+    start = time.perf_counter()
+    false_positives = sum(1 for item in items if item in bloom)
+    elapsed = time.perf_counter() - start
+
+    missed = sum(1 for item in members if item not in bloom)
+    result = {
+        "size_bytes": bloom.size_bytes,
+        "hashes": bloom.hashes,
+        "lookup_us": elapsed / max(1, lookups) * 1e6,
+        "measured_fp_rate": false_positives / max(1, lookups),
+        "rss_added_bytes": current_rss_bytes() - rss_before,
+        "members_missed": missed,
+    }
+    bloom.close()
+    return result
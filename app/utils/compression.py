@@ -0,0 +1,69 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/plain",
+    "text/css",
+    "application/json",
+    "application/geo+json",
+    "application/javascript",
+}
+
+
+def _choose_encoding() -> str:
+    """
+    Returns the preferred encoding the client accepts, or an empty string.
+    """
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return ""
+
+
+def init_compression(app):
+    """
+    Compresses HTML/JSON responses on the fly when the client accepts it and the
+    body is larger than ``COMPRESS_MIN_SIZE`` bytes.
+    """
+    min_size = app.config.get("COMPRESS_MIN_SIZE", 500)
+    level = app.config.get("COMPRESS_LEVEL", 6)
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = _choose_encoding()
+        if not encoding or (response.content_length or 0) < min_size:
+            return response
+
+        data = response.get_data()
+        if encoding == "br":
+            # Low quality keeps brotli faster than gzip while still compressing better
+            data = brotli.compress(data, quality=4)
+        else:
+            data = gzip.compress(data, compresslevel=level)
+
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        if response.headers.get("ETag"):
+            # The representation changed, so a strong validator no longer applies
+            etag, _ = response.get_etag()
+            response.set_etag(etag, weak=True)
+        return response
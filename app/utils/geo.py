@@ -0,0 +1,76 @@
+import math
+from typing import Iterator, Optional, Tuple
+
+EARTH_RADIUS_M = 6371000
+
+# 4 decimal places is roughly 11 m: close enough to count as the same place
+QUANTIZE_PRECISION = 4
+
+
+def quantize(lat: float, lng: float, precision: int = QUANTIZE_PRECISION) -> Tuple[int, int]:
+    """
+    Rounds coordinates to a grid and returns them as integers, for use as exact keys.
+    """
+    scale = 10 ** precision
+    return round(lat * scale), round(lng * scale)
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Returns the great-circle distance between two points in meters.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+# Coordinates are stored as degrees * 1e7 in 32-bit integers (about 1 cm resolution)
+E7 = 10_000_000
+MAX_LATITUDE_E7 = 90 * E7
+MAX_LONGITUDE_E7 = 180 * E7
+
+
+def to_e7(degrees: Optional[float]) -> Optional[int]:
+    """
+    Converts degrees to the fixed-point integer representation.
+    """
+    return None if degrees is None else round(degrees * E7)
+
+
+def from_e7(value: Optional[int]) -> Optional[float]:
+    """
+    Converts the fixed-point integer representation back to degrees.
+    """
+    return None if value is None else value / E7
+
+
+def grid_cell(lat_e7: int, lng_e7: int, degrees: float) -> int:
+    """
+    Returns the key of the square grid cell of side degrees containing a point.
+    Keys sort by row, then column, so points can be stored in cell order and
+    the points of a cell found by binary search.
+    """
+    size = degrees * E7
+    return (int((lat_e7 + MAX_LATITUDE_E7) // size) << 32) | int((lng_e7 + MAX_LONGITUDE_E7) // size)
+
+
+def grid_ring(lat: float, lng: float, degrees: float, ring: int) -> Iterator[int]:
+    """
+    Yields the keys of the cells exactly ring cells away from the cell of a point.
+    """
+    center = grid_cell(to_e7(lat), to_e7(lng), degrees)
+    row, column = center >> 32, center & 0xFFFFFFFF
+    for dr in range(-ring, ring + 1):
+        for dc in range(-ring, ring + 1):
+            if max(abs(dr), abs(dc)) == ring:
+                yield ((row + dr) << 32) | (column + dc)
+
+
+def grid_ring_meters(lat: float, degrees: float, ring: int) -> float:
+    """
+    Returns the distance from a point within which everything lies inside its
+    first ring cells, i.e. how far a search of those rings is exhaustive.
+    """
+    return ring * degrees * 111_000 * math.cos(math.radians(lat))
@@ -0,0 +1,151 @@
+"""
+Local stand-in for the Google Maps web services the app calls.
+
+Responses follow Google's JSON shapes but are computed deterministically: an
+address geocodes to a point derived from its hash, and travel times are the
+straight-line distance with a detour factor at a fixed speed per mode. Run it
+with ``flask maps-standin`` and set ``GOOGLE_MAPS_BASE_URL`` to its address.
+"""
+import hashlib
+import re
+import time
+
+from flask import Flask, jsonify, request
+
+from .geo import from_e7, haversine_m, to_e7
+
+# Generated points fall inside this box (roughly Great Britain)
+BOUNDS = ((50.0, 58.5), (-5.5, 1.5))
+
+# Road distance relative to the straight line, and average speed in km/h
+DETOUR_FACTOR = 1.3
+SPEEDS_KMH = {'driving': 40, 'walking': 5, 'bicycling': 15, 'transit': 25}
+
+PLACE_PREFIX = "standin-"
+
+
+def _point_for(text: str):
+    digest = hashlib.sha1(re.sub(r"\s+", " ", text.strip().lower()).encode("utf-8")).digest()
+    (lat_min, lat_max), (lng_min, lng_max) = BOUNDS
+    lat = lat_min + int.from_bytes(digest[:4], "big") / 2 ** 32 * (lat_max - lat_min)
+    lng = lng_min + int.from_bytes(digest[4:8], "big") / 2 ** 32 * (lng_max - lng_min)
+    return from_e7(to_e7(lat)), from_e7(to_e7(lng))
+
+
+def place_id_for(lat: float, lng: float) -> str:
+    """
+    Returns the stand-in place ID of a point; it encodes the coordinates so that
+    Place Details and Distance Matrix can resolve it without any state.
+    """
+    return f"{PLACE_PREFIX}{to_e7(lat)}_{to_e7(lng)}"
+
+
+def _resolve_place_id(place_id: str):
+    if not place_id.startswith(PLACE_PREFIX):
+        return None
+    try:
+        lat_e7, lng_e7 = place_id[len(PLACE_PREFIX):].split("_")
+        return from_e7(int(lat_e7)), from_e7(int(lng_e7))
+    except ValueError:
+        return None
+
+
+def _resolve_waypoint(waypoint: str):
+    if waypoint.startswith("place_id:"):
+        return _resolve_place_id(waypoint[len("place_id:"):])
+    try:
+        lat, lng = (float(part) for part in waypoint.split(","))
+        return lat, lng
+    except ValueError:
+        return _point_for(waypoint)
+
+
+def _result(formatted_address: str, lat: float, lng: float):
+    return {
+        "formatted_address": formatted_address,
+        "geometry": {"location": {"lat": lat, "lng": lng}},
+        "place_id": place_id_for(lat, lng),
+        "types": ["street_address"],
+    }
+
+
+def _element(origin, destination, mode):
+    if origin is None or destination is None:
+        return {"status": "NOT_FOUND"}
+    meters = round(haversine_m(*origin, *destination) * DETOUR_FACTOR)
+    seconds = max(60, round(meters / (SPEEDS_KMH[mode] / 3.6)))
+    return {
+        "status": "OK",
+        "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+        "duration": {"text": f"{max(1, round(seconds / 60))} mins", "value": seconds},
+    }
+
+
+def create_standin_app(latency: float = 0.0) -> Flask:
+    """
+    Creates the stand-in application, serving under /maps/api like Google.
+
+    Args:
+        latency (float): Seconds to wait before every response, to mimic the real API
+    """
+    app = Flask(__name__)
+    stats = {"requests": 0}
+    app.config["STANDIN_STATS"] = stats
+
+    @app.before_request
+    def simulate_latency():
+        stats["requests"] += 1
+        if latency:
+            time.sleep(latency)
+
+    @app.route("/maps/api/geocode/json")
+    def geocode():
+        if request.args.get("latlng"):
+            point = _resolve_waypoint(request.args["latlng"])
+            if point is None:
+                return jsonify({"status": "INVALID_REQUEST", "results": []})
+            # The nearest "address" is the point snapped to a grid of about 11 m
+            lat, lng = round(point[0], 4), round(point[1], 4)
+            return jsonify({"status": "OK", "results": [_result(f"Place at {lat}, {lng}", lat, lng)]})
+        address = request.args.get("address", "").strip()
+        if not address:
+            return jsonify({"status": "INVALID_REQUEST", "results": []})
+        if "nowhere" in address.lower():
+            return jsonify({"status": "ZERO_RESULTS", "results": []})
+        lat, lng = _point_for(address)
+        return jsonify({"status": "OK", "results": [_result(f"{address.title()}, UK", lat, lng)]})
+
+    @app.route("/maps/api/place/details/json")
+    def place_details():
+        point = _resolve_place_id(request.args.get("place_id", ""))
+        if point is None:
+            return jsonify({"status": "NOT_FOUND"})
+        return jsonify({"status": "OK", "result": _result(f"Place at {point[0]}, {point[1]}", *point)})
+
+    @app.route("/maps/api/place/autocomplete/json")
+    def place_autocomplete():
+        text = request.args.get("input", "").strip()
+        predictions = []
+        for suffix in ("Road", "Street", "Avenue"):
+            description = f"{text.title()} {suffix}, UK"
+            predictions.append({"description": description, "place_id": place_id_for(*_point_for(description))})
+        return jsonify({"status": "OK", "predictions": predictions})
+
+    @app.route("/maps/api/distancematrix/json")
+    def distance_matrix():
+        mode = request.args.get("mode", "driving")
+        if mode not in SPEEDS_KMH:
+            return jsonify({"status": "INVALID_REQUEST"})
+        origins = [_resolve_waypoint(w) for w in request.args.get("origins", "").split("|") if w]
+        destinations = [_resolve_waypoint(w) for w in request.args.get("destinations", "").split("|") if w]
+        if not origins or not destinations:
+            return jsonify({"status": "INVALID_REQUEST"})
+        return jsonify({
+            "status": "OK",
+            "rows": [
+                {"elements": [_element(origin, destination, mode) for destination in destinations]}
+                for origin in origins
+            ],
+        })
+
+    return app
@@ -0,0 +1,203 @@
+"""
+Worker memory accounting.
+
+Each worker keeps a ring buffer of its resident set size, sampled after requests
+at most every ``MEMORY_SAMPLE_SECONDS``. Admins can start tracemalloc, take a
+baseline snapshot and later see which modules allocated the memory added since,
+and the gunicorn ``post_request`` hook recycles a worker once its RSS exceeds
+``MAX_WORKER_RSS_MB``.
+"""
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+_lock = threading.Lock()
+_history: deque = deque(maxlen=1440)
+_state = {"requests": 0, "last_sample": 0.0, "started": datetime.utcnow()}
+_baseline: Dict = {"snapshot": None, "taken": None}
+
+
+def current_rss_bytes() -> int:
+    """
+    Returns the resident set size of this process. Where /proc is unavailable the
+    peak RSS is returned instead.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def record_sample(force: bool = False, interval: float = 60) -> Optional[Dict]:
+    """
+    Counts a request and appends an RSS sample if interval seconds have passed
+    since the last one.
+    """
+    now = time.monotonic()
+    with _lock:
+        _state["requests"] += 1
+        if not force and now - _state["last_sample"] < interval:
+            return None
+        _state["last_sample"] = now
+        sample = {
+            "time": datetime.utcnow().isoformat(timespec="seconds"),
+            "rss_mb": round(current_rss_bytes() / 2 ** 20, 1),
+            "requests": _state["requests"],
+        }
+        _history.append(sample)
+    return sample
+
+
+def get_memory_history() -> List[Dict]:
+    """
+    Returns this worker's RSS samples, oldest first.
+    """
+    with _lock:
+        return list(_history)
+
+
+def should_recycle(max_rss_mb: float) -> bool:
+    """
+    Returns True when this worker's RSS exceeds max_rss_mb; 0 disables the ceiling.
+    """
+    return bool(max_rss_mb) and current_rss_bytes() > max_rss_mb * 2 ** 20
+
+
+def start_tracing(frames: int = 1) -> None:
+    """
+    Starts tracemalloc, if needed, and takes the baseline later diffs compare against.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline["snapshot"] = _filtered_snapshot()
+    _baseline["taken"] = datetime.utcnow()
+
+
+def stop_tracing() -> None:
+    """
+    Stops tracemalloc and releases its memory and the baseline.
+    """
+    _baseline["snapshot"] = None
+    _baseline["taken"] = None
+    tracemalloc.stop()
+
+
+def _filtered_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def module_name(filename: str, depth: int = 2) -> str:
+    """
+    Maps a source file to its dotted module name, keeping at most depth components
+    (e.g. "sqlalchemy.orm" for any file under sqlalchemy/orm).
+    """
+    path = os.path.abspath(filename)
+    roots = sorted((os.path.abspath(p) for p in sys.path if p), key=len, reverse=True)
+    for root in roots:
+        if path.startswith(root + os.sep):
+            parts = path[len(root) + 1:].split(os.sep)
+            parts[-1] = os.path.splitext(parts[-1])[0]
+            if parts[-1] == "__init__":
+                parts.pop()
+            return ".".join(parts[:depth]) or filename
+    return filename
+
+
+def snapshot_diff(limit: int = 25, depth: int = 2) -> Optional[Dict]:
+    """
+    Compares the current allocations with the baseline, grouped by module.
+
+    Args:
+        limit (int): Number of modules to return
+        depth (int): Module name components to group by
+
+    Returns:
+        Optional[Dict]: baseline time, traced totals and the modules with the largest
+                        growth, or None if tracing has not been started
+    """
+    baseline = _baseline["snapshot"]
+    if baseline is None or not tracemalloc.is_tracing():
+        return None
+
+    current = _filtered_snapshot()
+    modules: Dict[str, Dict] = {}
+    for stat in current.compare_to(baseline, "filename"):
+        name = module_name(stat.traceback[0].filename, depth)
+        entry = modules.setdefault(name, {"module": name, "size_diff": 0, "size": 0, "count_diff": 0})
+        entry["size_diff"] += stat.size_diff
+        entry["size"] += stat.size
+        entry["count_diff"] += stat.count_diff
+
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        "baseline_taken": _baseline["taken"].isoformat(timespec="seconds"),
+        "traced_mb": round(traced / 2 ** 20, 1),
+        "peak_mb": round(peak / 2 ** 20, 1),
+        "tracemalloc_mb": round(tracemalloc.get_tracemalloc_memory() / 2 ** 20, 1),
+        "modules": sorted(modules.values(), key=lambda m: m["size_diff"], reverse=True)[:limit],
+    }
+
+
+def top_object_types(limit: int = 15) -> List[Dict]:
+    """
+    Counts live objects tracked by the garbage collector by type. This walks every
+    object, so it is only run on demand.
+    """
+    counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+    return [{"type": name, "count": count} for name, count in counts.most_common(limit)]
+
+
+def get_memory_report(cache_sizes: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    Returns this worker's memory status: current RSS, its history, tracemalloc
+    state and the sizes of the in-process caches.
+    """
+    return {
+        "pid": os.getpid(),
+        "started": _state["started"].isoformat(timespec="seconds"),
+        "requests": _state["requests"],
+        "rss_mb": round(current_rss_bytes() / 2 ** 20, 1),
+        "history": get_memory_history(),
+        "tracing": tracemalloc.is_tracing(),
+        "caches": cache_sizes or {},
+    }
+
+
+def _reset_after_fork():
+    # Forked workers start their own history rather than the preloading parent's
+    global _lock
+    _lock = threading.Lock()
+    _history.clear()
+    _state.update(requests=0, last_sample=0.0, started=datetime.utcnow())
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_memory(app):
+    """
+    Samples RSS after requests and sizes the history buffer from the config.
+    """
+    global _history
+    _history = deque(_history, maxlen=app.config.get("MEMORY_HISTORY_SIZE", 1440))
+    interval = app.config.get("MEMORY_SAMPLE_SECONDS", 60)
+
+    @app.after_request
+    def sample_memory(response):
+        record_sample(interval=interval)
+        return response
@@ -0,0 +1,191 @@
+"""
+Helpers for schema changes and data backfills that can run while the app is live.
+
+The ``op``-level helpers are meant to be called from Alembic revision scripts;
+``backfill_in_batches`` runs through the Flask-SQLAlchemy session and is used by
+CLI jobs so that long data migrations happen outside the schema migration.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import sqlalchemy as sa
+from alembic import op
+
+from .. import db
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+@contextmanager
+def lock_timeout(timeout: str = "5s"):
+    """
+    Makes DDL fail fast instead of queueing behind long transactions on Postgres,
+    where a waiting ACCESS EXCLUSIVE lock would block every other query on the table.
+    """
+    if _is_postgres():
+        op.execute(f"SET LOCAL lock_timeout = '{timeout}'")
+    yield
+
+
+def add_column(table_name: str, column: sa.Column):
+    """
+    Adds a column without rebuilding the table.
+
+    The column must be nullable (or have a constant default): on Postgres this is a
+    metadata-only change and on SQLite a plain ``ALTER TABLE ADD COLUMN``, unlike
+    ``batch_alter_table`` which copies the whole table. Backfill it afterwards.
+    """
+    with lock_timeout():
+        op.add_column(table_name, column)
+
+
+def create_index(index_name: str, table_name: str, columns: List, unique: bool = False, **kw):
+    """
+    Creates an index, using ``CREATE INDEX CONCURRENTLY`` on Postgres so that
+    writes to the table are not blocked while it builds.
+    """
+    if _is_postgres():
+        # CONCURRENTLY cannot run inside a transaction block
+        with op.get_context().autocommit_block():
+            op.create_index(index_name, table_name, columns, unique=unique,
+                            postgresql_concurrently=True, if_not_exists=True, **kw)
+    else:
+        op.create_index(index_name, table_name, columns, unique=unique, if_not_exists=True, **kw)
+
+
+def drop_index(index_name: str, table_name: str):
+    """
+    Drops an index, concurrently on Postgres.
+    """
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            op.drop_index(index_name, table_name=table_name,
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(index_name, table_name=table_name, if_exists=True)
+
+
+def backfill_table(table_name: str, set_clause: str, where: str = "1=1",
+                   batch_size: int = 1000, sleep_seconds: float = 0.0,
+                   id_column: str = "id"):
+    """
+    Runs ``UPDATE table SET <set_clause>`` in id-ordered chunks from a migration,
+    committing each chunk so that row locks are held only briefly.
+
+    Args:
+        table_name (str): The table to update
+        set_clause (str): SQL assignment list, e.g. ``"email = lower(email)"``
+        where (str): SQL condition selecting rows that still need the update
+        batch_size (int): Rows per chunk
+        sleep_seconds (float): Pause between chunks to throttle write load
+        id_column (str): Integer key used for keyset pagination
+    """
+    select_ids = sa.text(
+        f"SELECT {id_column} FROM {table_name} "
+        f"WHERE {id_column} > :last_id AND ({where}) "
+        f"ORDER BY {id_column} LIMIT :limit"
+    )
+    update = sa.text(
+        f"UPDATE {table_name} SET {set_clause} "
+        f"WHERE {id_column} >= :first_id AND {id_column} <= :last_id AND ({where})"
+    )
+
+    last_id = 0
+    total = 0
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            ids = [row[0] for row in bind.execute(select_ids, {"last_id": last_id, "limit": batch_size})]
+            if not ids:
+                break
+            # Each statement commits on its own inside the autocommit block
+            bind.execute(update, {"first_id": ids[0], "last_id": ids[-1]})
+            total += len(ids)
+            last_id = ids[-1]
+            logger.info(f"Backfilled {total} rows of {table_name}")
+            if sleep_seconds:
+                time.sleep(sleep_seconds)
+    return total
+
+
+def backfill_in_batches(name: str, model, process_batch: Callable[[List], None],
+                        where=None, batch_size: int = 500, sleep_seconds: float = 0.0,
+                        progress: Optional[Callable[[int, int], None]] = None,
+                        restart: bool = False) -> int:
+    """
+    Applies ``process_batch`` to rows of ``model`` in id-ordered chunks, committing
+    after each one together with a checkpoint so the job can be resumed.
+
+    Args:
+        name (str): Unique job name the checkpoint is stored under
+        model: The mapped class to iterate over (must have an integer ``id``)
+        process_batch (Callable): Mutates the rows of one batch in place
+        where: Optional SQLAlchemy condition restricting the rows visited
+        batch_size (int): Rows per batch
+        sleep_seconds (float): Pause between batches to throttle load
+        progress (Callable): Called with (processed, total) after each batch
+        restart (bool): Ignore any stored checkpoint and start from the beginning
+
+    Returns:
+        int: Number of rows processed in this run
+    """
+    from ..models import MigrationCheckpoint
+
+    checkpoint = db.session.get(MigrationCheckpoint, name)
+    if checkpoint is None:
+        checkpoint = MigrationCheckpoint(name=name, last_id=0, processed=0)
+        db.session.add(checkpoint)
+    elif restart:
+        checkpoint.last_id = 0
+        checkpoint.processed = 0
+    checkpoint.completed = False
+    db.session.commit()
+
+    conditions = [model.id > checkpoint.last_id]
+    if where is not None:
+        conditions.append(where)
+    remaining = db.session.scalar(sa.select(sa.func.count()).select_from(model).where(*conditions))
+    total = checkpoint.processed + remaining
+
+    processed = 0
+    while True:
+        rows = db.session.scalars(
+            sa.select(model)
+            .where(model.id > checkpoint.last_id, *conditions[1:])
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        try:
+            process_batch(rows)
+            checkpoint.last_id = rows[-1].id
+            checkpoint.processed += len(rows)
+            checkpoint.updated_date = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception(f"Backfill {name} failed after id {checkpoint.last_id}")
+            raise
+
+        processed += len(rows)
+        logger.info(f"Backfill {name}: {checkpoint.processed}/{total} rows")
+        if progress:
+            progress(checkpoint.processed, total)
+        # Release the ORM objects of the finished batch
+        db.session.expunge_all()
+        checkpoint = db.session.get(MigrationCheckpoint, name)
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+    checkpoint.completed = True
+    db.session.commit()
+    return processed
@@ -0,0 +1,70 @@
+"""
+Memory-mapped files of packed arrays.
+
+The road graph and the transit network are compiled into a header followed by
+flat little-endian arrays. Readers map the file and view each array in place,
+so opening one costs no parsing and forked workers share its pages through the
+OS page cache.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterable, Tuple
+
+
+def write_arrays(f: BinaryIO, header: bytes, arrays: Iterable[array]) -> None:
+    """
+    Writes a header and then each array in order, little-endian.
+    """
+    f.write(header)
+    for arr in arrays:
+        if sys.byteorder != "little":
+            arr = array(arr.typecode, arr)
+            arr.byteswap()
+        arr.tofile(f)
+
+
+class PackedFile:
+    """
+    Read-only view of a file written by write_arrays. Arrays are taken in the
+    order they were written.
+    """
+    def __init__(self, path: str, header: struct.Struct, magic: bytes, version: int, kind: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < header.size:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a {kind}")
+        values = header.unpack_from(self._mmap, 0)
+        if values[0] != magic or values[1] != version:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a {kind}")
+        if sys.byteorder != "little":
+            self._mmap.close()
+            raise ValueError(f"{kind.capitalize()} files are only supported on little-endian hosts")
+
+        self.path = path
+        self.header: Tuple = values[2:]
+        self.size_bytes = len(self._mmap)
+        self._view = memoryview(self._mmap)
+        self._views = [self._view]
+        self._offset = header.size
+
+    def take(self, fmt: str, length: int) -> memoryview:
+        """
+        Returns a view of the next array of length items of a struct format.
+        """
+        size = struct.calcsize(fmt) * length
+        if self._offset + size > len(self._view):
+            raise ValueError(f"{self.path} is truncated")
+        part = self._view[self._offset:self._offset + size]
+        self._offset += size
+        self._views.append(part)
+        self._views.append(part.cast(fmt))
+        return self._views[-1]
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
@@ -1,4 +1,20 @@
 import re
+from typing import Optional
+
+from .bloom import BloomFilter
+
+_breached_passwords = None
+
+
+def load_breached_passwords(path: Optional[str]) -> Optional[BloomFilter]:
+    """
+    Opens the Bloom filter of breached passwords used by is_password_secure;
+    passing None disables the check.
+    """
+    global _breached_passwords
+    _breached_passwords = BloomFilter(path) if path else None
+    return _breached_passwords
+
 
 def is_password_secure(password):
     """
@@ -8,6 +24,7 @@ def is_password_secure(password):
     - Contains at least one lowercase letter
     - Contains at least one number
     - Contains at least one special character
+    - Does not appear in the breached password filter, when one is loaded
     """
     if len(password) < 8:
         return False, "Password must be at least 8 characters long"
@@ -23,5 +40,8 @@ def is_password_secure(password):
     
     if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
         return False, "Password must contain at least one special character"
+
+    if _breached_passwords is not None and password in _breached_passwords:
+        return False, "This password has appeared in a data breach, please choose another one"
     
     return True, "Password is secure" 
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+On-demand request profiling.
+
+A request carrying a token minted for admins (``X-Profile`` header or ``_profile``
+query parameter) runs under a profiler, and its call tree is written to
+``PROFILE_DIR`` in the speedscope format (https://www.speedscope.app). Two modes
+are available: "sample" polls the request thread's stack every ``PROFILE_INTERVAL``
+seconds with little overhead, "trace" records every call and return exactly.
+Requests without a token only pay for one header lookup.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.wsgi import ClosingIterator
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "_profile"
+PROFILE_MODES = ("sample", "trace")
+INDEX_FILE = "index.jsonl"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class _FrameTable:
+    """
+    Interns (name, file, line) frames into the shared frame list of a speedscope file.
+    """
+    def __init__(self):
+        self.frames: List[Dict] = []
+        self._index: Dict = {}
+
+    def index(self, name: str, filename: str, line: int) -> int:
+        key = (name, filename, line)
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.frames)
+            self.frames.append({"name": name, "file": filename, "line": line})
+        return index
+
+    def code(self, code) -> int:
+        return self.index(code.co_name, code.co_filename, code.co_firstlineno)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread.
+    """
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.table = _FrameTable()
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def _run(self):
+        last = self._started
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self.table.code(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            # Weight by the real time between samples, which stretches under load
+            self.weights.append(now - last)
+            last = now
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def profile(self, name: str) -> Dict:
+        return {
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(self.weights),
+            "samples": self.samples,
+            "weights": self.weights,
+        }
+
+
+class TracingProfiler:
+    """
+    Records every Python and C function call of the current thread with sys.setprofile.
+    """
+    def __init__(self, max_events: int = 1_000_000):
+        self.max_events = max_events
+        self.table = _FrameTable()
+        self.events: List[Dict] = []
+        self.truncated = False
+        self._stack: List[int] = []
+
+    def start(self):
+        self._started = time.perf_counter()
+        sys.setprofile(self._callback)
+
+    def _callback(self, frame, event, arg):
+        at = time.perf_counter() - self._started
+        if event == "call":
+            index = self.table.code(frame.f_code)
+        elif event == "c_call":
+            index = self.table.index(getattr(arg, "__qualname__", repr(arg)), "<built-in>", 0)
+        elif self._stack:
+            # Returns of frames entered before profiling started are ignored
+            self.events.append({"type": "C", "frame": self._stack.pop(), "at": at})
+            return
+        else:
+            return
+        self._stack.append(index)
+        self.events.append({"type": "O", "frame": index, "at": at})
+        if len(self.events) >= self.max_events:
+            sys.setprofile(None)
+            self.truncated = True
+
+    def stop(self):
+        sys.setprofile(None)
+        self.duration = time.perf_counter() - self._started
+        while self._stack:
+            self.events.append({"type": "C", "frame": self._stack.pop(), "at": self.duration})
+
+    def profile(self, name: str) -> Dict:
+        return {
+            "type": "evented",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": self.duration,
+            "events": self.events,
+        }
+
+
+def _serializer(secret_key: str) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(secret_key, salt="request-profile")
+
+
+def make_profile_token(secret_key: str, mode: str = "sample") -> str:
+    """
+    Returns a signed token that enables profiling of the requests carrying it.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'")
+    return _serializer(secret_key).dumps({"mode": mode})
+
+
+def load_profile_token(secret_key: str, token: str, max_age: int) -> Optional[Dict]:
+    """
+    Returns the options of a valid token, or None if it is forged or expired.
+    """
+    try:
+        options = _serializer(secret_key).loads(token, max_age=max_age)
+    except BadSignature:
+        return None
+    return options if options.get("mode") in PROFILE_MODES else None
+
+
+def save_profile(directory: str, profile_id: str, document: Dict, meta: Dict, max_files: int) -> str:
+    """
+    Writes a speedscope document and its index entry, removing the oldest profiles
+    beyond max_files.
+
+    Returns:
+        str: The file name of the profile within directory
+    """
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{profile_id}.speedscope.json"
+    with open(os.path.join(directory, filename), "w") as f:
+        json.dump(document, f, separators=(",", ":"))
+    with open(os.path.join(directory, INDEX_FILE), "a") as f:
+        f.write(json.dumps(dict(meta, file=filename)) + "\n")
+
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith(".speedscope.json"))
+    pruned = profiles[:max(0, len(profiles) - max_files)]
+    for name in pruned:
+        os.remove(os.path.join(directory, name))
+    if pruned:
+        _prune_index(directory)
+    return filename
+
+
+def _prune_index(directory: str) -> None:
+    # Keeps the entries of profiles still on disk; replaced atomically, so
+    # list_profiles never reads a partly written index
+    path = os.path.join(directory, INDEX_FILE)
+    with open(path) as f:
+        lines = [line for line in f if os.path.exists(os.path.join(directory, json.loads(line)["file"]))]
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.writelines(lines)
+    os.replace(temporary, path)
+
+
+def list_profiles(directory: str, limit: int = 50) -> List[Dict]:
+    """
+    Returns the index entries of the most recent profiles still on disk, newest first.
+    """
+    try:
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for line in reversed(lines):
+        entry = json.loads(line)
+        if os.path.exists(os.path.join(directory, entry["file"])):
+            profiles.append(entry)
+            if len(profiles) == limit:
+                break
+    return profiles
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that profiles requests carrying a valid profile token, from the
+    first hook to the last byte of the response body.
+    """
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+
+    def _token(self, environ) -> Optional[str]:
+        token = environ.get(PROFILE_HEADER)
+        if token is None and PROFILE_PARAM in environ.get("QUERY_STRING", ""):
+            token = parse_qs(environ["QUERY_STRING"]).get(PROFILE_PARAM, [None])[0]
+        return token
+
+    def __call__(self, environ, start_response):
+        token = self._token(environ)
+        if not token:
+            return self.wsgi_app(environ, start_response)
+
+        config = self.app.config
+        options = load_profile_token(self.app.secret_key, token, config.get("PROFILE_TOKEN_MAX_AGE", 3600))
+        if options is None:
+            logger.warning(f"Ignoring invalid profile token for {environ.get('PATH_INFO')}")
+            return self.wsgi_app(environ, start_response)
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        if options["mode"] == "trace":
+            profiler = TracingProfiler(config.get("PROFILE_MAX_EVENTS", 1_000_000))
+        else:
+            profiler = SamplingProfiler(threading.get_ident(), config.get("PROFILE_INTERVAL", 0.005))
+        response = {}
+
+        def profiled_start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            headers.append(("X-Profile-Id", profile_id))
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            profiler.stop()
+            method, path = environ.get("REQUEST_METHOD"), environ.get("PATH_INFO")
+            name = f"{method} {path}"
+            meta = {
+                "id": profile_id,
+                "method": method,
+                "path": path,
+                "status": response.get("status"),
+                "mode": options["mode"],
+                "duration_ms": round(profiler.duration * 1000, 1),
+                "truncated": getattr(profiler, "truncated", False),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            document = {
+                "$schema": SPEEDSCOPE_SCHEMA,
+                "name": name,
+                "exporter": "nearwise",
+                "shared": {"frames": profiler.table.frames},
+                "profiles": [profiler.profile(name)],
+            }
+            try:
+                save_profile(config["PROFILE_DIR"], profile_id, document, meta, config.get("PROFILE_MAX_FILES", 100))
+            except OSError:
+                logger.exception(f"Could not save profile {profile_id}")
+            else:
+                logger.info(f"Profiled {name} in {meta['duration_ms']} ms as {profile_id}")
+
+        profiler.start()
+        try:
+            app_iter = self.wsgi_app(environ, profiled_start_response)
+        except Exception:
+            finish()
+            raise
+        return ClosingIterator(app_iter, [finish])
+
+
+def init_profiling(app):
+    """
+    Installs the profiling middleware unless PROFILING_ENABLED is false.
+    """
+    if app.config.get("PROFILING_ENABLED", True):
+        app.wsgi_app = ProfilingMiddleware(app.wsgi_app, app)
@@ -0,0 +1,187 @@
+"""
+Read-replica routing for the Flask-SQLAlchemy session.
+
+Replica engines are created from ``REPLICA_DATABASE_URLS`` and named ``replica_<n>``.
+Reads go to a replica when the current request is a GET/HEAD or the code runs inside
+``read_only``; anything else, and every read after the session has written, uses
+the primary.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+REPLICA_PREFIX = "replica_"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_read_only = ContextVar("db_read_only", default=False)
+_primary = ContextVar("db_primary", default=False)
+_lock = threading.Lock()
+_round_robin = itertools.count()
+
+# replica name -> {"lag": seconds or None, "healthy": bool, "checked": monotonic time}
+_replica_health: Dict[str, Dict] = {}
+_stats = {"replica_reads": 0, "primary_reads": 0}
+
+
+def read_only(func):
+    """
+    Marks a service function as read-only so its queries may use a replica,
+    even when called from a POST handler.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """
+    Sends the queries made inside the block to the primary, even in a read-only
+    function or request; for results kept longer than a replica may lag, such as caches.
+    """
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def measure_lag(engine) -> Optional[float]:
+    """
+    Returns how many seconds the replica is behind the primary, or None when the
+    database cannot report it (e.g. SQLite).
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    with engine.connect() as connection:
+        lag = connection.execute(sa.text(
+            "SELECT CASE WHEN pg_is_in_recovery() "
+            "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+            "ELSE 0 END"
+        )).scalar()
+    return float(lag)
+
+
+def check_replicas(replicas: Dict, max_lag: float) -> Dict[str, Dict]:
+    """
+    Measures every replica's lag and marks those behind by more than max_lag (or
+    unreachable) as unhealthy so they are skipped until the next check.
+    """
+    for key, engine in sorted(replicas.items()):
+        try:
+            lag = measure_lag(engine)
+            healthy = lag is None or lag <= max_lag
+        except sa.exc.SQLAlchemyError:
+            logger.exception(f"Replica {key} is unreachable")
+            lag, healthy = None, False
+        if not healthy:
+            logger.warning(f"Replica {key} excluded from reads (lag: {lag})")
+        _replica_health[key] = {"lag": lag, "healthy": healthy, "checked": time.monotonic()}
+    return dict(_replica_health)
+
+
+def get_replica_status() -> Dict:
+    """
+    Returns the last measured replica health and how many reads each side served.
+    """
+    with _lock:
+        return {"replicas": dict(_replica_health), **_stats}
+
+
+def _choose_replica(replicas, config):
+    keys = sorted(replicas)
+    interval = config.get("REPLICA_CHECK_INTERVAL", 30)
+    now = time.monotonic()
+    if any(now - _replica_health.get(k, {}).get("checked", -interval) >= interval for k in keys):
+        with _lock:
+            check_replicas(replicas, config.get("REPLICA_MAX_LAG", 10))
+
+    healthy = [k for k in keys if _replica_health.get(k, {}).get("healthy", True)]
+    if not healthy:
+        return None
+    return replicas[healthy[next(_round_robin) % len(healthy)]]
+
+
+def _count(key: str) -> None:
+    # Sessions run in every gthread thread at once
+    with _lock:
+        _stats[key] += 1
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a replica pool when it is safe to do so.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replicas = current_app.extensions.get("db_replicas") if bind is None else None
+        if replicas and self._can_use_replica(clause):
+            engine = _choose_replica(replicas, current_app.config)
+            if engine is not None:
+                _count("replica_reads")
+                return engine
+        _count("primary_reads")
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_replica(self, clause):
+        if self._flushing or self.info.get("wrote") or _primary.get():
+            return False
+        if clause is not None and not isinstance(clause, sa.sql.Select):
+            return False
+        if clause is not None and getattr(clause, "_for_update_arg", None) is not None:
+            return False
+        if _read_only.get():
+            return True
+        return has_request_context() and g.get("db_read_only", False)
+
+
+@sa.event.listens_for(RoutingSession, "after_flush")
+def _mark_written(session, flush_context):
+    session.info["wrote"] = True
+
+
+def init_replicas(app, db):
+    """
+    Creates the replica engines and enables routing for requests, if any are configured.
+    """
+    urls = app.config.get("REPLICA_DATABASE_URLS") or []
+    if not urls:
+        return
+
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    app.extensions["db_replicas"] = {
+        f"{REPLICA_PREFIX}{i}": sa.create_engine(url, **options) for i, url in enumerate(urls)
+    }
+
+    sticky_seconds = app.config.get("REPLICA_STICKY_SECONDS", 5)
+
+    @app.before_request
+    def route_reads():
+        # After a write, keep this user on the primary long enough for replicas to
+        # catch up, so they always see their own changes
+        g.db_read_only = (
+            request.method in SAFE_METHODS
+            and session.get("db_primary_until", 0) < time.time()
+        )
+
+    @app.after_request
+    def stick_to_primary(response):
+        if db.session.info.get("wrote"):
+            session["db_primary_until"] = time.time() + sticky_seconds
+        return response
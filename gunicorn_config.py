@@ -1,6 +1,30 @@
+import os
+
 # Gunicorn config variables
 bind = "0.0.0.0:10000"
 workers = 1  # Single worker for simplicity
-worker_class = "sync"
+# gthread instead of gunicorn's default sync worker: a sync worker serves one request
+# at a time, so a single slow Google-bound request blocked login and every other page.
+# With threads, admission control (ADMISSION_* settings) caps the expensive routes at
+# ADMISSION_MAX_IN_FLIGHT plus ADMISSION_MAX_QUEUE threads; the spare threads are the
+# priority lane that keeps cheap routes served. Module-level state shared between
+# requests must therefore be thread-safe.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
 timeout = 120
-preload_app = True  # This ensures the app is loaded before workers are forked 
\ No newline at end of file
+preload_app = True  # This ensures the app is loaded before workers are forked 
+
+# Recycle a worker after the request that takes it past this much memory (0 disables)
+max_worker_rss_mb = int(os.getenv("MAX_WORKER_RSS_MB", "0"))
+
+
+def post_request(worker, req, environ, resp):
+    from app.utils.memory import current_rss_bytes, should_recycle
+
+    if should_recycle(max_worker_rss_mb):
+        worker.log.warning(
+            f"Worker {worker.pid} RSS {current_rss_bytes() / 2 ** 20:.0f} MB exceeds "
+            f"{max_worker_rss_mb} MB, restarting it"
+        )
+        # The arbiter replaces the worker once it finishes this request
+        worker.alive = False
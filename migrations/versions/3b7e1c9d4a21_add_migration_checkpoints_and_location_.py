@@ -0,0 +1,36 @@
+"""Add migration checkpoints table and location user_id index
+
+Revision ID: 3b7e1c9d4a21
+Revises: 8c090568f29a
+Create Date: 2026-10-19 09:12:40.118254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.online_migrations import create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e1c9d4a21'
+down_revision = '8c090568f29a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('migration_checkpoints',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('completed', sa.Boolean(), nullable=False),
+    sa.Column('updated_date', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Every location query filters by user; build the index without blocking writes
+    create_index(op.f('ix_location_user_id'), 'location', ['user_id'])
+
+
+def downgrade():
+    drop_index(op.f('ix_location_user_id'), 'location')
+    op.drop_table('migration_checkpoints')
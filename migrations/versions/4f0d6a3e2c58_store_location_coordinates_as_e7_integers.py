@@ -0,0 +1,74 @@
+"""Store location coordinates as E7 integers
+
+Revision ID: 4f0d6a3e2c58
+Revises: e91f4c27b8d3
+Create Date: 2026-10-19 15:21:48.602337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.online_migrations import add_column, backfill_table, create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = '4f0d6a3e2c58'
+down_revision = 'e91f4c27b8d3'
+branch_labels = None
+depends_on = None
+
+LATITUDE_CHECK = 'latitude_e7 BETWEEN -900000000 AND 900000000'
+LONGITUDE_CHECK = 'longitude_e7 BETWEEN -1800000000 AND 1800000000'
+
+
+def upgrade():
+    add_column('location', sa.Column('latitude_e7', sa.Integer(), nullable=True))
+    add_column('location', sa.Column('longitude_e7', sa.Integer(), nullable=True))
+    backfill_table(
+        'location',
+        'latitude_e7 = CAST(ROUND(latitude * 10000000) AS INTEGER), '
+        'longitude_e7 = CAST(ROUND(longitude * 10000000) AS INTEGER)',
+        where='latitude_e7 IS NULL'
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # NOT VALID + VALIDATE checks existing rows without blocking writes, and the
+        # validated IS NOT NULL check lets SET NOT NULL skip its own table scan
+        for name, check in (('ck_location_latitude_e7', LATITUDE_CHECK),
+                            ('ck_location_longitude_e7', LONGITUDE_CHECK),
+                            ('ck_location_e7_not_null', 'latitude_e7 IS NOT NULL AND longitude_e7 IS NOT NULL')):
+            op.execute(f'ALTER TABLE location ADD CONSTRAINT {name} CHECK ({check}) NOT VALID')
+            op.execute(f'ALTER TABLE location VALIDATE CONSTRAINT {name}')
+        op.alter_column('location', 'latitude_e7', nullable=False)
+        op.alter_column('location', 'longitude_e7', nullable=False)
+        op.drop_constraint('ck_location_e7_not_null', 'location', type_='check')
+        op.drop_column('location', 'latitude')
+        op.drop_column('location', 'longitude')
+    else:
+        # SQLite cannot add constraints in place, so this step rebuilds the table
+        with op.batch_alter_table('location', schema=None) as batch_op:
+            batch_op.alter_column('latitude_e7', existing_type=sa.Integer(), nullable=False)
+            batch_op.alter_column('longitude_e7', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_check_constraint('ck_location_latitude_e7', LATITUDE_CHECK)
+            batch_op.create_check_constraint('ck_location_longitude_e7', LONGITUDE_CHECK)
+            batch_op.drop_column('latitude')
+            batch_op.drop_column('longitude')
+
+    # The composite index starts with user_id, so the single-column index is redundant
+    create_index('ix_location_user_coords', 'location', ['user_id', 'latitude_e7', 'longitude_e7'])
+    drop_index('ix_location_user_id', 'location')
+
+
+def downgrade():
+    create_index('ix_location_user_id', 'location', ['user_id'])
+    drop_index('ix_location_user_coords', 'location')
+
+    with op.batch_alter_table('location', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=False, server_default='0.0'))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=False, server_default='0.0'))
+    op.execute('UPDATE location SET latitude = latitude_e7 / 10000000.0, longitude = longitude_e7 / 10000000.0')
+    with op.batch_alter_table('location', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_location_latitude_e7', type_='check')
+        batch_op.drop_constraint('ck_location_longitude_e7', type_='check')
+        batch_op.drop_column('latitude_e7')
+        batch_op.drop_column('longitude_e7')
@@ -0,0 +1,28 @@
+"""Add typed query to comparison history
+
+Revision ID: 9a4e7c1d3b60
+Revises: f3a81c6d52e9
+Create Date: 2026-10-19 21:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.online_migrations import add_column
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e7c1d3b60'
+down_revision = 'f3a81c6d52e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Not backfilled: earlier comparisons only kept Google's formatted address
+    add_column('comparison_history', sa.Column('new_query', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('comparison_history', schema=None) as batch_op:
+        batch_op.drop_column('new_query')
@@ -0,0 +1,30 @@
+"""Add place_id to location
+
+Revision ID: a6c3e8d19f72
+Revises: 4f0d6a3e2c58
+Create Date: 2026-10-19 16:05:33.917402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.online_migrations import add_column, create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3e8d19f72'
+down_revision = '4f0d6a3e2c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are backfilled lazily when the place is geocoded again
+    add_column('location', sa.Column('place_id', sa.String(length=255), nullable=True))
+    create_index('uq_location_user_place', 'location', ['user_id', 'place_id'], unique=True)
+
+
+def downgrade():
+    drop_index('uq_location_user_place', 'location')
+    with op.batch_alter_table('location', schema=None) as batch_op:
+        batch_op.drop_column('place_id')
@@ -0,0 +1,43 @@
+"""Add geocode and travel time caches
+
+Revision ID: b2d94f7c1e05
+Revises: a6c3e8d19f72
+Create Date: 2026-10-19 16:48:12.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d94f7c1e05'
+down_revision = 'a6c3e8d19f72'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('geocode_cache',
+    sa.Column('query_key', sa.String(length=255), nullable=False),
+    sa.Column('formatted_address', sa.String(length=255), nullable=False),
+    sa.Column('latitude_e7', sa.Integer(), nullable=False),
+    sa.Column('longitude_e7', sa.Integer(), nullable=False),
+    sa.Column('place_id', sa.String(length=255), nullable=True),
+    sa.Column('updated_date', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('query_key')
+    )
+    op.create_table('travel_time_cache',
+    sa.Column('origin_lat_q', sa.Integer(), nullable=False),
+    sa.Column('origin_lng_q', sa.Integer(), nullable=False),
+    sa.Column('destination', sa.String(length=255), nullable=False),
+    sa.Column('mode', sa.String(length=16), nullable=False),
+    sa.Column('seconds', sa.Integer(), nullable=True),
+    sa.Column('meters', sa.Integer(), nullable=True),
+    sa.Column('updated_date', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('origin_lat_q', 'origin_lng_q', 'destination', 'mode')
+    )
+
+
+def downgrade():
+    op.drop_table('travel_time_cache')
+    op.drop_table('geocode_cache')
@@ -0,0 +1,56 @@
+"""Normalize user emails and add a case-insensitive unique index
+
+Revision ID: c5d2a8f1e6b4
+Revises: 3b7e1c9d4a21
+Create Date: 2026-10-19 11:02:17.530114
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.online_migrations import backfill_table, create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d2a8f1e6b4'
+down_revision = '3b7e1c9d4a21'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # Accounts that only differ by case: keep the oldest one, move the locations of
+    # the others onto it and flag them with an email that can no longer log in
+    groups = bind.execute(sa.text(
+        "SELECT lower(trim(email)) FROM users "
+        "GROUP BY lower(trim(email)) HAVING count(*) > 1"
+    )).fetchall()
+    for (email,) in groups:
+        ids = [row[0] for row in bind.execute(
+            sa.text("SELECT id FROM users WHERE lower(trim(email)) = :email ORDER BY id"),
+            {"email": email}
+        )]
+        keeper, duplicates = ids[0], ids[1:]
+        for duplicate in duplicates:
+            bind.execute(
+                sa.text("UPDATE location SET user_id = :keeper WHERE user_id = :duplicate"),
+                {"keeper": keeper, "duplicate": duplicate}
+            )
+            bind.execute(
+                sa.text("UPDATE users SET email = :flagged WHERE id = :duplicate"),
+                {"flagged": f"duplicate-of-{keeper}+{duplicate}+{email}"[:150], "duplicate": duplicate}
+            )
+            logger.info(f"Merged duplicate user {duplicate} into {keeper}")
+
+    backfill_table('users', 'email = lower(trim(email))', where='email != lower(trim(email))')
+    create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    drop_index('ix_users_email_lower', 'users')
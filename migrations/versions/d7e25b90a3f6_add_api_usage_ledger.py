@@ -0,0 +1,37 @@
+"""Add API usage ledger
+
+Revision ID: d7e25b90a3f6
+Revises: b2d94f7c1e05
+Create Date: 2026-10-19 18:02:41.205118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.online_migrations import add_column
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e25b90a3f6'
+down_revision = 'b2d94f7c1e05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('api_usage',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('endpoint', sa.String(length=64), nullable=False),
+    sa.Column('mode', sa.String(length=16), nullable=False),
+    sa.Column('requests', sa.Integer(), nullable=False),
+    sa.Column('elements', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'user_id', 'endpoint', 'mode')
+    )
+    add_column('users', sa.Column('api_daily_budget', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('api_daily_budget')
+    op.drop_table('api_usage')
@@ -0,0 +1,47 @@
+"""Add comparison history table
+
+Revision ID: e91f4c27b8d3
+Revises: c5d2a8f1e6b4
+Create Date: 2026-10-19 13:40:05.284761
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91f4c27b8d3'
+down_revision = 'c5d2a8f1e6b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('comparison_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('saved_location_id', sa.Integer(), nullable=False),
+    sa.Column('new_address', sa.String(length=255), nullable=True),
+    sa.Column('new_lat_q', sa.Integer(), nullable=False),
+    sa.Column('new_lng_q', sa.Integer(), nullable=False),
+    sa.Column('driving_seconds', sa.Integer(), nullable=True),
+    sa.Column('driving_meters', sa.Integer(), nullable=True),
+    sa.Column('walking_seconds', sa.Integer(), nullable=True),
+    sa.Column('walking_meters', sa.Integer(), nullable=True),
+    sa.Column('bicycling_seconds', sa.Integer(), nullable=True),
+    sa.Column('bicycling_meters', sa.Integer(), nullable=True),
+    sa.Column('transit_seconds', sa.Integer(), nullable=True),
+    sa.Column('transit_meters', sa.Integer(), nullable=True),
+    sa.Column('created_date', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['saved_location_id'], ['location.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # A new, empty table: no need to build the index concurrently
+    op.create_index('ix_comparison_history_lookup', 'comparison_history',
+                    ['user_id', 'saved_location_id', 'new_lat_q', 'new_lng_q', 'created_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comparison_history_lookup', table_name='comparison_history')
+    op.drop_table('comparison_history')
@@ -0,0 +1,23 @@
+"""Index geocode cache coordinates
+
+Revision ID: f3a81c6d52e9
+Revises: d7e25b90a3f6
+Create Date: 2026-10-19 17:05:12.481903
+
+"""
+from app.utils.online_migrations import create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a81c6d52e9'
+down_revision = 'd7e25b90a3f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index('ix_geocode_cache_coords', 'geocode_cache', ['latitude_e7', 'longitude_e7'])
+
+
+def downgrade():
+    drop_index('ix_geocode_cache_coords', 'geocode_cache')
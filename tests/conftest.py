@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 from app import create_app, db
 from app.config import TestConfig
 from app.models import User
@@ -63,3 +64,21 @@ def auth(client):
             return self._client.get('/logout', follow_redirects=True)
 
     return AuthActions(client)
+
+@pytest.fixture(scope='function')
+def maps_standin():
+    """
+    Route Google Maps requests to the local stand-in, with an API key configured.
+    Yields the requests.get mock, so tests can count the calls made.
+    """
+    from app.utils.maps_standin import create_standin_app
+
+    standin = create_standin_app().test_client()
+
+    def standin_get(url, params=None, timeout=None):
+        response = standin.get(url.split('googleapis.com', 1)[-1], query_string=params)
+        return type('Response', (), {'json': lambda self: response.get_json()})()
+
+    with patch.dict('os.environ', {'GOOGLE_API_KEY': 'test-key'}), \
+            patch('requests.get', side_effect=standin_get) as mock_get:
+        yield mock_get
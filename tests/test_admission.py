@@ -0,0 +1,70 @@
+import threading
+import time
+
+from app.utils import admission
+
+
+def test_admission_queues_and_sheds(monkeypatch):
+    """
+    Test that requests past the limits wait in a bounded queue or are shed.
+    """
+    monkeypatch.setitem(admission._settings, 'max_in_flight', 1)
+    monkeypatch.setitem(admission._settings, 'per_user', 1)
+    monkeypatch.setitem(admission._settings, 'max_queue', 1)
+    monkeypatch.setitem(admission._settings, 'queue_seconds', 5)
+
+    assert admission.admit('a', 'test.slow') is None
+    assert admission.admit('a', 'test.slow') == 'user'
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(admission.admit('b', 'test.slow')))
+    waiter.start()
+    while not admission._state['waiting']:
+        time.sleep(0.01)
+    assert admission.admit('c', 'test.slow') == 'busy'
+
+    admission.release('a', 'test.slow', 1.5)
+    waiter.join(5)
+    assert results == [None]
+
+    monkeypatch.setitem(admission._settings, 'queue_seconds', 0.05)
+    assert admission.admit('d', 'test.slow') == 'timeout'
+    admission.release('b', 'test.slow', 0.5)
+
+    stats = next(row for row in admission.get_admission_stats()['endpoints'] if row['endpoint'] == 'test.slow')
+    assert (stats['admitted'], stats['queued'], stats['shed_user'], stats['shed_busy'], stats['shed_timeout']) == \
+           (2, 2, 1, 1, 1)
+    assert admission.retry_after('test.slow') == 1
+    assert admission._state['in_flight'] == 0 and not admission._per_user
+
+
+def test_expensive_route_shed_with_retry_after(app, client, auth):
+    """
+    Test that a user over their limit gets a 429 while cheap routes are still served.
+    """
+    from app.models import User
+
+    auth.login()
+    user = User.query.filter_by(email='test@example.com').first()
+    held = app.config['ADMISSION_PER_USER']
+    for _ in range(held):
+        assert admission.admit(user.id, 'main.commute_profile') is None
+    try:
+        response = client.get('/api/commute_profile?from=1&to=2')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert 'error' in response.get_json()
+        assert client.get('/api/clusters').status_code == 200
+    finally:
+        for _ in range(held):
+            admission.release(user.id, 'main.commute_profile', 0.1)
+
+    # Admitted again once the slots are free, and the slot is returned after the request
+    assert client.get('/api/commute_profile?from=1&to=2').status_code == 404
+    assert admission._state['in_flight'] == 0
+
+    app.config['ADMIN_EMAILS'] = ['test@example.com']
+    stats = client.get('/admin/admission?format=json').get_json()
+    row = next(row for row in stats['endpoints'] if row['endpoint'] == 'main.commute_profile')
+    assert row['shed_user'] >= 1 and row['admitted'] >= held + 1
+    assert b'Admission Control' in client.get('/admin/admission').data
@@ -0,0 +1,51 @@
+import gzip
+import shutil
+from app.utils.assets import build_assets, init_assets
+
+
+def test_build_assets(tmp_path):
+    """
+    Test that static files are fingerprinted and text assets precompressed.
+    """
+    (tmp_path / 'styles.css').write_text('body { color: red; }')
+    (tmp_path / 'favicon.ico').write_bytes(b'\x00\x01')
+
+    manifest = build_assets(str(tmp_path))
+
+    css = manifest['styles.css']
+    assert css.startswith('dist/styles.') and css.endswith('.css')
+    assert (tmp_path / css).read_text() == 'body { color: red; }'
+    assert gzip.decompress((tmp_path / (css + '.gz')).read_bytes()) == b'body { color: red; }'
+    # Binary formats are copied but not compressed
+    assert not (tmp_path / (manifest['favicon.ico'] + '.gz')).exists()
+
+    # Rebuilding is deterministic and does not fingerprint previous output
+    assert build_assets(str(tmp_path)) == manifest
+
+def test_fingerprinted_assets_served(app, tmp_path):
+    """
+    Test that url_for picks up hashed names served with immutable cache headers.
+    """
+    static = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static)
+    manifest = build_assets(str(static))
+    app.static_folder = str(static)
+    init_assets(app)
+
+    client = app.test_client()
+    response = client.get('/')
+    assert manifest['styles.css'].encode() in response.data
+
+    response = client.get('/static/' + manifest['styles.css'], headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert b'font-family' in gzip.decompress(response.data)
+    response.close()
+
+    # Unbuilt names still resolve normally
+    response = client.get('/static/styles.css')
+    assert response.status_code == 200
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    response.close()
@@ -54,3 +54,67 @@ def test_login_logout(client, db_session):
     # Attempt logout
     response = client.get('/logout', follow_redirects=True)
     assert b"Login" in response.data
+
+def test_login_is_case_insensitive(client, db_session):
+    from app.models import User
+
+    user = User(email='Mixed.Case@Example.com ')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+
+    # Emails are stored normalized
+    assert user.email == 'mixed.case@example.com'
+
+    response = client.post('/login', data={
+        'email': 'MIXED.case@example.COM',
+        'password': 'password123'
+    }, follow_redirects=True)
+
+    assert b"Logout" in response.data
+
+def test_register_rejects_case_variant_duplicate(client, db_session):
+    from app.models import User
+
+    response = client.post('/register', data={
+        'email': 'new@example.com',
+        'password': 'SecurePass123!'
+    }, follow_redirects=True)
+    assert b"Registration successful" in response.data
+
+    response = client.post('/register', data={
+        'email': 'NEW@Example.com',
+        'password': 'SecurePass123!'
+    }, follow_redirects=True)
+    assert b"That email address is already in use." in response.data
+    assert User.query.count() == 1
+
+def test_breached_password_filter(tmp_path):
+    """
+    Test that passwords in the breached password filter are rejected.
+    """
+    import hashlib
+    from app.utils.bloom import BloomFilter, build_bloom_filter
+    from app.utils.password import load_breached_passwords
+
+    breached = [f'Breached{i}!' for i in range(1000)]
+    hashed = hashlib.sha1(b'Hashed123!').hexdigest().upper() + ':42'
+    source = tmp_path / 'passwords.txt'
+    source.write_text('\n'.join(breached + [hashed]) + '\n')
+    stats = build_bloom_filter(str(source), str(tmp_path / 'passwords.bloom'), fp_rate=0.01)
+    assert stats['count'] == 1001
+
+    bloom = BloomFilter(str(tmp_path / 'passwords.bloom'))
+    assert all(password in bloom for password in breached)
+    false_positives = sum(f'Unlisted{i}?' in bloom for i in range(10000))
+    assert false_positives < 300  # 1% target, with slack
+
+    load_breached_passwords(str(tmp_path / 'passwords.bloom'))
+    try:
+        is_secure, message = is_password_secure('Breached7!')
+        assert not is_secure
+        assert 'breach' in message
+        assert not is_password_secure('Hashed123!')[0]
+        assert is_password_secure('Unlisted!Passw0rd')[0]
+    finally:
+        load_breached_passwords(None)
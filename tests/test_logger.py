@@ -0,0 +1,51 @@
+import json
+import logging
+import queue
+from flask import g
+from app.logger import BoundedQueueHandler, DebugSamplingFilter, JsonFormatter, get_log_stats
+
+
+def _record(level=logging.INFO, msg='hello'):
+    return logging.LogRecord('test', level, __file__, 1, msg, None, None)
+
+def test_json_formatter_includes_request_id(app):
+    """
+    Test that records logged inside a request carry its request id.
+    """
+    handler = BoundedQueueHandler(queue.Queue())
+    with app.test_request_context('/'):
+        g.request_id = 'abc123'
+        record = handler.prepare(_record())
+
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload['request_id'] == 'abc123'
+    assert payload['message'] == 'hello'
+    assert payload['level'] == 'INFO'
+
+def test_full_queue_drops_instead_of_blocking():
+    """
+    Test that a full queue drops records and counts them.
+    """
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1))
+    before = get_log_stats()['dropped']
+    handler.handle(_record())
+    handler.handle(_record())
+    handler.handle(_record())
+    assert get_log_stats()['dropped'] == before + 2
+
+def test_debug_sampling():
+    """
+    Test that sampling only discards DEBUG records.
+    """
+    sampler = DebugSamplingFilter(0.0)
+    assert not sampler.filter(_record(logging.DEBUG))
+    assert sampler.filter(_record(logging.WARNING))
+    assert DebugSamplingFilter(1.0).filter(_record(logging.DEBUG))
+
+def test_response_carries_request_id(client):
+    """
+    Test that an incoming X-Request-ID is echoed back.
+    """
+    response = client.get('/', headers={'X-Request-ID': 'req-42'})
+    assert response.headers['X-Request-ID'] == 'req-42'
+    assert client.get('/').headers['X-Request-ID']
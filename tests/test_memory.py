@@ -0,0 +1,50 @@
+from app.utils import memory
+
+
+def test_rss_history_is_sampled_after_requests(app, client):
+    """
+    Test that requests append RSS samples to the worker's ring buffer.
+    """
+    memory._history.clear()
+    memory.record_sample(force=True)
+    client.get('/login')
+    history = memory.get_memory_history()
+    assert history and history[-1]['rss_mb'] > 0
+    assert memory.should_recycle(1) and not memory.should_recycle(0)
+
+
+def test_snapshot_diff_groups_by_module():
+    """
+    Test that allocations made after the baseline are attributed to their module.
+    """
+    memory.start_tracing()
+    try:
+        retained = [bytearray(1024) for _ in range(2000)]
+        diff = memory.snapshot_diff(depth=2)
+        top = {row['module'].rsplit('.', 1)[-1]: row for row in diff['modules']}
+        assert top['test_memory']['size_diff'] > 1024 * 1024
+        assert len(retained) == 2000
+    finally:
+        memory.stop_tracing()
+    assert memory.snapshot_diff() is None
+
+
+def test_memory_view_requires_admin(app, client, auth):
+    """
+    Test that the memory report is only shown to admins.
+    """
+    auth.login()
+    assert client.get('/admin/memory').status_code == 403
+
+    app.config['ADMIN_EMAILS'] = ['test@example.com']
+    client.post('/admin/memory/tracing', data={'action': 'start'})
+    try:
+        report = client.get('/admin/memory?format=json&objects=1').get_json()
+        assert report['tracing'] and report['diff'] is not None
+        assert 'Autocomplete predictions' in report['caches']
+        assert report['objects']
+        assert {'enqueued', 'dropped', 'sampled_out'} <= set(report['logging'])
+        assert report['database']['primary_reads'] > 0
+        assert b'Memory Diagnostics' in client.get('/admin/memory').data
+    finally:
+        client.post('/admin/memory/tracing', data={'action': 'stop'})
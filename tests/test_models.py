@@ -158,4 +158,26 @@ def test_location_required_fields(db_session):
         db_session.session.commit()
         assert False, "Should have raised an IntegrityError for missing longitude"
     except IntegrityError:
-        db_session.session.rollback()
\ No newline at end of file
+        db_session.session.rollback()
+
+def test_location_coordinates_stored_as_e7(db_session):
+    """
+    Test that coordinates are stored as exact integers behind the float API.
+    """
+    user = User(email='test@example.com')
+    user.set_password('securepass')
+    db_session.session.add(user)
+    db_session.session.commit()
+
+    location = Location(name='Home', address='Somewhere', latitude=51.5007292, longitude=-0.1246254, user_id=user.id)
+    db_session.session.add(location)
+    db_session.session.commit()
+
+    assert location.latitude_e7 == 515007292
+    assert location.longitude_e7 == -1246254
+    assert location.latitude == 51.5007292
+
+    # Exact integer keys make equality lookups reliable
+    found = Location.query.filter_by(latitude_e7=515007292, longitude_e7=-1246254).one()
+    assert found.id == location.id
+    assert Location.query.filter(Location.latitude > 51.5).count() == 1
@@ -0,0 +1,61 @@
+import json
+from app.utils.profiling import INDEX_FILE, list_profiles, make_profile_token, save_profile
+
+
+def test_profile_token_writes_speedscope_report(app, client, tmp_path):
+    """
+    Test that a request with a valid token is profiled into PROFILE_DIR.
+    """
+    app.config['PROFILE_DIR'] = str(tmp_path)
+    for mode in ('sample', 'trace'):
+        response = client.get('/login', headers={'X-Profile': make_profile_token(app.secret_key, mode)})
+        assert response.status_code == 200
+        response.close()  # The profile is saved once the server closes the response
+        profile_id = response.headers['X-Profile-Id']
+
+        document = json.loads((tmp_path / f'{profile_id}.speedscope.json').read_text())
+        assert document['profiles'][0]['type'] == ('sampled' if mode == 'sample' else 'evented')
+        if mode == 'trace':
+            names = {document['shared']['frames'][e['frame']]['name'] for e in document['profiles'][0]['events']}
+            assert 'login' in names
+
+    profiles = list_profiles(str(tmp_path))
+    assert [p['mode'] for p in profiles] == ['trace', 'sample']
+    assert profiles[0]['path'] == '/login' and profiles[0]['status'] == 200
+
+
+def test_save_profile_prunes_index(tmp_path):
+    """
+    Test that old profiles and their index entries are removed beyond max_files.
+    """
+    for i in range(5):
+        save_profile(str(tmp_path), f'profile-{i}', {}, {'mode': 'sample', 'path': f'/{i}'}, max_files=3)
+
+    assert sorted(p.name for p in tmp_path.glob('*.speedscope.json')) == \
+           [f'profile-{i}.speedscope.json' for i in (2, 3, 4)]
+    assert len((tmp_path / INDEX_FILE).read_text().splitlines()) == 3
+    assert [p['path'] for p in list_profiles(str(tmp_path))] == ['/4', '/3', '/2']
+
+
+def test_forged_profile_token_is_ignored(app, client, tmp_path):
+    """
+    Test that requests without a valid token are not profiled.
+    """
+    app.config['PROFILE_DIR'] = str(tmp_path)
+    forged = make_profile_token('not-the-secret', 'sample')
+    assert 'X-Profile-Id' not in client.get('/login?_profile=' + forged).headers
+    assert 'X-Profile-Id' not in client.get('/login').headers
+    assert list_profiles(str(tmp_path)) == []
+
+
+def test_profiles_view_requires_admin(app, client, auth):
+    """
+    Test that only users listed in ADMIN_EMAILS can see the profiles.
+    """
+    auth.login()
+    assert client.get('/admin/profiles').status_code == 403
+
+    app.config['ADMIN_EMAILS'] = ['test@example.com']
+    response = client.get('/admin/profiles')
+    assert response.status_code == 200
+    assert b'Request Profiles' in response.data
@@ -0,0 +1,79 @@
+from app.models import User, Location
+
+
+def test_reads_routed_to_replica(tmp_path):
+    """
+    Test that GET requests read from the replica bind, and that reads after a write
+    in the same request go to the primary.
+    """
+    from app import create_app, db
+    from app.config import TestConfig
+
+    class ReplicaConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        REPLICA_DATABASE_URLS = [f"sqlite:///{tmp_path / 'replica.db'}"]
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        replica = app.extensions['db_replicas']['replica_0']
+        db.metadata.create_all(replica)
+        # Give each database a recognisably different copy of the same row
+        for engine, name in ((db.engine, 'Primary copy'), (replica, 'Replica copy')):
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert(), {'id': 1, 'email': 'r@example.com', 'password_hash': 'x'})
+                connection.execute(Location.__table__.insert(), {
+                    'name': name, 'address': 'a', 'latitude_e7': 10000000, 'longitude_e7': 20000000, 'user_id': 1
+                })
+
+    with app.test_request_context('/locations', method='GET'):
+        app.preprocess_request()
+        assert Location.query.first().name == 'Replica copy'
+
+        # Once this request has written, it reads its own writes from the primary
+        db.session.add(Location(name='New', address='b', latitude=1.0, longitude=2.0, user_id=1))
+        db.session.commit()
+        assert Location.query.first().name == 'Primary copy'
+        db.session.remove()
+
+    with app.test_request_context('/locations', method='POST'):
+        app.preprocess_request()
+        assert Location.query.first().name == 'Primary copy'
+        db.session.remove()
+
+
+def test_cluster_cache_filled_from_primary(tmp_path):
+    """
+    Test that cached clusters are read from the primary, so a lagging replica cannot
+    keep a new location off the map until the cache expires.
+    """
+    from app import create_app, db
+    from app.config import TestConfig
+    from app.services.clusters import _cluster_cache, get_clusters
+
+    class ReplicaConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        REPLICA_DATABASE_URLS = [f"sqlite:///{tmp_path / 'replica.db'}"]
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        replica = app.extensions['db_replicas']['replica_0']
+        db.metadata.create_all(replica)
+        # The replica has not caught up with the second location yet
+        for engine, count in ((db.engine, 2), (replica, 1)):
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert(), {'id': 1, 'email': 'c@example.com', 'password_hash': 'x'})
+                for i in range(count):
+                    connection.execute(Location.__table__.insert(), {
+                        'name': f'Stop {i}', 'address': 'a', 'latitude_e7': 100000000 + i * 100000000,
+                        'longitude_e7': 200000000, 'user_id': 1
+                    })
+
+    _cluster_cache.clear()
+    with app.test_request_context('/api/clusters', method='GET'):
+        app.preprocess_request()
+        assert Location.query.count() == 1
+        assert get_clusters(1, zoom=3)['total'] == 2
+        db.session.remove()
+    _cluster_cache.clear()
@@ -1,3 +1,6 @@
+import gzip
+import json
+
 def test_homepage(client):
     """
     Test that the homepage loads successfully.
@@ -69,4 +72,206 @@ def test_add_location_validation(client, auth):
     }, follow_redirects=True)
     
     assert response.status_code == 200
-    assert b"Both name and address are required" in response.data
\ No newline at end of file
+    assert b"Both name and address are required" in response.data
+
+def test_html_response_compressed(client, auth):
+    """
+    Test that large HTML responses are gzipped when the client accepts it.
+    """
+    auth.login()
+    response = client.get('/locations', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    assert b"My Locations" in gzip.decompress(response.data)
+
+    # Clients that do not advertise gzip get the plain body
+    response = client.get('/locations')
+    assert 'Content-Encoding' not in response.headers
+    assert b"My Locations" in response.data
+
+def test_autocomplete_endpoint(client, auth):
+    """
+    Test that the autocomplete endpoint requires login and returns JSON.
+    """
+    response = client.get('/api/autocomplete?q=lon')
+    assert response.status_code == 302
+
+    auth.login()
+    response = client.get('/api/autocomplete?q=lo')  # Too short to query
+    assert response.status_code == 200
+    assert response.get_json() == {'suggestions': []}
+
+def test_export_locations(client, auth):
+    """
+    Test streaming exports in each format, resuming by id and gzip encoding.
+    """
+    from app import db
+    from app.models import Location, User
+
+    auth.login()
+    user = User.find_by_email('test@example.com')
+    for i in range(3):
+        db.session.add(Location(name=f'Place {i}', address=f'{i} Test St',
+                                latitude=51.5 + i, longitude=-0.1, user_id=user.id))
+    db.session.commit()
+    first_id = Location.query.order_by(Location.id).first().id
+
+    response = client.get('/export/locations.csv')
+    assert response.status_code == 200
+    assert response.is_streamed
+    lines = response.data.decode().splitlines()
+    assert lines[0] == 'id,name,address,latitude,longitude'
+    assert len(lines) == 4
+
+    response = client.get(f'/export/locations.ndjson?after_id={first_id}')
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['name'] for row in rows] == ['Place 1', 'Place 2']
+
+    response = client.get('/export/locations.geojson', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    collection = json.loads(gzip.decompress(response.data))
+    assert len(collection['features']) == 3
+    assert collection['features'][0]['geometry']['coordinates'] == [-0.1, 51.5]
+
+    assert client.get('/export/locations.xml').status_code == 404
+
+def test_history_page(client, auth):
+    """
+    Test that the history page and comparison export load for logged in users.
+    """
+    assert client.get('/history').status_code == 302
+
+    auth.login()
+    response = client.get('/history')
+    assert response.status_code == 200
+    assert b"Comparison History" in response.data
+
+    response = client.get('/export/comparisons.csv')
+    assert response.status_code == 200
+    assert response.data.decode().startswith('id,created_date,saved_location_id')
+
+def test_location_clusters(client, auth):
+    """
+    Test that locations are clustered per zoom, filtered by viewport and refreshed after writes.
+    """
+    from app import db
+    from app.models import Location, User
+    from app.services.clusters import _cluster_cache
+
+    _cluster_cache.clear()
+    auth.login()
+    user = User.find_by_email('test@example.com')
+    for i in range(5):
+        db.session.add(Location(name=f'London {i}', address=f'{i} London Rd',
+                                latitude=51.50 + i * 0.001, longitude=-0.12, user_id=user.id))
+    db.session.add(Location(name='Paris', address='Paris', latitude=48.8566, longitude=2.3522, user_id=user.id))
+    db.session.commit()
+
+    data = client.get('/api/clusters?zoom=4').get_json()
+    assert sorted(c['count'] for c in data['clusters']) == [1, 5]
+    assert [c['name'] for c in data['clusters'] if c['count'] == 1] == ['Paris']
+    assert data['bounds']['north'] == 51.504
+
+    data = client.get('/api/clusters?zoom=4&bbox=-1,51,0,52').get_json()
+    assert [c['count'] for c in data['clusters']] == [5]
+
+    # Close in, every London location gets its own marker
+    data = client.get('/api/clusters?zoom=18&bbox=-0.2,51.4,0,51.6').get_json()
+    assert data['total'] == 5 and len(data['clusters']) == 5
+
+    db.session.add(Location(name='London 5', address='5 London Rd', latitude=51.5, longitude=-0.1205, user_id=user.id))
+    db.session.commit()
+    data = client.get('/api/clusters?zoom=4&bbox=-1,51,0,52').get_json()
+    assert [c['count'] for c in data['clusters']] == [6]
+
+    assert client.get('/api/clusters?zoom=4&bbox=1,2').status_code == 400
+    assert client.get('/api/clusters?zoom=30').status_code == 400
+
+def test_admin_usage_report(app, client, auth):
+    """
+    Test that admins can see API usage and set a user's budget.
+    """
+    from app.models import User
+    from app.services import usage
+
+    auth.login()
+    assert client.get('/admin/usage').status_code == 403
+
+    app.config['ADMIN_EMAILS'] = ['test@example.com']
+    user = User.query.filter_by(email='test@example.com').first()
+    usage.record_usage('geocode/json', {'address': 'Somewhere'}, user_id=user.id)
+
+    report = client.get('/admin/usage?format=json').get_json()
+    entry = next(row for row in report['users'] if row['user_id'] == user.id)
+    assert entry['email'] == 'test@example.com' and entry['requests'] >= 1
+
+    client.post(f'/admin/usage/{user.id}/budget', data={'budget': '50'})
+    assert User.query.get(user.id).api_daily_budget == 50
+    assert b'Google API Usage' in client.get('/admin/usage').data
+
+def test_budget_exceeded_reported_by_routes(client, auth):
+    """
+    Test that a user over their daily Google budget is told so rather than that the address is invalid.
+    """
+    from unittest.mock import patch
+    from app import db
+    from app.models import Location, User
+    from app.services import usage
+
+    auth.login()
+    user = User.query.filter_by(email='test@example.com').first()
+    location = Location(name='Office', address='4 Office Road', latitude=51.5, longitude=-0.1, user_id=user.id)
+    db.session.add(location)
+    db.session.commit()
+    usage._used_today.clear()
+    usage.set_user_budget(user.id, 1)
+    usage.record_usage('geocode/json', {'address': 'Somewhere'}, user_id=user.id)
+
+    with patch.dict('os.environ', {'GOOGLE_API_KEY': 'test-key'}), patch('requests.get') as mock_get:
+        response = client.post('/locations', data={'name': 'Home', 'address': '5 New Road'}, follow_redirects=True)
+        assert b'budget' in response.data and b'Could not verify' not in response.data
+
+        response = client.post('/compare_travel', data={'new_location': '6 New Road',
+                                                        'saved_location_id': location.id}, follow_redirects=True)
+        assert b'budget' in response.data and b'Could not verify' not in response.data
+
+        response = client.get('/api/reverse_geocode?lat=10&lng=10')
+        assert response.status_code == 429 and 'budget' in response.get_json()['error']
+        assert not mock_get.called
+
+def test_reverse_geocode_endpoint(client, auth):
+    """
+    Test that a clicked point near a saved location resolves to it.
+    """
+    from app import db
+    from app.models import Location, User
+
+    auth.login()
+    user = User.query.filter_by(email='test@example.com').first()
+    db.session.add(Location(name='Gym', address='2 Gym Lane', latitude=52.0, longitude=0.5, user_id=user.id))
+    db.session.commit()
+
+    data = client.get('/api/reverse_geocode?lat=52.0001&lng=0.5001').get_json()
+    assert data['formatted_address'] == '2 Gym Lane' and data['types'] == ['saved']
+    assert client.get('/api/reverse_geocode?lat=52').status_code == 400
+    assert client.get('/api/reverse_geocode?lat=100&lng=0').status_code == 400
+
+def test_trip_page(client, auth):
+    """
+    Test that the trip planner lists saved locations and rejects a trip with one stop.
+    """
+    from app import db
+    from app.models import Location, User
+
+    auth.login()
+    user = User.query.filter_by(email='test@example.com').first()
+    location = Location(name='Shop', address='3 Shop Street', latitude=51.5, longitude=-0.1, user_id=user.id)
+    db.session.add(location)
+    db.session.commit()
+
+    response = client.get('/trip')
+    assert response.status_code == 200 and b'3 Shop Street' in response.data
+
+    response = client.post('/trip', data={'start_id': location.id, 'location_ids': [location.id]})
+    assert b'Choose at least two locations.' in response.data
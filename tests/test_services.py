@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import patch
 from app.services.travel import get_travel_times, compare_locations
 from app.models import Location, User
+from sqlalchemy.exc import IntegrityError
 
 # Mock API response for get_travel_times
 @pytest.fixture
@@ -85,14 +86,14 @@ def test_compare_locations_invalid_location(db_session):
 
 # Test compare_locations with missing coordinates
 def test_compare_locations_missing_coordinates(db_session):
-    """Test that comparing locations with invalid coordinates raises an error."""
+    """Test that invalid coordinates are rejected, by the database for saved locations."""
     # Create a test user
     user = User(email='test@example.com')
     user.set_password('password123')  # Set a password for the user
     db_session.session.add(user)
     db_session.session.commit()
 
-    # Add a location with invalid coordinates
+    # Saved locations with invalid coordinates can no longer be stored
     location = Location(
         name='Test Location',
         address='123 Test St',
@@ -101,8 +102,765 @@ def test_compare_locations_missing_coordinates(db_session):
         longitude=-74.0060
     )
     db_session.session.add(location)
+    with pytest.raises(IntegrityError, match="CHECK constraint"):
+        db_session.session.commit()
+    db_session.session.rollback()
+
+    location = Location(name='Test Location', address='123 Test St', user_id=user.id,
+                        latitude=40.7128, longitude=-74.0060)
+    db_session.session.add(location)
     db_session.session.commit()
 
-    # Test that comparing locations with invalid coordinates raises an error
+    # Test that comparing with invalid new coordinates raises an error
     with pytest.raises(ValueError, match="Invalid coordinates"):
-        compare_locations((40.7128, -74.0060), location.id, user.id)
\ No newline at end of file
+        compare_locations((200.0, -74.0060), location.id, user.id)
+
+def test_compare_locations_on_the_equator(mock_api_response, db_session):
+    """Test that only the (0, 0) placeholder counts as missing coordinates."""
+    user = User(email='test@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+
+    equator = Location(name='Equator', address='Equator', latitude=0.0, longitude=32.58, user_id=user.id)
+    meridian = Location(name='Meridian', address='Meridian', latitude=51.4779, longitude=0.0, user_id=user.id)
+    placeholder = Location(name='Placeholder', address='Nowhere', latitude=0.0, longitude=0.0, user_id=user.id)
+    db_session.session.add_all([equator, meridian, placeholder])
+    db_session.session.commit()
+
+    with patch('requests.get') as mock_get:
+        mock_get.return_value.json.return_value = mock_api_response
+        for location in (equator, meridian):
+            _, results = compare_locations((0.3476, 32.5825), location.id, user.id)
+            assert results['driving']['duration'] == '30 mins'
+        with pytest.raises(ValueError, match="missing coordinates"):
+            compare_locations((0.3476, 32.5825), placeholder.id, user.id)
+
+# Test re-geocoding of placeholder coordinates
+def test_regeocode_placeholder_coordinates(db_session):
+    from app.models import MigrationCheckpoint
+    from app.services.address import regeocode_placeholder_coordinates
+
+    user = User(email='test@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+
+    db_session.session.add_all([
+        Location(name='Old 1', address='London', latitude=0.0, longitude=0.0, user_id=user.id),
+        Location(name='Fine', address='Paris', latitude=48.8566, longitude=2.3522, user_id=user.id),
+        Location(name='Old 2', address='Nowhere', latitude=0.0, longitude=0.0, user_id=user.id),
+    ])
+    db_session.session.commit()
+
+    def fake_verify(address):
+        if address == 'London':
+            return True, {'formatted_address': 'London, UK', 'lat': 51.5074, 'lng': -0.1278}
+        return False, {'error': 'Address not found'}
+
+    with patch('app.services.address.verify_address', side_effect=fake_verify) as mock_verify:
+        counts = regeocode_placeholder_coordinates(batch_size=1, sleep_seconds=0)
+
+    # Only placeholder rows are geocoded
+    assert mock_verify.call_count == 2
+    assert counts == {'processed': 2, 'updated': 1, 'failed': 1}
+    assert Location.query.filter_by(name='Old 1').first().latitude == 51.5074
+
+    checkpoint = db_session.session.get(MigrationCheckpoint, 'regeocode_placeholder_coordinates')
+    assert checkpoint.completed
+    assert checkpoint.processed == 2
+
+    # A second run resumes after the checkpoint and has nothing left to do
+    with patch('app.services.address.verify_address', side_effect=fake_verify) as mock_verify:
+        counts = regeocode_placeholder_coordinates(batch_size=1, sleep_seconds=0)
+    assert mock_verify.call_count == 0
+
+# Test autocomplete prefix cache
+def test_autocomplete_reuses_cached_prefix(db_session):
+    from app.services import autocomplete as autocomplete_service
+
+    autocomplete_service._prediction_cache.clear()
+    user = User(email='test@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+    db_session.session.add(Location(
+        name='Office', address='10 Downing Street, London', latitude=51.5034, longitude=-0.1276, user_id=user.id
+    ))
+    db_session.session.commit()
+
+    predictions = {
+        'status': 'OK',
+        'predictions': [
+            {'description': 'Downing Street, London, UK', 'place_id': 'p1'},
+            {'description': 'Downing College, Cambridge, UK', 'place_id': 'p2'},
+        ]
+    }
+    with patch('requests.get') as mock_get:
+        mock_get.return_value.json.return_value = predictions
+        results = autocomplete_service.autocomplete('Down', user.id, session_token='tok')
+
+        assert mock_get.call_count == 1
+        assert mock_get.call_args.kwargs['params']['sessiontoken'] == 'tok'
+        # Saved locations come first
+        assert results[0]['source'] == 'saved'
+        assert [r['place_id'] for r in results[1:]] == ['p1', 'p2']
+
+        # Longer queries are answered from the exhaustive prefix result
+        results = autocomplete_service.autocomplete('downing  col', user.id)
+        assert mock_get.call_count == 1
+        assert [r['place_id'] for r in results] == ['p2']
+
+# Test resolving an autocomplete suggestion
+def test_verify_address_with_place_id():
+    from app.services.address import verify_address
+
+    details = {
+        'status': 'OK',
+        'result': {
+            'formatted_address': 'Downing Street, London, UK',
+            'geometry': {'location': {'lat': 51.5034, 'lng': -0.1276}},
+            'place_id': 'p1',
+        }
+    }
+    with patch.dict('os.environ', {'GOOGLE_API_KEY': 'test-key'}), patch('requests.get') as mock_get:
+        mock_get.return_value.json.return_value = details
+        is_valid, result = verify_address('Downing Street', place_id='p1', session_token='tok')
+
+    assert is_valid
+    assert result['lat'] == 51.5034
+    assert result['place_id'] == 'p1'
+    assert 'place/details/json' in mock_get.call_args.args[0]
+    assert mock_get.call_args.kwargs['params']['sessiontoken'] == 'tok'
+
+# Test the offline gazetteer
+def test_gazetteer_build_and_lookup(tmp_path):
+    from app.services.gazetteer import Gazetteer, build_gazetteer
+
+    source = tmp_path / 'places.csv'
+    source.write_text(
+        'key,lat,lng,label\n'
+        'SW1A 1AA,51.501009,-0.141588,"London SW1A 1AA, UK"\n'
+        'Manchester,53.4808,-2.2426\n'
+        'Zurich,47.3769,8.5417\n'
+        'Köln,50.9375,6.9603\n'
+        'Kolo,52.2,18.63\n'
+        'Łódź,51.7592,19.456\n'
+    )
+    index = tmp_path / 'places.idx'
+    assert build_gazetteer(str(source), str(index)) == 6
+
+    gazetteer = Gazetteer(str(index))
+    assert gazetteer.lookup('sw1a1aa') == {'label': 'London SW1A 1AA, UK', 'lat': 51.501009, 'lng': -0.141588}
+    assert gazetteer.lookup('  manchester ')['label'] == 'Manchester'
+    assert gazetteer.lookup('Zurich')['lng'] == 8.5417
+    assert gazetteer.lookup('Zürich')['lng'] == 8.5417
+    assert gazetteer.lookup('koln')['label'] == 'Köln' and gazetteer.lookup('KÖLN')['label'] == 'Köln'
+    assert gazetteer.lookup('Kolo')['label'] == 'Kolo' and gazetteer.lookup('K ln') is None
+    assert gazetteer.lookup('łódź')['label'] == 'Łódź'
+    assert gazetteer.lookup('Aachen') is None
+    assert gazetteer.lookup('Zzz') is None
+
+    # Truncated indexes are rejected as ValueError, which create_app skips
+    truncated = tmp_path / 'truncated.idx'
+    truncated.write_bytes(index.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        Gazetteer(str(truncated))
+
+def test_short_packed_files_rejected(tmp_path):
+    """
+    Test that files shorter than their header raise ValueError rather than struct.error.
+    """
+    from app.services.gazetteer import Gazetteer
+    from app.utils.bloom import BloomFilter
+
+    short = tmp_path / 'short.bin'
+    short.write_bytes(b'NWGZ\x01\x00\x00\x00')
+    with pytest.raises(ValueError):
+        Gazetteer(str(short))
+    with pytest.raises(ValueError):
+        BloomFilter(str(short))
+
+def test_verify_address_uses_gazetteer_first(tmp_path):
+    from app.services.address import verify_address
+    from app.services.gazetteer import build_gazetteer, load_gazetteer
+
+    source = tmp_path / 'places.csv'
+    source.write_text('M1 1AE,53.4794,-2.2453\n')
+    build_gazetteer(str(source), str(tmp_path / 'places.idx'))
+    load_gazetteer(str(tmp_path / 'places.idx'))
+
+    try:
+        with patch('requests.get') as mock_get:
+            is_valid, details = verify_address('m1 1ae')
+            assert is_valid
+            assert (details['lat'], details['lng']) == (53.4794, -2.2453)
+            assert not mock_get.called
+
+        # Misses fall through to Google
+        with patch.dict('os.environ', {'GOOGLE_API_KEY': 'test-key'}), patch('requests.get') as mock_get:
+            mock_get.return_value.json.return_value = {'status': 'ZERO_RESULTS'}
+            is_valid, _ = verify_address('Unknown Street')
+            assert not is_valid
+            assert mock_get.called
+    finally:
+        load_gazetteer(None)
+
+# Test commute profile sampling
+def test_build_slots_skips_past_departures():
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+    from app.services.commute import build_slots
+
+    # Wednesday 08:10
+    now = datetime(2026, 10, 21, 8, 10, tzinfo=ZoneInfo('Europe/London'))
+    slots = build_slots('weekdays', '07:00', '09:00', 30, now)
+
+    assert len(slots) == 5 * 5
+    assert all(slot > now for slot in slots)
+    wednesday = [s for s in slots if s.weekday() == 2]
+    # Departures already gone today move to next week
+    assert wednesday[0].day == 28 and wednesday[-1].day == 21
+
+    with pytest.raises(ValueError):
+        build_slots('weekdays', '10:00', '07:00', 15, now)
+
+def test_commute_profile_uses_slot_cache():
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+    from app.services import commute
+
+    commute._slot_cache.clear()
+    now = datetime(2026, 10, 21, 6, 0, tzinfo=ZoneInfo('Europe/London'))
+    response = {
+        'status': 'OK',
+        'rows': [{'elements': [{
+            'duration': {'value': 1200, 'text': '20 mins'},
+            'duration_in_traffic': {'value': 1500, 'text': '25 mins'},
+        }]}]
+    }
+
+    with patch('requests.get') as mock_get:
+        mock_get.return_value.json.return_value = response
+        profile = commute.get_commute_profile(
+            (51.5, -0.12), (51.45, -0.2), 'driving', days='weekdays',
+            start='07:00', end='08:00', step_minutes=30, now=now
+        )
+        assert mock_get.call_count == 15
+        assert 'departure_time' in mock_get.call_args.kwargs['params']
+        assert len(profile['slots']) == 15
+        assert profile['min'] == profile['median'] == profile['max'] == 1500
+
+        # The same window again is served entirely from the cache
+        profile = commute.get_commute_profile(
+            (51.5, -0.12), (51.45, -0.2), 'driving', days='weekdays',
+            start='07:00', end='08:00', step_minutes=30, now=now
+        )
+        assert mock_get.call_count == 15
+        assert profile['cached'] == 15
+
+        # Walking does not depend on the departure time, so it is fetched once
+        profile = commute.get_commute_profile(
+            (51.5, -0.12), (51.45, -0.2), 'walking', days='weekdays',
+            start='07:00', end='08:00', step_minutes=30, now=now
+        )
+        assert mock_get.call_count == 16
+        assert profile['max'] == 1500
+
+# Test comparison history reuse and aggregates
+def test_compare_locations_reuses_history(db_session):
+    from app.models import ComparisonHistory
+    from app.services.history import get_location_aggregates, get_recent_comparisons
+
+    user = User(email='test@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+    location = Location(name='Work', address='London', latitude=51.5074, longitude=-0.1278, user_id=user.id)
+    db_session.session.add(location)
+    db_session.session.commit()
+
+    response = {
+        'status': 'OK',
+        'rows': [{'elements': [{
+            'duration': {'text': '1 hour 5 mins', 'value': 3900},
+            'distance': {'text': '42.0 km', 'value': 42000},
+        }]}]
+    }
+    with patch('requests.get') as mock_get:
+        mock_get.return_value.json.return_value = response
+        _, first = compare_locations((51.7520, -1.2577), location.id, user.id, new_address='Oxford, UK',
+                                     new_query='oxford')
+        assert mock_get.call_count == 4
+
+        # Within ~11 m of the first comparison: served from history
+        _, second = compare_locations((51.75202, -1.25771), location.id, user.id)
+        assert mock_get.call_count == 4
+
+    assert first == second
+    assert second['driving'] == {'duration': '1 hour 5 mins', 'distance': '42.0 km'}
+    assert ComparisonHistory.query.count() == 1
+    assert ComparisonHistory.query.one().new_query == 'oxford'
+
+    aggregates = get_location_aggregates(user.id)
+    assert aggregates[0]['name'] == 'Work'
+    assert aggregates[0]['comparisons'] == 1
+    assert aggregates[0]['avg_transit'] == 3900
+
+    recent = get_recent_comparisons(user.id)
+    assert recent[0]['new_address'] == 'Oxford, UK'
+    assert recent[0]['visit'] == 1
+    assert recent[0]['location_avg_driving'] == 3900
+
+def test_format_duration_and_distance():
+    from app.services.travel import format_distance, format_duration
+
+    assert format_duration(45) == '1 min'
+    assert format_duration(1800) == '30 mins'
+    assert format_duration(3900) == '1 hour 5 mins'
+    assert format_duration(7200) == '2 hours'
+    assert format_distance(850) == '850 m'
+    assert format_distance(5200) == '5.2 km'
+
+# Test that a place is saved once per user and routed by its place ID
+def test_create_location_reuses_place_id(db_session):
+    from app.services.address import create_location_with_verified_address
+
+    user = User(email='place@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+
+    details = {
+        'status': 'OK',
+        'results': [{
+            'formatted_address': '10 Downing Street, London, UK',
+            'geometry': {'location': {'lat': 51.5034, 'lng': -0.1276}},
+            'place_id': 'p-downing',
+        }]
+    }
+    with patch.dict('os.environ', {'GOOGLE_API_KEY': 'test-key'}), patch('requests.get') as mock_get:
+        mock_get.return_value.json.return_value = details
+        ok, first = create_location_with_verified_address(user.id, 'Work', '10 Downing St')
+        ok_again, second = create_location_with_verified_address(user.id, 'Office', '10 downing street')
+        calls = mock_get.call_count
+        ok_known, third = create_location_with_verified_address(user.id, 'Work', '', place_id='p-downing')
+
+        assert ok and ok_again and ok_known
+        assert first.id == second.id == third.id
+        assert first.place_id == 'p-downing'
+        assert mock_get.call_count == calls  # Known place ID: no lookup
+        assert Location.query.filter_by(user_id=user.id).count() == 1
+
+        mock_get.reset_mock()
+        mock_get.return_value.json.return_value = {
+            'status': 'OK',
+            'rows': [{'elements': [{'status': 'OK', 'duration': {'text': '5 mins', 'value': 300},
+                                    'distance': {'text': '1 km', 'value': 1000}}]}]
+        }
+        get_travel_times((51.5, -0.12), (first.latitude, first.longitude), destination_place_id=first.place_id)
+        assert mock_get.call_args.kwargs['params']['destinations'] == 'place_id:p-downing'
+
+# Test the cache warm-up against the local Maps stand-in
+def test_warm_cache_with_standin(db_session, maps_standin):
+    from datetime import datetime, timedelta
+    from app.models import ComparisonHistory
+    from app.services.address import verify_address
+    from app.services.warmup import warm_cache
+
+    user = User(email='warm@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+    location = Location(name='Work', address='London', latitude=51.5074, longitude=-0.1278, user_id=user.id)
+    db_session.session.add(location)
+    db_session.session.commit()
+    for lat_q, address, typed in ((514000, 'Elm Road, London', 'elm rd london'),
+                                  (514000, 'Elm Road, London', 'Elm Rd  London'),
+                                  (515500, 'Oak Street, London', 'oak street')):
+        db_session.session.add(ComparisonHistory(user_id=user.id, saved_location_id=location.id,
+                                                 new_address=address, new_query=typed, new_lat_q=lat_q,
+                                                 new_lng_q=-1000, created_date=datetime.utcnow() - timedelta(days=1)))
+    db_session.session.commit()
+
+    # Two typed addresses (one with a spacing variant) and the most compared pair fit a budget of 6 requests
+    report = warm_cache(budget=6, workers=2)
+    assert report['candidates'] == 4
+    assert report['requests'] == 6 and maps_standin.call_count == 6
+    assert report['over_budget'] == 1
+    assert report['after'] == {'geocode': {'cached': 2, 'total': 2}, 'travel': {'cached': 4, 'total': 8}}
+
+    # A second run resumes past the candidates done, even those it would otherwise refresh
+    report = warm_cache(budget=6, workers=2, margin=10 ** 9)
+    assert report['resumed'] == 3 and report['planned'] == 1 and report['requests'] == 4
+    assert report['after']['travel'] == {'cached': 8, 'total': 8}
+
+    # Once every candidate is done, the next run starts over and finds them cached
+    report = warm_cache(budget=6, workers=2)
+    assert report['resumed'] == 0 and report['planned'] == 0
+
+    # Typed addresses and comparisons are now answered without Google
+    maps_standin.reset_mock()
+    is_valid, details = verify_address('ELM RD london')
+    assert is_valid and details['types'] == ['cache']
+    _, results = compare_locations((51.40001, -0.1), location.id, user.id)
+    assert not maps_standin.called
+    assert results['walking']['duration'] != 'Unavailable'
+
+# Test the usage ledger aggregates in memory and enforces budgets
+def test_usage_ledger_batches_and_enforces_budget(db_session):
+    from app.models import ApiUsage
+    from app.services import usage
+    from app.services.maps import maps_get
+
+    usage._pending_requests.clear()
+    usage._pending_elements.clear()
+    usage._used_today.clear()
+    usage._budgets.clear()
+    user = User(email='ledger@example.com')
+    user.set_password('password')
+    db_session.session.add(user)
+    db_session.session.commit()
+
+    with patch('requests.get') as mock_get, usage.usage_user(user.id):
+        mock_get.return_value.json.return_value = {'status': 'OK', 'rows': []}
+        for _ in range(3):
+            maps_get('distancematrix/json', {'origins': '1,2', 'destinations': '3,4|5,6', 'mode': 'driving'})
+        maps_get('geocode/json', {'address': 'Somewhere'})
+
+        # Nothing is written until the batch is flushed, then once per key
+        assert ApiUsage.query.count() == 0
+        assert usage.flush_usage() == 2
+        rows = {row.endpoint: row for row in ApiUsage.query.filter_by(user_id=user.id)}
+        assert rows['distancematrix'].requests == 3 and rows['distancematrix'].elements == 6
+        assert rows['distancematrix'].mode == 'driving'
+        assert rows['geocode'].requests == 1
+
+        usage.set_user_budget(user.id, 5)
+        maps_get('geocode/json', {'address': 'Elsewhere'})
+        with pytest.raises(usage.UsageBudgetExceeded):
+            maps_get('geocode/json', {'address': 'Too far'})
+        assert mock_get.call_count == 5
+
+    report = usage.get_usage_report()
+    entry = next(row for row in report if row['user_id'] == user.id)
+    assert entry['requests'] == 5 and entry['today'] == 5 and entry['budget'] == 5
+    assert entry['endpoints']['distancematrix (driving)'] == 3
+
+ROAD_NETWORK_OSM = """<?xml version="1.0"?>
+<osm version="0.6">
+  <node id="1" lat="51.5000" lon="-0.1000"/>
+  <node id="2" lat="51.5000" lon="-0.0950"/>
+  <node id="3" lat="51.5000" lon="-0.0900"/>
+  <node id="4" lat="51.5050" lon="-0.0900"/>
+  <node id="5" lat="51.5050" lon="-0.1000"><tag k="amenity" v="bench"/></node>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+  <way id="11"><nd ref="3"/><nd ref="4"/><tag k="highway" v="residential"/><tag k="oneway" v="yes"/></way>
+  <way id="12"><nd ref="4"/><nd ref="5"/><tag k="highway" v="footway"/></way>
+  <way id="13"><nd ref="5"/><nd ref="1"/><tag k="highway" v="residential"/><tag k="access" v="private"/></way>
+</osm>
+"""
+
+# Test the offline road graph
+def test_road_graph_routes_by_mode(tmp_path):
+    from app.services.roads import RoadGraph, build_road_graph
+
+    (tmp_path / 'roads.osm').write_text(ROAD_NETWORK_OSM)
+    stats = build_road_graph(str(tmp_path / 'roads.osm'), str(tmp_path / 'roads.nwrg'))
+    # Node 2 lies inside a way and is merged away; the private road is unusable
+    assert stats == {'nodes': 4, 'edges': {'driving': 3, 'walking': 6, 'bicycling': 3}}
+
+    graph = RoadGraph(str(tmp_path / 'roads.nwrg'))
+    try:
+        start, corner, end = (51.5, -0.1), (51.5, -0.09), (51.505, -0.09)
+        driving = graph.route('driving', start, end)
+        assert 1200 < driving['meters'] < 1300
+        # One-way for cars, both ways on foot
+        assert graph.route('driving', end, corner) is None
+        assert graph.route('walking', end, corner)['meters'] == graph.route('walking', corner, end)['meters']
+        # The footway is walkable; cars start from the nearest road instead
+        assert graph.route('walking', (51.505, -0.1), end)['meters'] < 800
+        assert graph.route('driving', (51.505, -0.1), end)['meters'] > 1500
+
+        matrix = graph.matrix('driving', [start, end], [end, corner])
+        assert matrix[0][0] == driving
+        assert matrix[1] == [{'seconds': 0, 'meters': 0}, None]
+    finally:
+        graph.close()
+
+def test_travel_times_fall_back_to_road_graph(app, tmp_path):
+    import requests
+    from app.services.roads import build_road_graph, load_road_graph
+
+    (tmp_path / 'roads.osm').write_text(ROAD_NETWORK_OSM)
+    build_road_graph(str(tmp_path / 'roads.osm'), str(tmp_path / 'roads.nwrg'))
+    load_road_graph(str(tmp_path / 'roads.nwrg'))
+    try:
+        app.config['TRAVEL_PROVIDER'] = app.config['TRANSIT_PROVIDER'] = 'auto'
+        with patch('requests.get', side_effect=requests.ConnectionError) as mock_get:
+            results = get_travel_times((51.5, -0.1), (51.505, -0.09), include_values=True)
+            assert mock_get.call_count == 4
+        assert results['driving']['provider'] == 'local'
+        assert results['driving']['distance'] == '1.2 km'
+        # No transit network is loaded
+        assert results['transit']['duration'] == 'API error'
+
+        app.config['TRAVEL_PROVIDER'] = app.config['TRANSIT_PROVIDER'] = 'local'
+        with patch('requests.get') as mock_get:
+            results = get_travel_times((51.5, -0.1), (51.505, -0.09))
+            assert not mock_get.called
+        assert results['walking']['duration'] != 'Unavailable'
+        assert results['transit']['duration'] == 'Unavailable'
+    finally:
+        load_road_graph(None)
+
+def _write_gtfs(path):
+    import zipfile
+
+    with zipfile.ZipFile(path, 'w') as feed:
+        feed.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon,location_type\n'
+                      'STN,Station,51.5001,-0.0800,1\n'
+                      'A,A,51.5000,-0.1000,0\nB,B,51.5000,-0.0800,0\n'
+                      'C,C,51.5200,-0.0800,0\nD,D,51.5002,-0.0801,0\n')
+        feed.writestr('trips.txt', 'route_id,service_id,trip_id\n'
+                      'R1,WK,1a\nR1,WK,1b\nR2,WK,2a\nR2,WK,2b\nR2,WK,2c\n')
+        feed.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+                      '1a,08:00:00,08:00:00,A,1\n1a,08:10:00,08:10:00,B,2\n'
+                      '1b,08:30:00,08:30:00,A,1\n1b,08:40:00,08:40:00,B,2\n'
+                      '2a,08:05:00,08:05:00,D,1\n2a,08:15:00,08:15:00,C,2\n'
+                      '2b,08:15:00,08:15:00,D,1\n2b,08:25:00,08:25:00,C,2\n'
+                      '2c,08:45:00,08:45:00,D,1\n2c,08:55:00,08:55:00,C,2\n')
+        feed.writestr('calendar.txt', 'service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,'
+                      'start_date,end_date\nWK,1,1,1,1,1,0,0,20260101,20271231\n')
+        feed.writestr('calendar_dates.txt', 'service_id,date,exception_type\nWK,20261021,2\n')
+
+# Test the offline transit network
+def test_transit_network_raptor(tmp_path):
+    from datetime import datetime
+    from app.services.transit import TransitNetwork, build_transit_network
+
+    _write_gtfs(tmp_path / 'feed.zip')
+    stats = build_transit_network(str(tmp_path / 'feed.zip'), str(tmp_path / 'feed.nwtr'))
+    assert (stats['stops'], stats['patterns'], stats['trips']) == (4, 2, 5)
+
+    network = TransitNetwork(str(tmp_path / 'feed.nwtr'))
+    try:
+        a, b, c = (51.5, -0.1), (51.5, -0.08), (51.52, -0.08)
+        # Line 1 to B, a short walk to D, then the 08:15 on line 2
+        monday = network.one_to_many(a, [b, c], datetime(2026, 10, 19, 7, 55))
+        assert monday == [{'seconds': 15 * 60, 'walk_meters': 0}, {'seconds': 30 * 60, 'walk_meters': 0}]
+        # Not on the removed date, nor at weekends
+        assert network.route(a, c, datetime(2026, 10, 21, 7, 55)) is None
+        assert network.route(a, c, datetime(2026, 10, 24, 7, 55)) is None
+        assert network.route(a, c, datetime(2026, 10, 19, 8, 50)) is None
+    finally:
+        network.close()
+
+def test_transit_transfers_at_high_latitude(tmp_path):
+    """
+    Test that footpaths are found between stops two narrow grid cells apart.
+    """
+    import zipfile
+    from app.services.transit import build_transit_network
+
+    # About 280 m apart at 70 degrees north, where a cell is about 190 m wide
+    with zipfile.ZipFile(tmp_path / 'north.zip', 'w') as feed:
+        feed.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon\nX,X,70.0,20.0049\nY,Y,70.0,20.0123\n')
+        feed.writestr('trips.txt', 'route_id,service_id,trip_id\nR1,WK,1a\n')
+        feed.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+                      '1a,08:00:00,08:00:00,X,1\n1a,08:05:00,08:05:00,Y,2\n')
+        feed.writestr('calendar.txt', 'service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,'
+                      'start_date,end_date\nWK,1,1,1,1,1,0,0,20260101,20271231\n')
+    stats = build_transit_network(str(tmp_path / 'north.zip'), str(tmp_path / 'north.nwtr'))
+    assert stats['transfers'] == 2
+
+def test_transit_boards_previous_day_trips(tmp_path):
+    """
+    Test that trips running past midnight are boarded on the next calendar day.
+    """
+    import zipfile
+    from datetime import datetime
+    from app.services.transit import TransitNetwork, build_transit_network
+
+    with zipfile.ZipFile(tmp_path / 'night.zip', 'w') as feed:
+        feed.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon\nA,A,51.5,-0.1\nB,B,51.6,-0.1\n')
+        feed.writestr('trips.txt', 'route_id,service_id,trip_id\nN1,WK,n1\n')
+        feed.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+                      'n1,24:30:00,24:30:00,A,1\nn1,24:50:00,24:50:00,B,2\n')
+        feed.writestr('calendar.txt', 'service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,'
+                      'start_date,end_date\nWK,1,1,1,1,1,0,0,20260101,20271231\n')
+    build_transit_network(str(tmp_path / 'night.zip'), str(tmp_path / 'night.nwtr'))
+    network = TransitNetwork(str(tmp_path / 'night.nwtr'))
+    try:
+        # Early Tuesday rides Monday's trip; early Sunday has no Saturday service
+        assert network.route((51.5, -0.1), (51.6, -0.1), datetime(2026, 10, 20, 0, 20)) == \
+            {'seconds': 1800, 'walk_meters': 0}
+        assert network.route((51.5, -0.1), (51.6, -0.1), datetime(2026, 10, 25, 0, 20)) is None
+    finally:
+        network.close()
+
+def test_transit_walks_from_access_stops_before_boarding(tmp_path):
+    """
+    Test that footpaths from the access stops are relaxed before the first trip.
+    """
+    import zipfile
+    from datetime import datetime
+    from app.services.transit import TransitNetwork, build_transit_network
+
+    # Q is beyond the access radius of P, but the feed links them
+    with zipfile.ZipFile(tmp_path / 'walk.zip', 'w') as feed:
+        feed.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon\n'
+                      'P,P,51.5,-0.1\nQ,Q,51.5,-0.08\nR,R,51.6,-0.08\n')
+        feed.writestr('transfers.txt', 'from_stop_id,to_stop_id,transfer_type,min_transfer_time\nP,Q,2,120\n')
+        feed.writestr('trips.txt', 'route_id,service_id,trip_id\nR1,WK,1a\n')
+        feed.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+                      '1a,08:00:00,08:00:00,Q,1\n1a,08:20:00,08:20:00,R,2\n')
+        feed.writestr('calendar.txt', 'service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,'
+                      'start_date,end_date\nWK,1,1,1,1,1,0,0,20260101,20271231\n')
+    build_transit_network(str(tmp_path / 'walk.zip'), str(tmp_path / 'walk.nwtr'))
+    network = TransitNetwork(str(tmp_path / 'walk.nwtr'))
+    try:
+        assert network.route((51.5, -0.1), (51.6, -0.08), datetime(2026, 10, 19, 7, 50)) == \
+            {'seconds': 1800, 'walk_meters': 0}
+    finally:
+        network.close()
+
+def test_rank_locations_by_transit(app, db_session, tmp_path):
+    from datetime import datetime
+    from app.services.transit import build_transit_network, load_transit_network
+    from app.services.travel import rank_locations_by_transit
+
+    user = User(email='transit@example.com')
+    user.set_password('password')
+    db_session.session.add(user)
+    db_session.session.flush()
+    for name, lat, lng in (('Far', 51.52, -0.08), ('Near', 51.5, -0.08), ('Nowhere', 48.85, 2.35)):
+        db_session.session.add(Location(name=name, address=name, latitude=lat, longitude=lng, user_id=user.id))
+    db_session.session.commit()
+
+    _write_gtfs(tmp_path / 'feed.zip')
+    build_transit_network(str(tmp_path / 'feed.zip'), str(tmp_path / 'feed.nwtr'))
+    load_transit_network(str(tmp_path / 'feed.nwtr'))
+    try:
+        ranking = rank_locations_by_transit(user.id, (51.5, -0.1), datetime(2026, 10, 19, 7, 55))
+        assert [entry['name'] for entry in ranking] == ['Near', 'Far', 'Nowhere']
+        assert ranking[1]['duration'] == '30 mins' and ranking[2]['seconds'] is None
+
+        app.config['TRANSIT_PROVIDER'] = 'local'
+        with patch('requests.get') as mock_get:
+            results = get_travel_times((51.5, -0.1), (51.52, -0.08), modes=['transit'])
+            assert not mock_get.called
+        assert results['transit']['provider'] == 'local'
+    finally:
+        load_transit_network(None)
+
+# Test that reverse geocoding prefers saved locations and earlier results over Google
+def test_reverse_geocode_cells(db_session, maps_standin):
+    from app.services import reverse_geocode as reverse
+
+    reverse._cell_cache.clear()
+    reverse._saved_cache.clear()
+
+    user = User(email='reverse@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+    db_session.session.add(Location(name='Home', address='1 Home Road', latitude=51.5, longitude=-0.12, user_id=user.id))
+    db_session.session.commit()
+
+    found, details = reverse.reverse_geocode(51.50005, -0.12005, user_id=user.id)
+    assert found and details['types'] == ['saved'] and details['name'] == 'Home'
+    assert details['distance_m'] < 10 and not maps_standin.called
+
+    # Away from saved locations Google is asked once, then nearby clicks are served locally
+    found, first = reverse.reverse_geocode(51.52001, -0.1, user_id=user.id)
+    assert found and first['formatted_address'] == 'Place at 51.52, -0.1'
+    assert maps_standin.call_count == 1
+    found, second = reverse.reverse_geocode(51.52008, -0.10006, user_id=user.id)
+    assert found and second['types'] == ['cache'] and second['formatted_address'] == first['formatted_address']
+    assert maps_standin.call_count == 1
+
+    # Other workers find it in the geocode cache table
+    reverse._cell_cache.clear()
+    found, third = reverse.reverse_geocode(51.51998, -0.09998)
+    assert found and third['types'] == ['cache'] and maps_standin.call_count == 1
+
+    # A result far from the click is remembered at the click too
+    far = {'status': 'OK', 'results': [{'formatted_address': '1 Far Lane', 'place_id': 'far',
+                                        'geometry': {'location': {'lat': 51.532, 'lng': -0.08}}}]}
+    with patch('app.services.reverse_geocode.maps_get', return_value=far) as mock_maps:
+        found, first = reverse.reverse_geocode(51.53, -0.08)
+        assert found and first['formatted_address'] == '1 Far Lane' and first['distance_m'] > 200
+        found, again = reverse.reverse_geocode(51.53005, -0.08005)
+        assert found and again['types'] == ['cache'] and again['formatted_address'] == '1 Far Lane'
+        assert again['distance_m'] > 25 and mock_maps.call_count == 1
+
+        # Other workers, or this one once the memory entry expires, read it by the clicked point
+        reverse._cell_cache.clear()
+        found, stored = reverse.reverse_geocode(51.53003, -0.07996)
+        assert found and stored['formatted_address'] == '1 Far Lane' and mock_maps.call_count == 1
+
+    # Deleting the saved location removes it from the in-memory cells
+    db_session.session.delete(Location.query.filter_by(user_id=user.id).one())
+    db_session.session.commit()
+    found, details = reverse.reverse_geocode(51.50005, -0.12005, user_id=user.id)
+    assert found and details['types'] != ['saved'] and maps_standin.call_count == 2
+
+    with pytest.raises(ValueError):
+        reverse.reverse_geocode(91, 0)
+
+# Test that the trip solvers find the best visiting order
+def test_trip_solvers():
+    import itertools
+    import random
+    from app.services.trips import _route_cost, solve_exact, solve_heuristic
+
+    rng = random.Random(3)
+    for n, round_trip in ((6, False), (7, True)):
+        cost = [[0 if i == j else rng.randint(60, 3600) for j in range(n)] for i in range(n)]
+        best = min(_route_cost(cost, [0, *order], round_trip) for order in itertools.permutations(range(1, n)))
+        route = solve_exact(cost, round_trip)
+        assert route[0] == 0 and _route_cost(cost, route, round_trip) == best
+        heuristic, converged = solve_heuristic(cost, round_trip)
+        assert converged and sorted(heuristic) == list(range(n))
+
+    # Stops on a line are visited in order, whatever order they were given in
+    cost = [[abs(a - b) for b in (0, 5, 2, 9, 1, 7, 3, 8, 6, 4, 12, 10, 11, 13, 14)]
+            for a in (0, 5, 2, 9, 1, 7, 3, 8, 6, 4, 12, 10, 11, 13, 14)]
+    route, converged = solve_heuristic(cost)
+    assert converged and _route_cost(cost, route, False) == 14
+
+# Test that trips batch and cache their travel matrix
+def test_plan_trip_with_standin(db_session, maps_standin):
+    from app.services.trips import plan_trip
+
+    user = User(email='trip@example.com')
+    user.set_password('password123')
+    db_session.session.add(user)
+    db_session.session.commit()
+    # Shuffled points along a line heading east
+    locations = [Location(name=f'Stop {x}', address=f'{x} East Road', latitude=51.5, longitude=-0.2 + x * 0.01,
+                          user_id=user.id) for x in (0, 3, 1, 4, 2, 11, 7, 13, 5, 9, 6, 14, 10, 8, 12)]
+    db_session.session.add_all(locations)
+    db_session.session.commit()
+    ids = [location.id for location in locations]
+
+    plan = plan_trip(user.id, ids[:5], mode='driving')
+    assert plan['method'] == 'exact' and plan['requests'] == 1 and plan['fetched'] == 20
+    assert [stop['name'] for stop in plan['stops']] == ['Stop 0', 'Stop 1', 'Stop 2', 'Stop 3', 'Stop 4']
+    assert len(plan['legs']) == 4 and plan['total_seconds'] == sum(leg['seconds'] for leg in plan['legs'])
+
+    # The matrix is reused from the cache, and a round trip adds the leg home
+    plan = plan_trip(user.id, ids[:5], mode='driving', round_trip=True)
+    assert plan['requests'] == 0 and plan['cached'] == 20 and maps_standin.call_count == 1
+    assert plan['legs'][-1]['to_id'] == ids[0]
+
+    # 15 stops take four 10 x 10 requests and are ordered heuristically
+    plan = plan_trip(user.id, ids, mode='walking')
+    assert plan['method'] == 'heuristic' and plan['requests'] == 4 and plan['fetched'] == 210
+    assert [stop['name'] for stop in plan['stops']] == [f'Stop {x}' for x in range(15)]
+
+    with pytest.raises(ValueError):
+        plan_trip(user.id, ids[:1])
+    with pytest.raises(ValueError):
+        plan_trip(user.id, ids[:3], mode='flying')